@@ -1,6 +1,6 @@
 from networks.base_network import Network
 
-import numpy as np
+import torch as th
 
 
 class Agent(Network):
@@ -13,11 +13,41 @@ class Agent(Network):
     def get_action(self, state):
         return NotImplementedError
 
+    def sample_action(self, probabilities):
+        """Samples an action on the device probabilities are on."""
+        return th.multinomial(probabilities.reshape(-1), 1).item()
+
     def suppress_unconfident_termination(self, state, action, probabilities):
-        if self.context.voluntary_termination and probabilities[self.context.use_action] \
-                < self.termination_confidence_threshhold:
-            while self.context.termination_helper.terminated(state, action):
-                action = np.random.choice(self.actions, p=probabilities)
-                print('Tried to terminate_episode, but only had a confidence of',
-                      probabilities[self.context.use_action])
+        """
+        Resamples a terminating action that is below the confidence threshhold.
+
+        Resampling until the episode is not terminated is the same as sampling with the
+        probability of the use action set to zero, which is done in one draw.
+        """
+        if not (self.context.voluntary_termination and action == self.context.use_action):
+            return action
+        probabilities = probabilities.reshape(-1)
+        confidence = probabilities[self.context.use_action].item()
+        if confidence < self.termination_confidence_threshhold \
+                and self.context.termination_helper.terminated(state, action):
+            print('Tried to terminate_episode, but only had a confidence of', confidence)
+            probabilities = probabilities.clone()
+            probabilities[self.context.use_action] = 0
+            action = self.sample_action(probabilities)
         return action
+
+    def suppress_unconfident_terminations(self, states, actions, probabilities):
+        """Batched suppress_unconfident_termination, for a batch of single states."""
+        if not self.context.voluntary_termination:
+            return actions
+        nonspatial = states.nonspatial.reshape(actions.size()[0], -1)
+        terminating = self.context.termination_helper.threw_snowball_tensor(
+            (states.spatial, nonspatial), actions, device=actions.device).reshape(-1)
+        unconfident = probabilities[:, self.context.use_action] \
+            < self.termination_confidence_threshhold
+        resample = terminating.bool() & unconfident
+        if resample.any():
+            resample_probabilities = probabilities[resample].clone()
+            resample_probabilities[:, self.context.use_action] = 0
+            actions[resample] = th.multinomial(resample_probabilities, 1).squeeze(1)
+        return actions
@@ -1,6 +1,5 @@
 from agents.base import Agent
 
-import numpy as np
 import torch as th
 import torch.nn.functional as F
 
@@ -16,7 +15,8 @@ class BCAgent(Agent):
 
     def get_action(self, state):
         with th.no_grad():
-            probabilities = self.action_probabilities(state).cpu().numpy().squeeze()
-        action = np.random.choice(self.actions, p=probabilities)
-        action = self.suppress_unconfident_termination(state, action, probabilities)
-        return action
+            probabilities, hidden = self.action_probabilities(state)
+            action = self.sample_action(probabilities)
+            action = self.suppress_unconfident_termination(state, action, probabilities)
+        hidden = hidden.squeeze()
+        return action, hidden
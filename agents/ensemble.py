@@ -0,0 +1,123 @@
+from agents.soft_q import SoftQAgent
+
+import torch as th
+from torch.func import stack_module_state
+
+
+def member_settings(config):
+    """The seed, alpha and learning rate of each ensemble member."""
+    size = config.ensemble_size
+    seeds = config.ensemble_seeds or [config.seed + member for member in range(size)]
+    alphas = config.ensemble_alphas or [config.method.alpha] * size
+    learning_rates = config.ensemble_learning_rates \
+        or [config.method.learning_rate] * size
+    for name, settings in [('seeds', seeds), ('alphas', alphas),
+                           ('learning_rates', learning_rates)]:
+        if len(settings) != size:
+            raise ValueError(f'ensemble_{name} has {len(settings)} values,'
+                             f' for {size} ensemble members')
+    return list(seeds), [float(alpha) for alpha in alphas], \
+        [float(learning_rate) for learning_rate in learning_rates]
+
+
+def replace_tensor(module, name, tensor):
+    """Replaces a module's parameter or buffer with a tensor, in place."""
+    *path, attribute = name.split('.')
+    module = module.get_submodule('.'.join(path))
+    if attribute in module._parameters:
+        module._parameters[attribute] = tensor
+    else:
+        module._buffers[attribute] = tensor
+
+
+class SoftQEnsemble:
+    """
+    SoftQAgents with their parameters stacked, to be trained in lockstep with vmap.
+
+    Each of the config.ensemble_size members is initialized from its own seed, and
+    has its own alpha and learning rate, set with ensemble_seeds, ensemble_alphas and
+    ensemble_learning_rates. The members' parameters and buffers are views into the
+    stacked tensors, so each member always acts with its latest parameters.
+
+    Only feedforward SoftQAgents with a fixed alpha can be ensembled.
+    """
+    def __init__(self, config):
+        if config.method.loss_function != 'iqlearn':
+            raise ValueError('Only iqlearn agents can be trained as an ensemble')
+        if config.model.lstm_layers > 0:
+            raise ValueError('Ensembles of agents with an LSTM are not supported')
+        if config.method.get('entropy_tuning') or config.method.get('decay_alpha'):
+            raise ValueError('Ensemble members keep fixed alphas,'
+                             ' set method.entropy_tuning and method.decay_alpha false')
+        seeds, self.alphas, self.learning_rates = member_settings(config)
+        self.members = []
+        for seed, alpha in zip(seeds, self.alphas):
+            th.manual_seed(seed)
+            member = SoftQAgent(config)
+            member.alpha = alpha
+            self.members.append(member)
+        self.stacked_parameters, self.stacked_buffers = \
+            stack_module_state(self.members)
+        for idx, member in enumerate(self.members):
+            for name, tensor in [*self.stacked_parameters.items(),
+                                 *self.stacked_buffers.items()]:
+                replace_tensor(member, name, tensor[idx])
+
+    def __len__(self):
+        return len(self.members)
+
+    def parameters(self):
+        return list(self.stacked_parameters.values())
+
+    def optimizer(self, lr):
+        return EnsembleAdamW(self.parameters(), lr=lr,
+                             member_learning_rates=self.learning_rates)
+
+    def state_dict(self):
+        return {'parameters': self.stacked_parameters, 'buffers': self.stacked_buffers}
+
+    def load_state_dict(self, state_dict):
+        """Copies into the stacked tensors in place, so the members see the change."""
+        with th.no_grad():
+            for kind in ['parameters', 'buffers']:
+                stacked = getattr(self, f'stacked_{kind}')
+                for name, tensor in state_dict[kind].items():
+                    stacked[name].copy_(tensor)
+
+    def save(self, path):
+        """Saves a list with the state dict of each member, as SoftQAgent.save would."""
+        state_dicts = []
+        for member in self.members:
+            state_dict = {name: tensor.detach().clone()
+                          for name, tensor in member.state_dict().items()}
+            state_dict['alpha'] = member.alpha
+            state_dicts.append(state_dict)
+        th.save(state_dicts, path)
+
+
+class EnsembleAdamW(th.optim.AdamW):
+    """
+    AdamW over stacked ensemble parameters, with a learning rate for each member.
+
+    AdamW's update is proportional to the learning rate, so each member's update is
+    scaled by the ratio of its learning rate to the optimizer's. The optimizer's
+    learning rate can still be changed by a scheduler, scaling every member's.
+    """
+    def __init__(self, params, lr, member_learning_rates, **kwargs):
+        super().__init__(params, lr=lr, **kwargs)
+        self.member_scales = th.tensor(member_learning_rates) / lr
+        self.scale_updates = not th.all(self.member_scales == 1).item()
+
+    @th.no_grad()
+    def step(self, closure=None):
+        if not self.scale_updates:
+            return super().step(closure)
+        parameters = [parameter for group in self.param_groups
+                      for parameter in group['params'] if parameter.grad is not None]
+        previous_parameters = [parameter.clone() for parameter in parameters]
+        loss = super().step(closure)
+        for parameter, previous_parameter in zip(parameters, previous_parameters):
+            scales = self.member_scales.to(parameter.device, parameter.dtype).reshape(
+                -1, *[1] * (parameter.dim() - 1))
+            parameter.copy_(th.lerp(previous_parameter, parameter, scales))
+        return loss
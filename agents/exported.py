@@ -0,0 +1,131 @@
+from contexts.minerl.environment import MineRLContext
+from core.gpu import GPULoader
+from core.state import State
+
+from omegaconf import OmegaConf
+import torch as th
+from torch import nn
+
+
+class ExportablePolicy(nn.Module):
+    """
+    Maps a state as it comes from the environment to action probabilities.
+
+    The normalization GPULoader applies when acting is part of the module, so the
+    traced graph takes the raw uint8 frames and nonspatial counts of a single state,
+    and returns the action probabilities and the next hidden state.
+    """
+    def __init__(self, agent, config):
+        super().__init__()
+        self.agent = agent
+        gpu_loader = GPULoader(config, device=agent.device)
+        self.load_sequences = gpu_loader.load_sequences
+        self.normalize_obs = gpu_loader.normalize_obs
+        spatial_scale, spatial_shift = gpu_loader.spatial_scale_shift
+        self.register_buffer('spatial_scale', spatial_scale)
+        self.register_buffer('spatial_shift', spatial_shift)
+        self.register_buffer('nonspatial_normalization',
+                             gpu_loader.nonspatial_normalization)
+
+    def forward(self, spatial, nonspatial, hidden):
+        spatial = spatial.unsqueeze(0).float()
+        if self.normalize_obs:
+            spatial = spatial * self.spatial_scale + self.spatial_shift
+        else:
+            spatial = spatial / 255.0
+        nonspatial = nonspatial.reshape(1, -1).float() / self.nonspatial_normalization
+        state = [spatial, nonspatial, hidden.reshape(1, -1).float()]
+        if self.load_sequences:
+            state = [state_component.unsqueeze(1) for state_component in state]
+        Q, next_hidden = self.agent.get_Q(State(*state))
+        probabilities = self.agent.action_probabilities(Q).reshape(-1)
+        return probabilities, next_hidden.reshape(-1)
+
+
+def export_agent(agent, path, eval_mode=False):
+    """
+    Traces a SoftQAgent into a self-contained TorchScript file, with its config.
+
+    The graph is traced in the mode the agent is in. Agents act in training mode,
+    so by default dropout stays active as it is when acting eagerly. With eval_mode,
+    the graph is traced in eval mode and frozen.
+    """
+    config = agent.config
+    context = MineRLContext(config)
+    policy = ExportablePolicy(agent, config)
+    was_training = agent.training
+    policy.train(not eval_mode and was_training)
+    example_inputs = (
+        th.zeros((3 * config.model.n_observation_frames, *context.frame_shape[1:]),
+                 dtype=th.uint8, device=agent.device),
+        th.zeros(context.nonspatial_size, device=agent.device),
+        context.initial_hidden.to(agent.device))
+    with th.no_grad():
+        traced_policy = th.jit.trace(policy, example_inputs, check_trace=False)
+    if not policy.training:
+        traced_policy = th.jit.freeze(traced_policy)
+    agent.train(was_training)
+    th.jit.save(traced_policy, str(path),
+                _extra_files={'config.yaml': OmegaConf.to_yaml(config)})
+    print(f'Exported agent to {path}')
+    return path
+
+
+class ExportedAgent:
+    """
+    Acts with a policy saved by export_agent, in place of an agent.
+
+    Loading doesn't construct the network, so no pretrained weights are fetched, and
+    a few warm up passes run at load time so the first step isn't slower than the
+    rest. Takes states as they come from the environment, and keeps the hidden state
+    on the device between steps until reset_hidden is called.
+    """
+    raw_state_input = True
+
+    def __init__(self, path, warmup_passes=3):
+        self.device = th.device("cuda:0" if th.cuda.is_available() else "cpu")
+        extra_files = {'config.yaml': ''}
+        self.policy = th.jit.load(str(path), map_location=self.device,
+                                  _extra_files=extra_files)
+        self.config = OmegaConf.create(extra_files['config.yaml'].decode())
+        self.config.device = str(self.device)
+        self.context = MineRLContext(self.config)
+        self.termination_confidence_threshhold \
+            = self.config.context.termination_confidence_threshhold \
+            if 'termination_confidence_threshhold' in self.config.context.keys() else 0
+        self.hidden = None
+        self.warmup(warmup_passes)
+
+    def warmup(self, passes):
+        spatial = th.zeros((3 * self.config.model.n_observation_frames,
+                            *self.context.frame_shape[1:]), dtype=th.uint8)
+        state = State(spatial, th.zeros(self.context.nonspatial_size),
+                      self.context.initial_hidden)
+        for _ in range(passes):
+            self.get_probabilities(state)
+        self.reset_hidden()
+
+    def reset_hidden(self):
+        self.hidden = None
+
+    def get_probabilities(self, state):
+        hidden = state.hidden if self.hidden is None else self.hidden
+        with th.no_grad():
+            probabilities, next_hidden = self.policy(
+                state.spatial.to(self.device), state.nonspatial.to(self.device),
+                hidden.to(self.device))
+        if self.config.model.lstm_layers > 0:
+            self.hidden = next_hidden
+        return probabilities, next_hidden
+
+    def get_action(self, state):
+        probabilities, next_hidden = self.get_probabilities(state)
+        action = th.multinomial(probabilities, 1).item()
+        if action == self.context.use_action \
+                and self.context.voluntary_termination \
+                and probabilities[action].item() < self.termination_confidence_threshhold \
+                and self.context.termination_helper.terminated(state, action):
+            probabilities = probabilities.clone()
+            probabilities[self.context.use_action] = 0
+            action = th.multinomial(probabilities, 1).item()
+        return action, next_hidden.cpu()
@@ -0,0 +1,113 @@
+from core.gpu import GPULoader
+
+import copy
+import io
+import random
+import time
+
+import numpy as np
+import torch as th
+from torch import nn
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+
+def calibration_states(expert_dataset, samples=512, seed=0):
+    """Picks single expert states, as they come from the environment, for calibration."""
+    rng = random.Random(seed)
+    step_indices = rng.sample(range(len(expert_dataset.step_lookup)),
+                              min(samples, len(expert_dataset.step_lookup)))
+    return [expert_dataset.trajectories[trajectory_idx].states[step_idx]
+            for trajectory_idx, step_idx in expert_dataset.step_lookup[step_indices]]
+
+
+def normalized_spatial(config, states):
+    gpu_loader = GPULoader(config, device=th.device('cpu'))
+    spatial = th.stack([state.spatial for state in states])
+    nonspatial = th.stack([state.nonspatial for state in states])
+    hidden = th.stack([state.hidden for state in states])
+    states, = gpu_loader.states_to_device(((spatial, nonspatial, hidden),))
+    return states.spatial
+
+
+def quantize_agent(agent, states, backend='fbgemm', batch_size=32):
+    """
+    Returns an int8 copy of an agent that runs on the cpu.
+
+    The conv trunk is quantized statically, with activation ranges calibrated by
+    running the given states through it. The linear head and the LSTM are quantized
+    dynamically. The copy is in eval mode, since the calibrated trunk has its batch
+    norms folded in.
+    """
+    th.backends.quantized.engine = backend
+    quantized_agent = copy.deepcopy(agent).cpu().eval()
+    quantized_agent.device = th.device('cpu')
+
+    calibration_spatial = normalized_spatial(agent.config, states)
+    feature_extractor = quantized_agent.visual_feature_extractor
+    prepared_cnn = prepare_fx(feature_extractor.cnn, get_default_qconfig_mapping(backend),
+                              example_inputs=(calibration_spatial[:1],))
+    with th.no_grad():
+        for spatial in calibration_spatial.split(batch_size):
+            prepared_cnn(spatial)
+    feature_extractor.cnn = convert_fx(prepared_cnn)
+
+    quantize_dynamic(quantized_agent, {nn.Linear, nn.LSTM}, dtype=th.qint8, inplace=True)
+    return quantized_agent
+
+
+def time_per_forward(agent, device_states):
+    with th.no_grad():
+        agent.get_Q(device_states[0])
+        start = time.perf_counter()
+        for device_state in device_states:
+            agent.get_Q(device_state)
+    return (time.perf_counter() - start) / len(device_states) * 1000
+
+
+def serialized_megabytes(module):
+    """The size of a module's saved state dict, in MB."""
+    buffer = io.BytesIO()
+    th.save(module.state_dict(), buffer)
+    return buffer.getbuffer().nbytes / 2**20
+
+
+def quantization_report(agent, quantized_agent, states):
+    """
+    Compares the action distributions, cpu latency and saved size of an agent and its
+    int8 copy.
+
+    Both are compared in eval mode, on single states, so latency is per acting step.
+    """
+    fp32_agent = copy.deepcopy(agent).cpu().eval()
+    fp32_agent.device = th.device('cpu')
+    gpu_loader = GPULoader(agent.config, device=th.device('cpu'))
+    device_states = [gpu_loader.state_to_device(state) for state in states]
+
+    total_variations = []
+    kl_divergences = []
+    agreements = []
+    with th.no_grad():
+        for device_state in device_states:
+            fp32_probabilities = fp32_agent.action_probabilities(
+                fp32_agent.get_Q(device_state)[0]).reshape(-1)
+            int8_probabilities = quantized_agent.action_probabilities(
+                quantized_agent.get_Q(device_state)[0]).reshape(-1)
+            total_variations.append(
+                0.5 * th.sum(th.abs(fp32_probabilities - int8_probabilities)).item())
+            kl_divergences.append(th.sum(fp32_probabilities * (
+                th.log(fp32_probabilities) - th.log(int8_probabilities))).item())
+            agreements.append(th.argmax(fp32_probabilities).item()
+                              == th.argmax(int8_probabilities).item())
+
+    fp32_ms = time_per_forward(fp32_agent, device_states)
+    int8_ms = time_per_forward(quantized_agent, device_states)
+    return {'Quantization/mean_total_variation': np.mean(total_variations),
+            'Quantization/max_total_variation': np.max(total_variations),
+            'Quantization/mean_kl_divergence': np.mean(kl_divergences),
+            'Quantization/greedy_action_agreement': np.mean(agreements),
+            'Quantization/fp32_ms_per_step': fp32_ms,
+            'Quantization/int8_ms_per_step': int8_ms,
+            'Quantization/speedup': fp32_ms / int8_ms,
+            'Quantization/fp32_mb': serialized_megabytes(fp32_agent),
+            'Quantization/int8_mb': serialized_megabytes(quantized_agent)}
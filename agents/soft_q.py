@@ -1,6 +1,5 @@
 from agents.base import Agent
 
-import numpy as np
 import torch as th
 from torch import nn
 import torch.nn.functional as F
@@ -20,15 +19,16 @@ class SoftQAgent(Agent):
         return Q_s_a, hidden
 
     def get_V(self, Qs):
-        v = self.alpha * th.logsumexp(Qs / self.alpha, dim=-1, keepdim=True)
+        # in fp32 even under autocast, since logsumexp overflows in half precision
+        v = self.alpha * th.logsumexp(Qs.float() / self.alpha, dim=-1, keepdim=True)
         return v
 
     def action_probabilities(self, Qs):
-        probabilities = F.softmax(Qs/self.alpha, dim=-1)
+        probabilities = F.softmax(Qs.float()/self.alpha, dim=-1)
         return probabilities
 
     def entropies(self, Qs):
-        entropies = -F.log_softmax(Qs/self.alpha, dim=-1)
+        entropies = -F.log_softmax(Qs.float()/self.alpha, dim=-1)
         return entropies
 
     def batch_entropy(self, Qs):
@@ -40,12 +40,22 @@ class SoftQAgent(Agent):
     def get_action(self, state):
         with th.no_grad():
             Q, hidden = self.get_Q(state)
-            probabilities = self.action_probabilities(Q).cpu().numpy().squeeze()
-        action = np.random.choice(self.actions, p=probabilities)
-        action = self.suppress_unconfident_termination(state, action, probabilities)
-        hidden = hidden.cpu().squeeze()
+            probabilities = self.action_probabilities(Q)
+            action = self.sample_action(probabilities)
+            action = self.suppress_unconfident_termination(state, action, probabilities)
+        hidden = hidden.squeeze()
         return action, hidden
 
+    def get_actions(self, states):
+        """Samples actions for a batch of single states, returning the next hiddens."""
+        with th.no_grad():
+            Q, hidden = self.get_Q(states)
+            probabilities = self.action_probabilities(Q).reshape(-1, len(self.actions))
+            actions = th.multinomial(probabilities, 1).squeeze(1)
+            actions = self.suppress_unconfident_terminations(states, actions,
+                                                             probabilities)
+        return actions, hidden
+
     def save(self, path):
         state_dict = self.state_dict()
         state_dict['alpha'] = self.alpha
@@ -31,10 +31,10 @@ class CuriousIQ(OnlineImitation):
         self.curiosity_optimizer.step()
         return metrics
 
-    def train_one_batch(self, batch, curiosity_only=False):
+    def train_one_batch(self, batch, curiosity_only=False, on_device=False):
+        if not on_device:
+            batch = self.batch_to_device(batch)
         (expert_batch, expert_idx), (replay_batch, replay_idx) = batch
-        expert_batch = self.gpu_loader.transitions_to_device(expert_batch)
-        replay_batch = self.gpu_loader.transitions_to_device(replay_batch)
         aug_expert_batch = self.augmentation(expert_batch)
         aug_replay_batch = self.augmentation(replay_batch)
 
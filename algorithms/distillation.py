@@ -0,0 +1,146 @@
+from agents.soft_q import SoftQAgent
+from core.algorithm import Algorithm
+from core.datasets import ReplayBuffer, SequenceReplayBuffer
+from core.state import State
+
+from omegaconf import OmegaConf
+import torch as th
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+
+
+def student_config(config):
+    """The config with the model attributes overridden by config.method.student."""
+    return OmegaConf.merge(config,
+                           {'model': OmegaConf.to_container(config.method.student)})
+
+
+class Distillation(Algorithm):
+    """
+    Trains a smaller student agent to match the action distribution of a teacher.
+
+    The student is a SoftQAgent built from student_config, trained on the states of
+    the expert trajectories and of any given replay buffers. The teacher is run
+    over every frame once before training, in batches, and its action
+    probabilities are cached, so each training step only runs the student.
+    """
+    def __init__(self, expert_dataset, teacher, config, replay_buffers=()):
+        super().__init__(config)
+        self.lr = config.method.learning_rate
+        self.epochs = config.method.epochs
+        self.batch_size = config.method.batch_size
+        self.num_workers = config.dataloader_workers
+        self.max_training_steps = config.method.max_training_steps
+        self.teacher_batch_size = config.method.teacher_batch_size
+        self.starting_steps = 0
+
+        self.teacher = teacher
+        self.student = SoftQAgent(student_config(config))
+        self.student.alpha = teacher.alpha
+        self.optimizer = th.optim.AdamW(self.student.parameters(), lr=self.lr)
+
+        self.load_sequences = self.gpu_loader.load_sequences
+        self.dataset = SequenceReplayBuffer(config) if self.load_sequences \
+            else ReplayBuffer(config)
+        for source in [expert_dataset, *replay_buffers]:
+            for trajectory in source.trajectories:
+                if len(trajectory) > 0:
+                    self.dataset.append_trajectory(trajectory)
+        self.training_steps = len(self.dataset) * self.epochs / self.batch_size
+
+        self.teacher_probabilities, trajectory_offsets = \
+            self.cache_teacher_probabilities()
+        # index of the teacher's probabilities for the last step of each sample
+        lookup = self.dataset.sequence_lookup if self.load_sequences \
+            else self.dataset.step_lookup
+        self.target_lookup = th.LongTensor([trajectory_offsets[trajectory_idx] + step_idx
+                                            for trajectory_idx, step_idx in lookup])
+        self.sequence_offsets = th.arange(
+            1 - config.model.lstm_sequence_length, 1) if self.load_sequences \
+            else th.zeros(1, dtype=th.long)
+
+    def cache_teacher_probabilities(self):
+        """
+        Runs the teacher over every frame of every trajectory, in batches.
+
+        Returns the probabilities of all frames concatenated, and the offset of each
+        trajectory's first frame. With an LSTM, each trajectory is run as a single
+        sequence in chunks, carrying the hidden state between chunks.
+        """
+        print('Caching teacher action probabilities')
+        self.teacher.eval()
+        n_actions = len(self.teacher.actions)
+        teacher_probabilities = []
+        trajectory_offsets = []
+        frame_count = 0
+        with th.no_grad():
+            for trajectory in self.dataset.trajectories:
+                trajectory_offsets.append(frame_count)
+                states = trajectory.states[:len(trajectory)]
+                hidden = self.teacher.initial_hidden().to(self.device)
+                for chunk_start in range(0, len(states), self.teacher_batch_size):
+                    chunk = states[chunk_start:chunk_start + self.teacher_batch_size]
+                    chunk = State(*[th.stack(state_component)
+                                    for state_component in zip(*chunk)])
+                    if self.load_sequences:
+                        chunk = State(*[state_component.unsqueeze(0)
+                                        for state_component in chunk])
+                    chunk, = self.gpu_loader.states_to_device((chunk,))
+                    if self.load_sequences:
+                        chunk.hidden[:, 0] = hidden
+                    Q, hidden = self.teacher.get_Q(chunk)
+                    teacher_probabilities.append(
+                        self.teacher.action_probabilities(Q).reshape(-1, n_actions).cpu())
+                frame_count += len(states)
+        self.teacher.train()
+        print(f'Cached teacher action probabilities for {frame_count} frames')
+        return th.cat(teacher_probabilities, dim=0), trajectory_offsets
+
+    def train_one_batch(self, batch):
+        samples, sample_idx = batch
+        target_idx = self.target_lookup[sample_idx].unsqueeze(-1) \
+            + self.sequence_offsets
+        targets = self.teacher_probabilities[target_idx.reshape(-1)].to(self.device)
+        # not augmented, since the cached targets are for the frames as they are
+        states = self.gpu_loader.transitions_to_device(samples).state
+
+        Q, final_hidden = self.student.get_Q(states)
+        Q = Q.reshape(-1, len(self.student.actions))
+        log_probabilities = F.log_softmax(Q / self.student.alpha, dim=-1)
+        loss = F.kl_div(log_probabilities, targets, reduction='batchmean')
+
+        self.optimizer.zero_grad()
+        loss.backward()
+        self.optimizer.step()
+
+        if final_hidden.size()[0] != 0:
+            self.dataset.update_hidden(sample_idx, final_hidden)
+
+        action_agreement = th.eq(th.argmax(log_probabilities, dim=-1),
+                                 th.argmax(targets, dim=-1)).float().mean()
+        return {'Distillation/kl_divergence': loss.item(),
+                'Distillation/action_agreement': action_agreement.item()}
+
+    def __call__(self, _env=None, profiler=None):
+        print((f'{self.algorithm_name}: Starting training'
+               f' for {self.training_steps} steps (iteration {self.iter_count})'))
+        dataloader = DataLoader(self.dataset, batch_size=self.batch_size,
+                                shuffle=True, num_workers=self.num_workers,
+                                drop_last=True)
+        step = self.start_step
+        for epoch, batches in self.resumed_epochs(dataloader, self.epochs):
+            for batch in batches:
+                metrics = self.train_one_batch(batch)
+
+                self.increment_step(metrics, profiler)
+
+                if self.shutdown_time_reached() or step > self.max_training_steps:
+                    return self.student, None
+
+                self.save_checkpoint(model=self.student, step=step + 1)
+                step += 1
+
+            print(f'Epoch #{epoch + 1} completed')
+
+        print(f'{self.algorithm_name}: Training complete')
+        return self.student, None
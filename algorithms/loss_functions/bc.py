@@ -7,6 +7,13 @@ class BCLoss:
         self.config = config
 
     def __call__(self, expert, expert_aug=None):
+        loss, metrics, final_hidden = self.loss(expert, expert_aug)
+        for k, v in iter(metrics.items()):
+            metrics[k] = v.item()
+        return loss, metrics, final_hidden
+
+    def loss(self, expert, expert_aug=None):
+        """Computes the loss, with metrics left as tensors so it can be compiled."""
         expert_states, expert_actions, _expert_rewards, _expert_next_states, \
             _expert_done = expert
 
@@ -19,7 +26,4 @@ class BCLoss:
         loss = F.cross_entropy(action_probabilities, actions)
 
         metrics['Training/loss'] = loss
-
-        for k, v in iter(metrics.items()):
-            metrics[k] = v.item()
         return loss, metrics, final_hidden
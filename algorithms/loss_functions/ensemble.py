@@ -0,0 +1,58 @@
+import torch as th
+from torch import nn
+from torch.func import functional_call, vmap
+
+
+class MemberLoss(nn.Module):
+    """Wraps a loss function, so that it can be called with a member's parameters."""
+    def __init__(self, loss_function):
+        super().__init__()
+        self.agent = loss_function.model
+        self.loss_function = loss_function
+
+    def forward(self, alpha, batch):
+        self.agent.alpha = alpha
+        loss, metrics, _final_hidden = self.loss_function.loss(*batch)
+        return loss, metrics
+
+
+class EnsembleLoss:
+    """
+    Computes a loss function for every member of a SoftQEnsemble at once, with vmap.
+
+    The loss function is built around the first member, which is used as a template
+    for every member's parameters and alpha. All members get the same batch, and
+    dropout is sampled independently for each. The loss returned is the sum of the
+    members' losses, so each member's parameters get the gradient of its own loss.
+    Metrics are averaged over the members under their usual names, and reported
+    for each member under member_<idx>/.
+    """
+    def __init__(self, ensemble, loss_function):
+        self.ensemble = ensemble
+        self.member_loss = MemberLoss(loss_function)
+        self.template = loss_function.model
+        self.alphas = th.tensor(ensemble.alphas, device=self.template.device)
+        self.prefixed_parameters = {f'agent.{name}': tensor for name, tensor
+                                    in ensemble.stacked_parameters.items()}
+        self.prefixed_buffers = {f'agent.{name}': tensor for name, tensor
+                                 in ensemble.stacked_buffers.items()}
+        self.batched_loss = vmap(self.call_member, in_dims=(0, 0, 0, None),
+                                 randomness='different')
+
+    def call_member(self, parameters, buffers, alpha, batch):
+        return functional_call(self.member_loss, (parameters, buffers), (alpha, batch))
+
+    def __call__(self, expert, policy=None, expert_aug=None, policy_aug=None):
+        try:
+            losses, member_metrics = self.batched_loss(
+                self.prefixed_parameters, self.prefixed_buffers, self.alphas,
+                (expert, policy, expert_aug, policy_aug))
+        finally:
+            self.template.alpha = self.ensemble.alphas[0]
+        metrics = {}
+        for k, v in iter(member_metrics.items()):
+            v = v.detach().float()
+            metrics[k] = v.mean().item()
+            for member_idx, member_value in enumerate(v.tolist()):
+                metrics[f'member_{member_idx}/{k}'] = member_value
+        return losses.sum(), metrics, th.zeros(0)
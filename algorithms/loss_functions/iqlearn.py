@@ -26,6 +26,13 @@ class IQLearnLoss:
         return th.cat((avg, avg), dim=0)
 
     def __call__(self, expert, policy=None, expert_aug=None, policy_aug=None):
+        loss, metrics, final_hidden = self.loss(expert, policy, expert_aug, policy_aug)
+        for k, v in iter(metrics.items()):
+            metrics[k] = v.item()
+        return loss, metrics, final_hidden
+
+    def loss(self, expert, policy=None, expert_aug=None, policy_aug=None):
+        """Computes the loss, with metrics left as tensors so it can be compiled."""
         if self.drq:
             expert = cat_transitions((expert, expert_aug))
             if self.online:
@@ -149,7 +156,5 @@ class IQLearnLoss:
             metrics['value_policy_loss'] = value_loss
 
         metrics["total_loss"] = loss
-        for k, v in iter(metrics.items()):
-            metrics[k] = v.item()
 
         return loss, metrics, final_hidden
@@ -1,13 +1,13 @@
 from algorithms.loss_functions.bc import BCLoss
 from algorithms.loss_functions.iqlearn import IQLearnLoss
 from algorithms.loss_functions.sqil import SQILLoss
+from core import distributed
 from core.algorithm import Algorithm
 from core.state import update_hidden
 from modules.curriculum import CurriculumScheduler
 from modules.alpha_tuning import AlphaTuner
 
 import os
-import wandb
 
 import torch as th
 from torch.utils.data import DataLoader
@@ -19,7 +19,11 @@ class SupervisedLearning(Algorithm):
         self.lr = config.method.learning_rate
         self.epochs = config.method.epochs
         self.batch_size = config.method.batch_size
-        self.training_steps = len(train_dataset) * self.epochs / self.batch_size
+        self.num_workers = config.dataloader_workers
+        # with distributed training, each rank trains on its share of every epoch
+        self.world_size = distributed.get_world_size()
+        self.training_steps = len(train_dataset) * self.epochs \
+            / (self.batch_size * self.world_size)
         self.max_training_steps = config.method.max_training_steps
 
         self.cyclic_learning_rate = config.cyclic_learning_rate
@@ -27,7 +31,13 @@ class SupervisedLearning(Algorithm):
         self.train_dataset = train_dataset
         self.test_dataset = test_dataset
 
+        # an ensemble's first member stands in for the agent
+        self.ensemble = self.create_ensemble(config)
+        if self.ensemble is not None:
+            agent = self.ensemble.members[0]
         self.agent = agent
+        for member in self.ensemble.members if self.ensemble is not None else [agent]:
+            distributed.broadcast_parameters(member)
 
         if config.method.loss_function == 'bc':
             self.loss_function = BCLoss(agent, config)
@@ -36,7 +46,13 @@ class SupervisedLearning(Algorithm):
         elif config.method.loss_function == 'iqlearn':
             self.loss_function = IQLearnLoss(agent, config)
 
-        self.optimizer = th.optim.AdamW(agent.parameters(), lr=self.lr)
+        if self.ensemble is not None:
+            self.loss_function = self.ensemble_loss(self.loss_function)
+            self.optimizer = self.ensemble.optimizer(self.lr)
+        else:
+            self.optimizer = th.optim.AdamW(agent.parameters(), lr=self.lr)
+
+        self.compile_loss_function(self.loss_function)
 
         if self.cyclic_learning_rate:
             decay_factor = .25**(1/(self.training_steps/4))
@@ -67,18 +83,23 @@ class SupervisedLearning(Algorithm):
         expert_batch = self.gpu_loader.transitions_to_device(expert_batch)
         aug_expert_batch = self.augmentation(expert_batch)
 
-        loss, metrics, final_hidden = self.loss_function(expert=aug_expert_batch,
-                                                         expert_aug=expert_batch)
+        with self.mixed_precision.autocast():
+            loss, metrics, final_hidden = self.loss_function(expert=aug_expert_batch,
+                                                             expert_aug=expert_batch)
 
-        self.optimizer.zero_grad()
-        loss.backward()
-        self.optimizer.step()
+        self.mixed_precision.step(loss, self.optimizer,
+                                  after_backward=self.all_reduce_gradients)
 
         if final_hidden.size()[0] != 0:
             self.train_dataset.update_hidden(expert_idx, final_hidden)
 
         return metrics
 
+    def all_reduce_gradients(self):
+        distributed.all_reduce_gradients(
+            [parameter for group in self.optimizer.param_groups
+             for parameter in group['params']])
+
     def post_train_step_modules(self, step):
         metrics = {}
         if self.cyclic_learning_rate:
@@ -89,12 +110,12 @@ class SupervisedLearning(Algorithm):
     def eval(self):
         agent = self.agent
         test_dataset = self.test_dataset
-        if test_dataset is not None and self.wandb:
+        if test_dataset is not None and self.rank == 0:
             test_losses = []
             dataloader = DataLoader(test_dataset,
                                     shuffle=False,
                                     batch_size=self.batch_size,
-                                    num_workers=4,
+                                    num_workers=self.num_workers,
                                     drop_last=True)
             for batch in dataloader:
                 batch = self.gpu_loader.batch_to_device(batch)
@@ -104,7 +125,7 @@ class SupervisedLearning(Algorithm):
             test_loss = sum(test_losses) / len(test_losses)
             eval_metrics = {'Validation/loss': test_loss}
             print('Metrics: ', eval_metrics)
-            wandb.log(eval_metrics, step=self.iter_count)
+            self.metrics.log(eval_metrics, self.iter_count)
 
     def __call__(self, _env=None, profiler=None):
         print((f'{self.algorithm_name}: Starting training'
@@ -113,11 +134,26 @@ class SupervisedLearning(Algorithm):
 
         train_dataset = self.train_dataset
         test_dataset = self.test_dataset
+        if train_dataset.sampler is not None:
+            # weighted by the curriculum, and already split between ranks
+            sampler = train_dataset.sampler
+        elif train_dataset.stratify_by:
+            sampler = train_dataset.stratified_sampler(self.batch_size)
+        elif self.world_size > 1:
+            sampler = distributed.DistributedTrajectorySampler(train_dataset,
+                                                               seed=self.config.seed)
+        else:
+            sampler = None
+        # a constant batch size keeps compiled training steps from recompiling
         train_dataloader = DataLoader(train_dataset, batch_size=self.batch_size,
-                                      shuffle=True, num_workers=4)
-        step = 0
-        for epoch in range(self.epochs):
-            for batch in train_dataloader:
+                                      shuffle=sampler is None, sampler=sampler,
+                                      num_workers=self.num_workers,
+                                      drop_last=self.config.compile_training)
+        step = self.start_step
+        for epoch, batches in self.resumed_epochs(train_dataloader, self.epochs):
+            if isinstance(sampler, distributed.DistributedTrajectorySampler):
+                sampler.set_epoch(epoch)
+            for batch in batches:
 
                 pretrain_metrics = self.pre_train_step_modules(step)
 
@@ -129,10 +165,11 @@ class SupervisedLearning(Algorithm):
 
                 self.increment_step(metrics, profiler)
 
-                if self.shutdown_time_reached() or step > self.max_training_steps:
+                if distributed.any_rank(self.shutdown_time_reached()
+                                        or step > self.max_training_steps):
                     return agent, None
 
-                self.save_checkpoint(model=agent)
+                self.save_checkpoint(model=self.ensemble or agent, step=step + 1)
                 step += 1
 
             print(f'Epoch #{epoch + 1} completed')
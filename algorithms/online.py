@@ -1,5 +1,8 @@
+from core.actors import ActorPool
 from core.algorithm import Algorithm
 from core.datasets import ReplayBuffer, SequenceReplayBuffer
+from core.replay_snapshot import ReplaySnapshot
+from core.state import split_transitions, state_from_numpy
 from core.trajectory_generator import TrajectoryGenerator
 
 from collections import deque
@@ -7,7 +10,7 @@ from pathlib import Path
 import time
 
 import numpy as np
-import wandb
+import torch as th
 
 
 class OnlineTraining(Algorithm):
@@ -17,16 +20,39 @@ class OnlineTraining(Algorithm):
         self.training_steps = config.method.training_steps
         self.updates_per_step = config.method.updates_per_step
 
+        self.async_actors = config.async_actors
+        self.policy_refresh_updates = config.policy_refresh_updates
+        self.max_update_to_data_ratio = config.max_update_to_data_ratio
+
         self.batch_size = config.method.batch_size
+        self.ensemble = None
+        # with batch reuse, one batch for all of an env step's updates is sampled and
+        # moved to the device at once, then split into a minibatch per update
+        self.batch_reuse = config.batch_reuse and self.updates_per_step > 1
+        self.sample_batch_size = self.batch_size * self.updates_per_step \
+            if self.batch_reuse else self.batch_size
 
         self.min_training_episode_length = config.env.min_training_episode_length
         self.max_training_episode_length = config.env.max_training_episode_length
 
+        # env steps collected by async actors, restored with the iteration count
+        self.env_steps = 0
+        self.checkpoint_counters = [*self.checkpoint_counters, 'env_steps']
+
         self.rewards_window = deque(maxlen=10)  # last N rewards
         self.steps_window = deque(maxlen=10)  # last N episode steps
         self.replay_buffer = self.initialize_replay_buffer(**kwargs)
+        self.replay_snapshot = ReplaySnapshot(config.replay_snapshot_path) \
+            if config.replay_snapshot_path else None
+
+    def open_replay_snapshot(self, initial_replay_buffer):
+        """Maps an initial replay buffer given as the path of a ReplaySnapshot."""
+        if isinstance(initial_replay_buffer, (str, Path)):
+            return ReplaySnapshot(initial_replay_buffer).open(self.config)
+        return initial_replay_buffer
 
     def initialize_replay_buffer(self, initial_replay_buffer=None, **kwargs):
+        initial_replay_buffer = self.open_replay_snapshot(initial_replay_buffer)
         if initial_replay_buffer is not None:
             print((f'Using initial replay buffer'
                    f' with {len(initial_replay_buffer)} steps'))
@@ -46,17 +72,44 @@ class OnlineTraining(Algorithm):
     def pre_train_step_modules(self, step):
         return
 
-    def train_one_batch(self, batch):
+    def train_one_batch(self, batch, on_device=False):
+        raise NotImplementedError
+
+    def batch_to_device(self, batch):
         raise NotImplementedError
 
     def post_train_step_modules(self, step):
         return
 
+    def device_minibatches(self, batch):
+        """
+        Moves a sampled batch to the device once, and splits it into a minibatch for
+        each of the updates_per_step updates.
+
+        batch_to_device returns a tuple of (transitions, indices) parts, such as the
+        expert and replay parts of the mixed replay buffers. Each part is split as
+        evenly as its size allows, so the minibatches keep the same structure.
+        """
+        split_parts = []
+        for transitions, indices in self.batch_to_device(batch):
+            sections = [len(indices) // self.updates_per_step
+                        + (update < len(indices) % self.updates_per_step)
+                        for update in range(self.updates_per_step)]
+            split_parts.append(list(zip(split_transitions(transitions, sections),
+                                        th.split(indices, sections))))
+        return list(zip(*split_parts))
+
     def training_step(self):
         training_metrics = None
+        if self.batch_reuse:
+            minibatches = self.device_minibatches(
+                self.replay_buffer.sample(batch_size=self.sample_batch_size))
         for i in range(self.updates_per_step):
-            batch = self.replay_buffer.sample(batch_size=self.batch_size)
-            metrics = self.train_one_batch(batch)
+            if self.batch_reuse:
+                metrics = self.train_one_batch(minibatches[i], on_device=True)
+            else:
+                batch = self.replay_buffer.sample(batch_size=self.batch_size)
+                metrics = self.train_one_batch(batch)
 
             # collect and log metrics:
             if training_metrics is None:
@@ -90,10 +143,9 @@ class OnlineTraining(Algorithm):
             print(f'Trajectory completed at iteration {self.iter_count}')
             self.rewards_window.append(sum(current_trajectory.rewards))
             self.steps_window.append(len(current_trajectory.rewards))
-            if self.wandb:
-                wandb.log({'Rewards/train_reward': np.mean(self.rewards_window),
-                           'Timesteps/episodes_length': np.mean(self.steps_window)},
-                          step=self.iter_count)
+            self.metrics.log({'Rewards/train_reward': np.mean(self.rewards_window),
+                              'Timesteps/episodes_length': np.mean(self.steps_window)},
+                             self.iter_count)
 
             if eval:
                 self.eval()
@@ -112,10 +164,12 @@ class OnlineTraining(Algorithm):
             rewards += sum(trajectory.rewards)
             trajectory.save_as_video(save_path, f'trajectory_{int(round(time.time()))}')
         print('Evaluation reward:', rewards/self.eval_episodes)
-        if self.wandb:
-            wandb.log({'Rewards/eval': rewards/self.eval_episodes}, step=self.iter_count)
+        self.metrics.log({'Rewards/eval': rewards/self.eval_episodes}, self.iter_count)
 
     def __call__(self, env, profiler=None):
+        if self.async_actors > 0:
+            return self.train_async(env, profiler)
+
         self.pretraining_modules()
 
         print((f'{self.algorithm_name}: training for {self.training_steps}'))
@@ -125,7 +179,7 @@ class OnlineTraining(Algorithm):
                                                         training=True)
         self.trajectory_generator.start_new_trajectory()
 
-        for step in range(self.training_steps):
+        for step in range(self.start_step, self.training_steps):
 
             action_metrics = self.trajectory_generator.env_interaction_step(step)
 
@@ -147,10 +201,122 @@ class OnlineTraining(Algorithm):
             if self.shutdown_time_reached():
                 break
 
-            self.save_checkpoint(replay_buffer=self.replay_buffer, model=self.agent)
+            self.save_checkpoint(replay_buffer=self.replay_buffer,
+                                 model=self.ensemble or self.agent, step=step + 1)
 
             self.conditionally_increment_episode(step,
                                                  self.replay_buffer.current_trajectory())
 
         print(f'{self.algorithm_name}: Training complete')
         return self.agent, self.replay_buffer
+
+    def receive_actor_messages(self, actor_trajectories, block=False, max_messages=1000):
+        """
+        Moves the steps streamed by the actors into the replay buffer.
+
+        Returns the number of env steps received and their policy lags, measured in
+        policy versions published since the acting policy snapshot.
+        """
+        env_steps = 0
+        policy_lags = []
+        message = self.actor_pool.get(block=block)
+        while message is not None:
+            kind, actor_id, *data = message
+            if kind == 'new_trajectory':
+                state, = data
+                trajectory_idx = self.replay_buffer.new_trajectory()
+                self.replay_buffer.trajectories[trajectory_idx].states.append(
+                    state_from_numpy(state))
+                actor_trajectories[actor_id] = trajectory_idx
+            elif kind == 'step':
+                action, reward, next_state, done, suppressed_termination, \
+                    policy_version = data
+                trajectory_idx = actor_trajectories[actor_id]
+                self.replay_buffer.append_step(
+                    action, reward, state_from_numpy(next_state), done,
+                    trajectory_idx=trajectory_idx,
+                    suppressed_termination=suppressed_termination)
+                env_steps += 1
+                policy_lags.append(self.actor_pool.policy_version() - policy_version)
+                if done:
+                    trajectory = self.replay_buffer.trajectories[trajectory_idx]
+                    self.rewards_window.append(sum(trajectory.rewards))
+                    self.steps_window.append(len(trajectory.rewards))
+            if env_steps >= max_messages:
+                break
+            message = self.actor_pool.get()
+        return env_steps, policy_lags
+
+    def train_async(self, env, profiler=None):
+        """
+        Trains while actor processes step their own environments.
+
+        The learner updates continuously on the replay buffer, publishing its weights
+        to the actors every policy_refresh_updates updates. Updates are capped at
+        max_update_to_data_ratio times the number of env steps collected by the actors.
+        """
+        self.pretraining_modules()
+
+        print((f'{self.algorithm_name}: training for {self.training_steps} env steps'
+               f' with {self.async_actors} actors'))
+
+        self.trajectory_generator = TrajectoryGenerator(env, self.agent,
+                                                        self.config, self.replay_buffer,
+                                                        training=True)
+        self.actor_pool = ActorPool(self.config, self.agent, self.async_actors, env=env)
+        self.actor_pool.start()
+        actor_trajectories = {}
+        env_steps = self.env_steps
+        updates = self.start_step
+        next_eval = self.eval_frequency * (env_steps // self.eval_frequency + 1) \
+            if self.eval_frequency > 0 else 0
+
+        while env_steps < self.training_steps:
+            can_update = len(self.replay_buffer) > self.batch_size \
+                and updates < self.max_update_to_data_ratio * env_steps
+            new_steps, policy_lags = self.receive_actor_messages(actor_trajectories,
+                                                                 block=not can_update)
+            env_steps += new_steps
+            self.env_steps = env_steps
+            if not can_update:
+                continue
+
+            pretrain_metrics = self.pre_train_step_modules(updates)
+
+            batch = self.replay_buffer.sample(batch_size=self.batch_size)
+            training_metrics = self.train_one_batch(batch)
+            updates += 1
+            if updates % self.policy_refresh_updates == 0:
+                self.actor_pool.publish(self.agent)
+
+            posttrain_metrics = self.post_train_step_modules(updates)
+
+            async_metrics = {'Async/env_steps': env_steps,
+                             'Async/update_to_data_ratio': updates / env_steps,
+                             'Async/policy_version': self.actor_pool.policy_version(),
+                             **self.actor_pool.metrics()}
+            if len(policy_lags) > 0:
+                async_metrics['Async/policy_lag'] = np.mean(policy_lags)
+                async_metrics['Async/max_policy_lag'] = max(policy_lags)
+            if len(self.rewards_window) > 0:
+                async_metrics['Rewards/train_reward'] = np.mean(self.rewards_window)
+                async_metrics['Timesteps/episodes_length'] = np.mean(self.steps_window)
+
+            metrics = {**pretrain_metrics, **training_metrics,
+                       **posttrain_metrics, **async_metrics}
+
+            self.increment_step(metrics, profiler)
+
+            if self.shutdown_time_reached():
+                break
+
+            self.save_checkpoint(replay_buffer=self.replay_buffer,
+                                 model=self.ensemble or self.agent, step=updates)
+
+            if next_eval > 0 and env_steps >= next_eval:
+                self.eval()
+                next_eval += self.eval_frequency
+
+        self.actor_pool.stop()
+        print(f'{self.algorithm_name}: Training complete')
+        return self.agent, self.replay_buffer
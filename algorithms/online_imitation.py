@@ -13,6 +13,11 @@ class OnlineImitation(OnlineTraining):
                  initial_replay_buffer=None, **kwargs):
         super().__init__(config, expert_dataset=expert_dataset,
                          initial_replay_buffer=initial_replay_buffer, **kwargs)
+        # an ensemble's first member stands in for the agent, collecting the
+        # trajectories all members train on
+        self.ensemble = self.create_ensemble(config)
+        if self.ensemble is not None:
+            agent = self.ensemble.members[0]
         self.agent = agent
         self.lr = config.method.learning_rate
 
@@ -21,7 +26,13 @@ class OnlineImitation(OnlineTraining):
         elif config.method.loss_function == 'iqlearn':
             self.loss_function = IQLearnLoss(agent, config)
 
-        self.optimizer = th.optim.AdamW(agent.parameters(), lr=self.lr)
+        if self.ensemble is not None:
+            self.loss_function = self.ensemble_loss(self.loss_function)
+            self.optimizer = self.ensemble.optimizer(self.lr)
+        else:
+            self.optimizer = th.optim.AdamW(agent.parameters(), lr=self.lr)
+
+        self.compile_loss_function(self.loss_function)
 
         self.cyclic_learning_rate = config.cyclic_learning_rate
         if self.cyclic_learning_rate:
@@ -50,13 +61,14 @@ class OnlineImitation(OnlineTraining):
 
     def initialize_replay_buffer(self, expert_dataset=None,
                                  initial_replay_buffer=None, **kwargs):
+        initial_replay_buffer = self.open_replay_snapshot(initial_replay_buffer)
         if initial_replay_buffer is not None:
             print((f'Using initial replay buffer'
                    f' with {len(initial_replay_buffer)} steps'))
         kwargs = dict(
             expert_dataset=expert_dataset,
             config=self.config,
-            batch_size=self.batch_size,
+            batch_size=self.sample_batch_size,
             initial_replay_buffer=initial_replay_buffer
         )
         if self.config.model.lstm_layers == 0:
@@ -77,20 +89,24 @@ class OnlineImitation(OnlineTraining):
             metrics['alpha'] = self.agent.alpha
         return metrics
 
-    def train_one_batch(self, batch):
+    def batch_to_device(self, batch):
+        (expert_batch, expert_idx), (replay_batch, replay_idx) = batch
+        return ((self.gpu_loader.transitions_to_device(expert_batch), expert_idx),
+                (self.gpu_loader.transitions_to_device(replay_batch), replay_idx))
+
+    def train_one_batch(self, batch, on_device=False):
+        if not on_device:
+            batch = self.batch_to_device(batch)
         (expert_batch, expert_idx), (replay_batch, replay_idx) = batch
-        expert_batch = self.gpu_loader.transitions_to_device(expert_batch)
-        replay_batch = self.gpu_loader.transitions_to_device(replay_batch)
         aug_expert_batch = self.augmentation(expert_batch)
         aug_replay_batch = self.augmentation(replay_batch)
 
-        loss, metrics, final_hidden = self.loss_function(expert=aug_expert_batch,
-                                                         policy=aug_replay_batch,
-                                                         expert_aug=expert_batch,
-                                                         policy_aug=replay_batch)
-        self.optimizer.zero_grad()
-        loss.backward()
-        self.optimizer.step()
+        with self.mixed_precision.autocast():
+            loss, metrics, final_hidden = self.loss_function(expert=aug_expert_batch,
+                                                             policy=aug_replay_batch,
+                                                             expert_aug=expert_batch,
+                                                             policy_aug=replay_batch)
+        self.mixed_precision.step(loss, self.optimizer)
 
         if self.alpha_tuner and self.alpha_tuner.entropy_tuning:
             alpha_metrics = self.alpha_tuner.update_alpha(metrics['entropy'])
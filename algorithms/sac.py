@@ -73,22 +73,25 @@ class SoftActorCritic(OnlineTraining):
         return metrics
 
     def _update_q(self, batch, batch_aug=None):
-        q_loss, metrics = self._q_loss(batch, batch_aug=batch_aug)
-        self.q_optimizer.zero_grad(set_to_none=True)
-        q_loss.backward()
-        self.q_optimizer.step()
+        with self.mixed_precision.autocast():
+            q_loss, metrics = self._q_loss(batch, batch_aug=batch_aug)
+        self.mixed_precision.step(q_loss, self.q_optimizer, set_to_none=True)
         return metrics
 
     def _update_policy(self, batch):
-        policy_loss, final_hidden, metrics = self._policy_loss(batch)
-        self.policy_optimizer.zero_grad(set_to_none=True)
-        policy_loss.backward()
-        self.policy_optimizer.step()
+        with self.mixed_precision.autocast():
+            policy_loss, final_hidden, metrics = self._policy_loss(batch)
+        self.mixed_precision.step(policy_loss, self.policy_optimizer, set_to_none=True)
         return metrics, final_hidden
 
-    def train_one_batch(self, batch):
+    def batch_to_device(self, batch):
         batch, batch_idx = batch
-        batch = self.gpu_loader.transitions_to_device(batch)
+        return ((self.gpu_loader.transitions_to_device(batch), batch_idx),)
+
+    def train_one_batch(self, batch, on_device=False):
+        if not on_device:
+            batch = self.batch_to_device(batch)
+        (batch, batch_idx), = batch
         aug_batch = self.augmentation(batch)
 
         q_metrics = self._update_q(aug_batch, batch_aug=batch)
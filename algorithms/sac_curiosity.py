@@ -31,9 +31,10 @@ class CuriositySAC(SoftActorCritic):
         self.curiosity_optimizer.step()
         return metrics
 
-    def train_one_batch(self, batch, curiosity_only=False):
-        batch, batch_idx = batch
-        batch = self.gpu_loader.batch_to_device(batch)
+    def train_one_batch(self, batch, curiosity_only=False, on_device=False):
+        if not on_device:
+            batch = self.batch_to_device(batch)
+        (batch, batch_idx), = batch
         with th.no_grad():
             batch = self.curiosity_module.rewards(batch, return_transition=True)
         aug_batch = self.augmentation(batch)
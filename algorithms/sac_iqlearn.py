@@ -44,19 +44,23 @@ class IQLearnSAC(SoftActorCritic):
 
     def _update_q(self, expert_batch, replay_batch,
                   expert_batch_aug=None, replay_batch_aug=None):
-        loss, metrics, _ = self._q_loss(expert=expert_batch_aug,
-                                        policy=replay_batch_aug,
-                                        expert_aug=expert_batch,
-                                        policy_aug=replay_batch)
-        self.q_optimizer.zero_grad(set_to_none=True)
-        loss.backward()
-        self.q_optimizer.step()
+        with self.mixed_precision.autocast():
+            loss, metrics, _ = self._q_loss(expert=expert_batch_aug,
+                                            policy=replay_batch_aug,
+                                            expert_aug=expert_batch,
+                                            policy_aug=replay_batch)
+        self.mixed_precision.step(loss, self.q_optimizer, set_to_none=True)
         return metrics
 
-    def train_one_batch(self, batch):
+    def batch_to_device(self, batch):
+        (expert_batch, expert_idx), (replay_batch, replay_idx) = batch
+        return ((self.gpu_loader.transitions_to_device(expert_batch), expert_idx),
+                (self.gpu_loader.transitions_to_device(replay_batch), replay_idx))
+
+    def train_one_batch(self, batch, on_device=False):
+        if not on_device:
+            batch = self.batch_to_device(batch)
         (expert_batch, expert_idx), (replay_batch, replay_idx) = batch
-        expert_batch = self.gpu_loader.transitions_to_device(expert_batch)
-        replay_batch = self.gpu_loader.transitions_to_device(replay_batch)
         expert_batch_aug = self.augmentation(expert_batch)
         replay_batch_aug = self.augmentation(replay_batch)
         combined_batch = cat_transitions((expert_batch, replay_batch,
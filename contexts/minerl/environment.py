@@ -1,7 +1,7 @@
 from core.state import State, Transition
 
-from collections import OrderedDict, deque
-import copy
+from collections import OrderedDict
+import time
 
 import gym
 import minerl
@@ -93,26 +93,40 @@ def start_env(config: OmegaConf, debug_env=False) -> gym.Env:
 
 
 class MineRLDebugEnv(gym.Env):
-    """Simulates a MineRL environment to reduce debug time."""
+    """
+    Simulates a MineRL environment to reduce debug time.
+
+    Reset and step latency can be simulated through config, to test and benchmark
+    code that hides environment latency.
+    """
 
     def __init__(self, config):
         self.context = MineRLContext(config)
         self.action_list = self.context.actions
         self.inventory = self.context.starting_inventory
+        self.reset_latency = config.context.debug_reset_latency
+        self.step_latency = config.context.debug_step_latency
 
-    def step(self, _action):
+    def _random_obs(self):
         obs = {"pov": np.random.randint(0, 255, (64, 64, 3)),
                "inventory": self.inventory,
                "compassAngle": 0,
                "equipped_items": {"mainhand": {'type': 'snowball'}}}
+        return obs
+
+    def step(self, _action):
+        if self.step_latency > 0:
+            time.sleep(self.step_latency)
+        obs = self._random_obs()
         _reward = 0
         _info = None
         done = np.random.choice([True, False], p=[.02, .98])
         return obs, _reward, done, _info
 
     def reset(self):
-        obs, _, _, _ = self.step(0)
-        return obs
+        if self.reset_latency > 0:
+            time.sleep(self.reset_latency)
+        return self._random_obs()
 
     def close(self):
         return
@@ -238,18 +252,44 @@ class TerminationHelper:
 
 
 class ObservationWrapper(gym.ObservationWrapper):
+    """
+    Converts MineRL observations into states.
+
+    The framestack is a preallocated ring of frames, so each observation costs one
+    in place frame copy and a single gather into the state's spatial tensor.
+    """
     def __init__(self, env, config):
         super().__init__(env)
         self.context = MineRLContext(config)
         self.n_observation_frames = config.model.n_observation_frames
-        self.framestack = deque(maxlen=self.n_observation_frames)
-
-    def _obs_to_spatial(self, obs):
-        pov = obs['pov'].copy()
+        self.framestack = th.zeros((self.n_observation_frames, *self.context.frame_shape),
+                                   dtype=th.uint8)
+        self.framestack_filled = False
+        # slot holding the oldest frame, which the next frame overwrites
+        self.oldest_frame = 0
+        self.frame_orders = [
+            th.LongTensor([(oldest + offset) % self.n_observation_frames
+                           for offset in range(self.n_observation_frames)])
+            for oldest in range(self.n_observation_frames)]
+
+    def _obs_to_frame(self, obs):
+        pov = obs['pov']
         if isinstance(pov, np.ndarray):
-            pov = th.from_numpy(pov).to(th.uint8)
+            pov = th.from_numpy(pov)
         return pov.permute(2, 0, 1)
 
+    def _push_frame(self, frame):
+        if not self.framestack_filled:
+            self.framestack.copy_(frame.unsqueeze(0).expand_as(self.framestack))
+            self.framestack_filled = True
+        else:
+            self.framestack[self.oldest_frame].copy_(frame)
+            self.oldest_frame = (self.oldest_frame + 1) % self.n_observation_frames
+
+    def _stacked_frames(self):
+        spatial = th.index_select(self.framestack, 0, self.frame_orders[self.oldest_frame])
+        return spatial.reshape(-1, *self.context.frame_shape[1:])
+
     def _obs_to_equipped_item(self, obs):
         equipped_item = obs['equipped_items']['mainhand']['type']
         equipped = th.zeros(len(self.context.items), dtype=th.uint8)
@@ -284,18 +324,10 @@ class ObservationWrapper(gym.ObservationWrapper):
         return nonspatial
 
     def observation(self, obs):
-        state = State(self._obs_to_spatial(obs),
-                      self._obs_to_nonspatial(obs),
-                      self.context.initial_hidden)
-        pov = state.spatial
-        while len(self.framestack) < self.n_observation_frames:
-            self.framestack.append(pov)
-        self.framestack.append(pov)
-        spatial = th.cat(list(self.framestack), dim=0)
-        state = list(state)
-        state[0] = spatial
-        state = State(*state)
-        return state
+        self._push_frame(self._obs_to_frame(obs))
+        return State(self._stacked_frames(),
+                     self._obs_to_nonspatial(obs),
+                     self.context.initial_hidden)
 
 
 class ActionShaping(gym.ActionWrapper):
@@ -359,7 +391,10 @@ class ActionShaping(gym.ActionWrapper):
             act = self.env.action_space.no_op()
             for a, v in actions:
                 act[a] = v
+            act['camera'] = np.array(act['camera'], dtype=np.float32)
             self.actions.append(act)
+        # camera noise is written into the action templates, offset from these
+        self.camera_actions = [act['camera'].copy() for act in self.actions]
 
         self.action_space = gym.spaces.Discrete(len(self.actions))
 
@@ -368,8 +403,12 @@ class ActionShaping(gym.ActionWrapper):
         self.action_list = action_list
 
     def action(self, action):
-        action = self.actions[action]
-        action = copy.deepcopy(action)
-        action['camera'][0] += np.random.normal(loc=0., scale=self.camera_noise)
-        action['camera'][1] += np.random.normal(loc=0, scale=self.camera_noise)
-        return action
+        """
+        Returns the prebuilt action dict with fresh camera noise.
+
+        The returned dict is reused by later calls, so it must be consumed right away.
+        """
+        noise = np.random.normal(loc=0., scale=self.camera_noise, size=2)
+        np.add(self.camera_actions[action], noise, out=self.actions[action]['camera'],
+               casting='unsafe')
+        return self.actions[action]
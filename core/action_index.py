@@ -0,0 +1,78 @@
+import numpy as np
+
+
+class ClassIndex:
+    """
+    The items of each class, grouped so that any class's items can be drawn from.
+
+    Items are sorted by class once, so drawing an item of a given class takes
+    constant time, whatever the number of items.
+    """
+    def __init__(self, classes):
+        classes = np.asarray(classes)
+        self.members = np.argsort(classes, kind='stable')
+        self.labels, self.counts = np.unique(classes, return_counts=True)
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts)[:-1]))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def members_of(self, label):
+        position = np.searchsorted(self.labels, label)
+        if position == len(self.labels) or self.labels[position] != label:
+            return self.members[:0]
+        start = self.offsets[position]
+        return self.members[start:start + self.counts[position]]
+
+    def sample(self, positions, rng):
+        """Draws an item uniformly from each class, given by its position in labels."""
+        positions = np.asarray(positions)
+        offsets = (rng.random(len(positions)) * self.counts[positions]).astype(np.int64)
+        return self.members[self.offsets[positions] + offsets]
+
+
+class ActionIndex:
+    """
+    The expert action and equipped item at each master index of a dataset.
+
+    Equipped items are numbered from 1 in the order of the context's items, with 0
+    for no item. A ClassIndex is built for each way of stratifying the steps: by
+    action, by equipped item, and by the pair of both.
+    """
+    stratifications = ['action', 'equipped_item', 'action_and_item']
+
+    def __init__(self, actions, equipped_items):
+        self.actions = np.asarray(actions)
+        self.equipped_items = np.asarray(equipped_items)
+        item_count = int(self.equipped_items.max(initial=0)) + 1
+        self.class_indices = {
+            'action': ClassIndex(self.actions),
+            'equipped_item': ClassIndex(self.equipped_items),
+            'action_and_item': ClassIndex(self.actions * item_count
+                                          + self.equipped_items)}
+
+    @classmethod
+    def from_store(cls, store, lookup, items_available=True) -> 'ActionIndex':
+        """
+        Indexes the steps of a TrajectoryStore given by a lookup of (trajectory,
+        step) pairs, by the action taken and the item equipped before taking it.
+        """
+        trajectory_indices, step_indices = lookup[:, 0], lookup[:, 1]
+        step_offsets = store.step_offsets.numpy()
+        state_offsets = store.state_offsets.numpy()
+        actions = store.actions.numpy()[step_offsets[trajectory_indices] + step_indices]
+        if items_available and len(lookup) > 0:
+            nonspatial = store.nonspatial.numpy()[state_offsets[trajectory_indices]
+                                                  + step_indices]
+            _inventory, equipped = np.split(nonspatial, 2, axis=1)
+            equipped_items = np.where(equipped.any(axis=1),
+                                      equipped.argmax(axis=1) + 1, 0)
+        else:
+            equipped_items = np.zeros(len(lookup), dtype=np.int64)
+        return cls(actions, equipped_items)
+
+    def class_index(self, stratify_by) -> ClassIndex:
+        if stratify_by not in self.class_indices:
+            raise ValueError(f'Cannot stratify expert steps by {stratify_by},'
+                             f' only by one of {self.stratifications}')
+        return self.class_indices[stratify_by]
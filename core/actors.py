@@ -0,0 +1,127 @@
+from agents.soft_q import SoftQAgent
+from core.environment import is_debug_env, start_env
+from core.inference_server import InferenceServer
+from core.shared_policy import SharedPolicy
+from core.state import state_to_numpy
+from core.trajectories import Trajectory
+from core.trajectory_generator import TrajectoryGenerator
+
+import queue
+
+import numpy as np
+import torch as th
+import torch.multiprocessing as mp
+
+
+def run_actor(actor_id, config, shared_policy, transition_queue, stop_event,
+              debug_env=False, inference_client=None):
+    """
+    Steps an environment with the latest shared policy and streams every step back.
+
+    Messages are tuples, either ('new_trajectory', actor_id, state) when the actor
+    starts a trajectory, or ('step', actor_id, action, reward, next_state, done,
+    suppressed_termination, policy_version) after every env step. States are sent as
+    numpy arrays so they don't hold shared memory file descriptors in the learner.
+
+    If an inference_client is given, the actor acts through the inference server
+    instead of running its own copy of the agent.
+    """
+    th.manual_seed(config.seed + actor_id)
+    np.random.seed(config.seed + actor_id)
+    env = start_env(config, debug_env=debug_env)
+    agent = SoftQAgent(config) if inference_client is None else inference_client
+    generator = TrajectoryGenerator(env, agent, config, training=True)
+    max_episode_length = config.env.max_training_episode_length
+
+    state = env.reset()
+    while not stop_event.is_set():
+        transition_queue.put(('new_trajectory', actor_id, state_to_numpy(state)))
+        generator.reset_hidden()
+        step = 0
+        suppressed_termination = False
+        while not stop_event.is_set():
+            if inference_client is None:
+                policy_version = shared_policy.sync(agent)
+            trajectory = Trajectory()
+            trajectory.states.append(state)
+            generator.env_interaction_step(step, trajectory=trajectory)
+            if inference_client is not None:
+                policy_version = inference_client.policy_version
+            _state, action, reward, state, done = trajectory[0]
+            suppressed_termination = trajectory.suppressed_termination()
+            transition_queue.put(('step', actor_id, action, reward, state_to_numpy(state),
+                                  done, suppressed_termination, policy_version))
+            step += 1
+            if done or step >= max_episode_length:
+                break
+        if not suppressed_termination:
+            state = env.reset()
+    env.close()
+
+
+class ActorPool:
+    """
+    Runs actor processes that collect experience while the learner trains.
+
+    Actors act with a snapshot of the learner's agent, which is refreshed whenever
+    the learner calls publish. With config.inference_server, the actors share a
+    single batched InferenceServer instead of each running their own agent.
+    """
+    def __init__(self, config, agent, n_actors, env=None):
+        self.context = mp.get_context('spawn')
+        if config.inference_server:
+            self.inference_server = InferenceServer(config, agent, n_actors, self.context)
+            self.shared_policy = self.inference_server.shared_policy
+            inference_clients = [self.inference_server.client(actor_id)
+                                 for actor_id in range(n_actors)]
+        else:
+            self.inference_server = None
+            self.shared_policy = SharedPolicy(agent, self.context)
+            inference_clients = [None] * n_actors
+        self.transition_queue = self.context.Queue(maxsize=1000 * n_actors)
+        self.stop_event = self.context.Event()
+        debug_env = env is not None and is_debug_env(env)
+        self.processes = [
+            self.context.Process(target=run_actor,
+                                 args=(actor_id, config, self.shared_policy,
+                                       self.transition_queue, self.stop_event,
+                                       debug_env, inference_clients[actor_id]),
+                                 daemon=True)
+            for actor_id in range(n_actors)]
+
+    def start(self):
+        if self.inference_server is not None:
+            self.inference_server.start()
+        print(f'Starting {len(self.processes)} actor processes')
+        for process in self.processes:
+            process.start()
+
+    def publish(self, agent):
+        self.shared_policy.publish(agent)
+
+    def policy_version(self):
+        return self.shared_policy.current_version()
+
+    def metrics(self):
+        if self.inference_server is None:
+            return {}
+        return self.inference_server.metrics()
+
+    def get(self, block=False, timeout=1.0):
+        try:
+            return self.transition_queue.get(block=block, timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def stop(self):
+        self.stop_event.set()
+        # drain the queue so actors blocked on a full queue can exit
+        while self.get() is not None:
+            pass
+        for process in self.processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        if self.inference_server is not None:
+            self.inference_server.stop()
+        print('Actor processes stopped')
@@ -1,8 +1,14 @@
 import aicrowd_helper
+from core import distributed
+from core.checkpoint import CheckpointWriter
 from core.data_augmentation import DataAugmentation
 from core.environment import create_context
 from core.gpu import GPULoader
+from core.metrics import create_metrics_logger
+from core.mixed_precision import MixedPrecision
 
+import importlib.util
+import itertools
 from pathlib import Path
 import time
 
@@ -12,17 +18,29 @@ import wandb
 
 
 class Algorithm:
+    # the attributes with a state dict that a resumed run restores, when set
+    checkpoint_attributes = ['agent', 'ensemble', 'student', 'online_q', 'target_q',
+                             'optimizer', 'q_optimizer', 'policy_optimizer',
+                             'scheduler', 'alpha_tuner', 'mixed_precision']
+    # the counters that a resumed run restores
+    checkpoint_counters = ['iter_count']
+
     def __init__(self, config, initial_iter_count=0, **kwargs):
         self.device = th.device("cuda:0" if th.cuda.is_available() else "cpu")
         th.backends.cudnn.benchmark = True
         self.gpu_loader = GPULoader(config)
         self.config = config
-        self.wandb = config.wandb
+        # with distributed training, only rank 0 logs and saves checkpoints
+        self.rank = distributed.get_rank()
+        self.wandb = config.wandb and self.rank == 0
         self.environment = config.env.name
         self.algorithm_name = config.method.name
         self.name = f'{self.environment}_{self.algorithm_name}_{int(round(time.time()))}'
         self.context = create_context(config)
+        # metrics are reduced and written from a background thread
+        self.metrics = create_metrics_logger(config, self.name, self.rank)
         self.augmentation = DataAugmentation(config)
+        self.mixed_precision = MixedPrecision(config, self.device)
 
         self.start_time = config.start_time
         self.training_timeout = config.training_timeout
@@ -36,20 +54,69 @@ class Algorithm:
 
         self.timestamps = []
         self.iter_count = 1 + initial_iter_count
+        # the training loop starts from this step, past zero when resuming
+        self.start_step = 0
+        self.save_training_state = config.save_training_state
+        self.checkpoint_writer = CheckpointWriter()
+        # a ReplaySnapshot the replay buffer is appended to at each checkpoint
+        self.replay_snapshot = None
+
+    def create_ensemble(self, config):
+        """
+        A SoftQEnsemble of config.ensemble_size agents, or None for a single agent.
+
+        Ensembles are trained with torch.func, which torch only has from 2.0 on, so
+        they are imported only when asked for, and older torch raises a ValueError.
+        """
+        if config.ensemble_size <= 1:
+            return None
+        if importlib.util.find_spec('torch.func') is None:
+            raise ValueError(f'Ensembles need torch.func, which torch {th.__version__}'
+                             ' does not have, set ensemble_size to 1')
+        from agents.ensemble import SoftQEnsemble
+        return SoftQEnsemble(config)
+
+    def ensemble_loss(self, loss_function):
+        """Computes the loss function for each ensemble member at once."""
+        from algorithms.loss_functions.ensemble import EnsembleLoss
+        return EnsembleLoss(self.ensemble, loss_function)
+
+    def compile_loss_function(self, loss_function):
+        """
+        Compiles the network forward and loss arithmetic of a loss function in place.
+
+        With config.compile_training, the loss function's loss method is wrapped in
+        torch.compile. Graphs are specialized to the batch shapes, so batches should
+        have a constant size to avoid recompiling. Where torch.compile is not
+        available, or for loss functions without a loss method, training stays eager.
+        """
+        if not self.config.compile_training:
+            return loss_function
+        if not hasattr(th, 'compile'):
+            print('torch.compile is not available, training eagerly')
+            return loss_function
+        if not hasattr(loss_function, 'loss'):
+            print(f'{type(loss_function).__name__} can not be compiled, training eagerly')
+            return loss_function
+        method = self.config.method
+        if method.get('entropy_tuning') or method.get('decay_alpha'):
+            print('Changing alpha recompiles the training step, consider a fixed alpha')
+        loss_function.loss = th.compile(loss_function.loss, dynamic=False)
+        print('Compiled training step')
+        return loss_function
 
     def increment_step(self, metrics, profiler):
         self.iter_count += 1
         self.timestamps.append(time.time())
         self.print_update()
 
-        if self.wandb:
-            wandb.log(metrics, step=self.iter_count)
+        self.metrics.record(metrics, self.iter_count)
 
         if profiler:
             profiler.step()
 
     def print_update(self):
-        if (self.iter_count % self.logging_frequency) == 0:
+        if self.rank == 0 and (self.iter_count % self.logging_frequency) == 0:
             print((f'{self.algorithm_name}: Iteration {self.iter_count}'
                    f' {self.iteration_rate():.2f} it/s'))
             aicrowd_helper.register_progress(self.iter_count / (
@@ -65,28 +132,101 @@ class Algorithm:
         rate = iterations / duration
         return rate
 
-    def save_checkpoint(self, replay_buffer=None, model=None):
-        if not (self.checkpoint_frequency > 0 and
+    def save_checkpoint(self, replay_buffer=None, model=None, step=None):
+        """step is the number of training loop steps completed, to resume from."""
+        if not (self.rank == 0 and self.checkpoint_frequency > 0 and
                 self.iter_count % self.checkpoint_frequency == 0):
             return
 
+        if replay_buffer is not None and self.replay_snapshot is not None:
+            self.replay_snapshot.write(replay_buffer)
+        if replay_buffer is not None:
+            self.metrics.log({'Replay/bytes_per_step': replay_buffer.bytes_per_step()},
+                             self.iter_count)
         if replay_buffer is not None and self.wandb and self.save_gifs:
             images, frame_rate = replay_buffer.recent_frames(
                 min(self.checkpoint_frequency, 1000))
-            wandb.log({"video": wandb.Video(
+            self.metrics.log({"video": wandb.Video(
                 images,
                 format='gif', fps=frame_rate)},
-                step=self.iter_count)
+                self.iter_count)
         if model is not None:
-            model_save_path = Path('train') / f'{self.name}.pth'
+            model_save_path = self.model_save_path(model)
+            model_save_path.parent.mkdir(parents=True, exist_ok=True)
             model.save(model_save_path)
             if self.wandb:
                 model_art = wandb.Artifact("agent", type="model")
                 model_art.add_file(model_save_path)
                 model_art.save()
 
+        if self.save_training_state:
+            self.checkpoint_writer.write(self.training_state(step),
+                                         self.training_state_path())
+
         print(f'Checkpoint saved at iteration {self.iter_count}')
 
+    def model_save_path(self, model):
+        """
+        Where a model is saved. Ensembles and distilled students are kept apart from
+        agents, so that the submission never loads an ensemble's list of state dicts,
+        or a student's smaller layers, into an agent built from the config.
+        """
+        if model is getattr(self, 'ensemble', None):
+            return Path('train') / 'ensemble' / f'{self.name}.pth'
+        if model is getattr(self, 'student', None):
+            return Path('train') / 'student' / f'{self.name}.pth'
+        return Path('train') / f'{self.name}.pth'
+
+    def training_state_path(self):
+        """Kept apart from the agents in train/, which the submission loads."""
+        return Path('train') / 'state' / f'{self.name}.state'
+
+    def training_state(self, step=None):
+        """
+        Everything a resumed run needs to carry on where this one is: the state
+        dicts of the networks, optimizers, learning rate scheduler, alpha tuner and
+        grad scaler, and the step counters. Curriculum progress is a function of
+        the step, so the curriculum is reapplied from it on the first resumed step.
+        """
+        state = {'name': self.name, 'step': step if step is not None else self.start_step}
+        for name in self.checkpoint_attributes:
+            value = getattr(self, name, None)
+            if value is not None:
+                state[name] = value.state_dict()
+        for name in self.checkpoint_counters:
+            state[name] = getattr(self, name)
+        return state
+
+    def load_training_state(self, path):
+        """Restores a training state, so that training resumes from its step."""
+        state = th.load(path, map_location=self.device)
+        for name in self.checkpoint_attributes:
+            value = getattr(self, name, None)
+            if value is not None and name in state:
+                value.load_state_dict(state[name])
+        for name in self.checkpoint_counters:
+            setattr(self, name, state[name])
+        # later checkpoints overwrite the resumed run's, and metrics append to its
+        self.name = state['name']
+        self.metrics.close()
+        self.metrics = create_metrics_logger(self.config, self.name, self.rank)
+        self.start_step = state['step']
+        print(f'Resuming {self.name} from step {self.start_step}'
+              f' (iteration {self.iter_count})')
+
+    def resumed_epochs(self, dataloader, epochs):
+        """
+        The epochs left to train, each with its batches left to train, so a resumed
+        run skips the epochs it completed and the start of the one it stopped in.
+        """
+        steps_per_epoch = max(len(dataloader), 1)
+        resume_epoch, resume_batch = divmod(self.start_step, steps_per_epoch)
+        for epoch in range(resume_epoch, epochs):
+            if epoch == resume_epoch and resume_batch > 0:
+                yield epoch, itertools.islice(dataloader, steps_per_epoch - resume_batch)
+            else:
+                yield epoch, dataloader
+
     def training_done(self, step):
         return step + 1 == self.training_steps
 
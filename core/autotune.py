@@ -0,0 +1,166 @@
+from agents.bc import BCAgent
+from agents.soft_q import SoftQAgent
+from algorithms.loss_functions.bc import BCLoss
+from algorithms.loss_functions.iqlearn import IQLearnLoss
+from core import distributed
+from core.data_augmentation import DataAugmentation
+from core.gpu import GPULoader
+from core.mixed_precision import MixedPrecision
+from core.state import split_transitions
+
+import itertools
+import math
+import time
+
+import torch as th
+from torch.utils.data import DataLoader
+import wandb
+
+
+def memory_used(device):
+    """
+    Peak memory used since the last reset, as a fraction of what the device has, or
+    None on the cpu, where the peak of a single setting can not be measured.
+    """
+    if device.type != 'cuda':
+        return None
+    return th.cuda.max_memory_allocated(device) \
+        / th.cuda.get_device_properties(device).total_memory
+
+
+class Autotuner:
+    """
+    Picks the batch size and dataloader worker count with the highest throughput.
+
+    Runs real training updates with the configured model and loss on batches of the
+    expert dataset. Batch sizes are tried in increasing order, until one uses more
+    than config.autotune_memory_budget of the gpu memory or runs out of memory,
+    and the one with the most samples per second is kept. On the cpu there is no
+    memory budget, only running out of memory stops the search. Then worker counts
+    are compared with that batch size, including the time spent waiting on the
+    dataloader. The chosen values are written into the config, and into the wandb
+    run config if logging to wandb.
+
+    With distributed training, rank 0 tunes alone and the other ranks wait for its
+    settings, so every rank trains with the same batch size and workers.
+    """
+    def __init__(self, config, expert_dataset):
+        self.config = config
+        self.expert_dataset = expert_dataset
+        self.device = th.device("cuda:0" if th.cuda.is_available() else "cpu")
+        self.gpu_loader = GPULoader(config)
+        self.augmentation = DataAugmentation(config)
+        self.mixed_precision = MixedPrecision(config, self.device)
+        self.updates = config.autotune_updates
+        self.memory_budget = config.autotune_memory_budget
+
+    def initialize_training(self, batch_size):
+        if self.config.method.loss_function == 'bc':
+            agent = BCAgent(self.config)
+            loss_function = BCLoss(agent, self.config)
+        else:
+            agent = SoftQAgent(self.config)
+            loss_function = IQLearnLoss(agent, self.config)
+        optimizer = th.optim.AdamW(agent.parameters(),
+                                   lr=self.config.method.learning_rate)
+        expert_batch_size = batch_size
+        if self.config.method.online:
+            expert_batch_size = math.floor(
+                batch_size * self.config.method.expert_sample_fraction)
+        return agent, loss_function, optimizer, expert_batch_size
+
+    def update(self, loss_function, optimizer, batch, expert_batch_size):
+        batch, _idx = batch
+        batch = self.gpu_loader.transitions_to_device(batch)
+        aug_batch = self.augmentation(batch)
+        with self.mixed_precision.autocast():
+            if self.config.method.online:
+                # the rest of the batch stands in for the replay batch
+                sections = [expert_batch_size, len(batch.action) - expert_batch_size]
+                expert, policy = split_transitions(aug_batch, sections)
+                expert_aug, policy_aug = split_transitions(batch, sections)
+                loss, _metrics, _final_hidden = loss_function(
+                    expert=expert, policy=policy, expert_aug=expert_aug,
+                    policy_aug=policy_aug)
+            else:
+                loss, _metrics, _final_hidden = loss_function(expert=aug_batch,
+                                                              expert_aug=batch)
+        self.mixed_precision.step(loss, optimizer)
+
+    def samples_per_second(self, batch_size, num_workers):
+        """Times updates at a batch size, returning samples/s and the memory used."""
+        if self.device.type == 'cuda':
+            th.cuda.empty_cache()
+            th.cuda.reset_peak_memory_stats(self.device)
+        _agent, loss_function, optimizer, expert_batch_size = \
+            self.initialize_training(batch_size)
+        dataloader = iter(DataLoader(self.expert_dataset, batch_size=batch_size,
+                                     shuffle=True, num_workers=num_workers,
+                                     drop_last=True))
+        self.update(loss_function, optimizer, next(dataloader), expert_batch_size)
+        if self.device.type == 'cuda':
+            th.cuda.synchronize()
+        start = time.perf_counter()
+        for batch in itertools.islice(dataloader, self.updates):
+            self.update(loss_function, optimizer, batch, expert_batch_size)
+        if self.device.type == 'cuda':
+            th.cuda.synchronize()
+        rate = self.updates * batch_size / (time.perf_counter() - start)
+        return rate, memory_used(self.device)
+
+    def tune_batch_size(self):
+        best_batch_size, best_rate = None, 0
+        for batch_size in sorted(self.config.autotune_batch_sizes):
+            if batch_size * (self.updates + 1) > len(self.expert_dataset):
+                print(f'Autotune: not enough expert data for batch size {batch_size}')
+                break
+            try:
+                rate, memory = self.samples_per_second(batch_size, num_workers=0)
+            except RuntimeError as error:
+                if 'out of memory' not in str(error):
+                    raise
+                print(f'Autotune: batch size {batch_size} ran out of memory')
+                break
+            if memory is None:
+                print(f'Autotune: batch size {batch_size}, {rate:.1f} samples/s')
+            else:
+                print(f'Autotune: batch size {batch_size}, {rate:.1f} samples/s,'
+                      f' {memory:.0%} of memory')
+            if memory is not None and memory > self.memory_budget:
+                break
+            if rate > best_rate:
+                best_batch_size, best_rate = batch_size, rate
+        return best_batch_size
+
+    def tune_workers(self, batch_size):
+        best_workers, best_rate = None, 0
+        for num_workers in self.config.autotune_workers:
+            rate, _memory = self.samples_per_second(batch_size, num_workers)
+            print(f'Autotune: {num_workers} workers, {rate:.1f} samples/s')
+            if rate > best_rate:
+                best_workers, best_rate = num_workers, rate
+        return best_workers
+
+    def tune(self):
+        """The batch size and worker count to use, or None if no batch size fit."""
+        print('Autotuning batch size and dataloader workers')
+        batch_size = self.tune_batch_size()
+        if batch_size is None:
+            return None
+        return batch_size, self.tune_workers(batch_size)
+
+    def __call__(self):
+        settings = self.tune() if distributed.get_rank() == 0 else None
+        settings = distributed.broadcast_object(settings)
+        if settings is None:
+            print('Autotune: no batch size fit, keeping the configured settings')
+            return self.config
+        batch_size, num_workers = settings
+        self.config.method.batch_size = batch_size
+        self.config.dataloader_workers = num_workers
+        print(f'Autotune: using batch size {batch_size} with {num_workers} workers')
+        if self.config.wandb:
+            wandb.config.update({'method.batch_size': batch_size,
+                                 'dataloader_workers': num_workers},
+                                allow_val_change=True)
+        return self.config
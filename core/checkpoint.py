@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+from pathlib import Path
+import re
+
+import torch as th
+
+
+def snapshot_state(state):
+    """
+    Copies the tensors of a nested state dict to the cpu, so that training can go
+    on updating the originals while the copy is written.
+    """
+    if isinstance(state, th.Tensor):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return {key: snapshot_state(value) for key, value in state.items()}
+    if isinstance(state, list):
+        return [snapshot_state(value) for value in state]
+    if isinstance(state, tuple):
+        return tuple(snapshot_state(value) for value in state)
+    return state
+
+
+class CheckpointWriter:
+    """
+    Writes checkpoints from a background thread.
+
+    The state is snapshot on the calling thread, which only takes as long as copying
+    it to the cpu, and saved by the writer thread. Each checkpoint is saved to a
+    temporary file and moved into place, so a run stopped mid write keeps its last
+    complete checkpoint. A write first waits for the one before it, so only one
+    snapshot is ever held, and errors from a write are raised by the next.
+    """
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1,
+                                           thread_name_prefix='checkpoint_writer')
+        self.pending = None
+
+    @staticmethod
+    def _save(state, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = path.with_suffix(path.suffix + '.tmp')
+        th.save(state, temporary_path)
+        os.replace(temporary_path, path)
+
+    def write(self, state, path):
+        state = snapshot_state(state)
+        self.wait()
+        self.pending = self.executor.submit(self._save, state, Path(path))
+
+    def wait(self):
+        """Blocks until the last checkpoint is written."""
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            pending.result()
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
+
+
+def latest_training_state(environment, algorithm_name, directory='train/state'):
+    """The most recently written training state of runs of an algorithm on an env."""
+    paths = list(Path(directory).glob(f'{environment}_{algorithm_name}_*.state'))
+    if len(paths) == 0:
+        raise FileNotFoundError(f'No training state of {algorithm_name}'
+                                f' on {environment} to resume in {directory}')
+    return max(paths, key=lambda path: path.stat().st_mtime)
+
+
+def latest_agent_path(environment, directory='train'):
+    """
+    The agent saved by the most recent run on an env, or None if there is none.
+
+    Runs are named {environment}_{algorithm}_{start time}, and only agents named
+    exactly for a run are considered. The run's exported agent is preferred, and
+    otherwise its weights are returned.
+    """
+    run_name = re.compile(rf'{re.escape(environment)}_.+_(\d+)')
+    runs = {}
+    for path in Path(directory).glob('*.pt*'):
+        match = run_name.fullmatch(path.stem)
+        if match is not None and path.suffix in ['.pt', '.pth']:
+            runs[path.stem] = int(match.group(1))
+    if len(runs) == 0:
+        return None
+    latest_run = max(runs, key=runs.get)
+    exported_path = Path(directory) / f'{latest_run}.pt'
+    return exported_path if exported_path.exists() \
+        else Path(directory) / f'{latest_run}.pth'
@@ -0,0 +1,125 @@
+from core.datasets import dataset_server_metadata, load_trajectory_store
+from core.trajectory_store import TrajectoryStore
+
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+import os
+import sys
+
+import numpy as np
+import torch as th
+
+AUTHKEY = b'basalt-dataset-server'
+
+
+def require_shared_memory():
+    """
+    Checks that multiprocessing.shared_memory, which the dataset server shares
+    the store with, is available. It was added in Python 3.8, so it is only
+    imported by the dataset server and the stores attached to it.
+    """
+    if sys.version_info < (3, 8):
+        raise RuntimeError('The dataset server needs multiprocessing.shared_memory,'
+                           ' from Python 3.8 on, set dataset_server false to load'
+                           f' the dataset in each run on Python {sys.version.split()[0]}')
+
+
+def attach_trajectory_store(address, expected) -> TrajectoryStore:
+    """
+    Maps the store served by a dataset server at the given address, read only.
+
+    expected holds the metadata the store must match, such as its frame shape.
+    Raises a ValueError if the server holds another
+    environment's dataset, or frames or hidden states of another shape.
+    """
+    require_shared_memory()
+    from multiprocessing import resource_tracker
+    from multiprocessing.shared_memory import SharedMemory
+
+    with Client(address, authkey=AUTHKEY) as connection:
+        connection.send('metadata')
+        metadata = connection.recv()
+    for key, value in expected.items():
+        if metadata.get(key) != value:
+            raise ValueError(f'The dataset server at {address} serves a dataset'
+                             f' with {key} {metadata.get(key)}, not {value}')
+    environment = metadata['environment']
+    tensors = {}
+    shared_memory = []
+    for name, (block_name, shape, dtype) in metadata['tensors'].items():
+        block = SharedMemory(name=block_name)
+        # the server owns the block, so it should not be unlinked when we exit
+        resource_tracker.unregister(block._name, 'shared_memory')
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        tensors[name] = th.from_numpy(array)
+        shared_memory.append(block)
+    print(f'Attached to the {environment} dataset server at {address}')
+    return TrajectoryStore(tensors, metadata['initial_hidden'], metadata['stats'],
+                           shared_memory)
+
+
+class DatasetServer:
+    """
+    Loads an expert dataset once and shares it read only with training processes.
+
+    The dataset is packed into a TrajectoryStore, and each of its tensors is copied
+    into a named shared memory block. Datasets built with config.dataset_server
+    connect to the server at config.dataset_server_port, receive the names, shapes
+    and dtypes of the blocks, and map them instead of loading the data themselves,
+    so the frames are in memory once however many runs use them. The blocks are
+    removed when the server stops.
+    """
+    def __init__(self, config, debug_dataset=False):
+        require_shared_memory()
+        from multiprocessing.shared_memory import SharedMemory
+
+        self.environment = config.env.name
+        self.port = config.dataset_server_port
+        store = load_trajectory_store(config, debug_dataset)
+        # what clients check their own config against before mapping the store
+        self.store_metadata = dataset_server_metadata(config)
+        self.store_metadata.update(frame_shape=store.frame_shape(),
+                                   hidden_size=store.initial_hidden.numel())
+        self.initial_hidden = store.initial_hidden
+        self.stats = store.stats
+        self.blocks = []
+        self.tensors = {}
+        for name in store.tensor_names:
+            array = getattr(store, name).numpy()
+            block = SharedMemory(create=True, size=max(array.nbytes, 1),
+                                 name=f'basalt_{self.environment}_{os.getpid()}_{name}')
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.tensors[name] = (block.name, array.shape, array.dtype.str)
+        shared_bytes = sum(block.size for block in self.blocks)
+        print(f'Sharing {len(store.trajectories)} trajectories'
+              f' in {shared_bytes / 2**20:.0f} MB of shared memory')
+
+    def metadata(self):
+        return {**self.store_metadata, 'tensors': self.tensors,
+                'initial_hidden': self.initial_hidden, 'stats': self.stats}
+
+    def serve(self):
+        """Answers metadata requests until interrupted, then frees the shared memory."""
+        address = ('localhost', self.port)
+        try:
+            with Listener(address, authkey=AUTHKEY) as listener:
+                print(f'Serving the {self.environment} dataset on port {self.port}')
+                while True:
+                    try:
+                        with listener.accept() as connection:
+                            request = connection.recv()
+                            if request == 'metadata':
+                                connection.send(self.metadata())
+                    except (AuthenticationError, ConnectionError, EOFError) as error:
+                        print(f'Dataset server connection failed: {error}')
+        except KeyboardInterrupt:
+            print('Stopping the dataset server')
+        finally:
+            self.close()
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
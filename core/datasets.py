@@ -1,10 +1,13 @@
+from core import distributed
+from core.action_index import ActionIndex
+from core.environment import create_context
+from core.samplers import StratifiedSampler, WeightedSampler
 from core.trajectories import Trajectory
+from core.trajectory_store import TrajectoryStore
 from core.trajectory_viewer import TrajectoryViewer
 from contexts.minerl.dataset import MineRLDatasetBuilder
 
-from collections import deque
-
-import torch as th
+import numpy as np
 import math
 import random
 
@@ -12,18 +15,99 @@ from torch.utils.data import Dataset, DataLoader
 from torch.utils.data.dataloader import default_collate
 
 
+def dataset_server_metadata(config):
+    """
+    The environment, observation frames, stacked frame shape and hidden state size
+    of the expert data a config trains on, which a dataset server's store must match.
+    """
+    context = create_context(config)
+    frames = config.model.n_observation_frames
+    return {'environment': config.env.name, 'observation_frames': frames,
+            'frame_shape': (3 * frames, *context.frame_shape[1:]),
+            'hidden_size': context.initial_hidden.numel()}
+
+
+def load_trajectory_store(config, debug_dataset=False):
+    """Loads the expert trajectories of the configured environment into a store."""
+    if config.context.name == 'MineRL':
+        dataset_builder = MineRLDatasetBuilder(config, debug_dataset)
+    trajectories, _step_lookup, stats = dataset_builder.load_data()
+    # each trajectory's frames are freed once packed, so they are not held twice
+    return TrajectoryStore.from_trajectories(
+        trajectories, stats, release=True, compress_frames=config.compress_frames,
+        compression_level=config.frame_compression_level)
+
+
 class TrajectoryStepDataset(Dataset):
-    def __init__(self, config, debug_dataset=False):
-        if config.context.name == 'MineRL':
-            dataset_builder = MineRLDatasetBuilder(config, debug_dataset)
-        self.trajectories, self.step_lookup, self.stats = dataset_builder.load_data()
+    """
+    The expert trajectories, sampled one transition at a time.
+
+    The data is held in a TrajectoryStore of flat tensors, and the lookups are numpy
+    arrays, so dataloader workers forked from the training process share their
+    pages rather than copying them as reference counts change. The store is loaded,
+    mapped from the dataset server with config.dataset_server, or given directly.
+    """
+    def __init__(self, config, debug_dataset=False, store=None):
+        if store is None and config.dataset_server:
+            # the frames are mapped from the dataset server's shared memory
+            from core.dataset_server import attach_trajectory_store
+            store = attach_trajectory_store(('localhost', config.dataset_server_port),
+                                            dataset_server_metadata(config))
+        elif store is None:
+            store = load_trajectory_store(config, debug_dataset)
+        self.store = store
+        self.seed = config.seed
+        self.trajectories = store.trajectories
+        self.step_lookup = store.step_lookup()
+        self.stats = store.stats
         if 'entropy' in self.stats.keys():
             self.expert_policy_entropy = self.stats['entropy']
         self.master_lookup = self.step_lookup
+        self.master_fractions = self._fractions_through_trajectories(self.master_lookup)
         self.active_lookup = self.step_lookup
-        # to recover step index when using a different lookup array when sampling
+        # master index of each active index, when the active lookup is a selection
         self.cross_lookup = None
-        print(f'Expert dataset initialized with {len(self.step_lookup)} steps')
+        self.sampler = self._initialize_sampler(config)
+        self.items_available = create_context(config).items_available
+        self.action_index = ActionIndex.from_store(store, self.master_lookup,
+                                                   self.items_available)
+        self.stratify_by = config.dataset.stratify_by
+        self.class_balance = config.dataset.class_balance
+        if self.stratify_by and config.dataset.curriculum_training:
+            raise ValueError('Stratified expert sampling cannot be combined with'
+                             ' curriculum training')
+        print(f'Expert dataset initialized with {len(self.step_lookup)} steps,'
+              f' {store.bytes_per_step():.0f} bytes per step')
+
+    def _initialize_sampler(self, config):
+        """
+        A WeightedSampler over the master lookup, for the curriculum to weight, if
+        config.dataset.weighted_sampling is set. The active lookup is then left as
+        the master lookup, so the curriculum never rebuilds it.
+        """
+        if not config.dataset.weighted_sampling:
+            return None
+        return WeightedSampler(np.ones(len(self.master_lookup)),
+                               seed=self.seed + distributed.get_rank(),
+                               world_size=distributed.get_world_size())
+
+    def stratified_sampler(self, batch_size):
+        """
+        A StratifiedSampler drawing batches of master indices by
+        config.dataset.stratify_by, or None if it is not set.
+        """
+        if not self.stratify_by:
+            return None
+        return StratifiedSampler(self.action_index.class_index(self.stratify_by),
+                                 batch_size, class_balance=self.class_balance,
+                                 seed=self.seed + distributed.get_rank(),
+                                 world_size=distributed.get_world_size())
+
+    def _fractions_through_trajectories(self, lookup):
+        """How far through its trajectory each step of a lookup is, from 0 to 1."""
+        trajectory_lengths = np.array([len(trajectory)
+                                       for trajectory in self.trajectories])
+        return lookup[:, 1] / trajectory_lengths[lookup[:, 0]]
 
     def __len__(self):
         return len(self.active_lookup)
@@ -31,7 +115,8 @@ class TrajectoryStepDataset(Dataset):
     def __getitem__(self, idx):
         trajectory_idx, step_idx = self.active_lookup[idx]
         sample = self.trajectories[trajectory_idx][step_idx]
-        master_idx = self.cross_lookup[idx] if self.cross_lookup is not None else idx
+        master_idx = int(self.cross_lookup[idx]) if self.cross_lookup is not None \
+            else idx
         return sample, master_idx
 
 
@@ -41,28 +126,30 @@ class TrajectorySequenceDataset(TrajectoryStepDataset):
         self.sequence_length = config.model.lstm_sequence_length
         self.sequence_lookup = self._identify_sequences()
         self.master_lookup = self.sequence_lookup
+        self.master_fractions = self._fractions_through_trajectories(self.master_lookup)
         self.active_lookup = self.sequence_lookup
+        self.sampler = self._initialize_sampler(config)
+        self.action_index = ActionIndex.from_store(self.store, self.master_lookup,
+                                                   self.items_available)
         print(f'Identified {len(self.sequence_lookup)} sub-sequences'
               f' of {self.sequence_length} steps')
 
     def _identify_sequences(self):
-        sequences = []
-        for trajectory_idx, step_idx in self.step_lookup:
-            if step_idx >= self.sequence_length - 1:
-                sequences.append((trajectory_idx, step_idx))
-        return sequences
+        return self.step_lookup[self.step_lookup[:, 1] >= self.sequence_length - 1]
 
     def __len__(self):
         return len(self.active_lookup)
 
     def __getitem__(self, idx):
         trajectory_idx, last_step_idx = self.active_lookup[idx]
-        master_idx = self.cross_lookup[idx] if self.cross_lookup is not None else idx
+        master_idx = int(self.cross_lookup[idx]) if self.cross_lookup is not None \
+            else idx
         sample = self.trajectories[trajectory_idx].get_sequence(last_step_idx,
                                                                 self.sequence_length)
         return sample, master_idx
 
     def update_hidden(self, indices, hidden):
+        hidden = hidden.cpu()
         for sequence_idx, hidden in zip(indices.tolist(), hidden.unbind(dim=0)):
             trajectory_idx, step_idx = self.sequence_lookup[sequence_idx]
             self.trajectories[trajectory_idx].update_hidden(step_idx, hidden)
@@ -70,11 +157,16 @@ class TrajectorySequenceDataset(TrajectoryStepDataset):
 
 class ReplayBuffer:
     def __init__(self, config, initial_replay_buffer=None):
-        self.trajectories = [Trajectory()]
+        self.compress_frames = config.compress_frames
+        self.frame_compression_level = config.frame_compression_level
+        self.trajectories = [self._empty_trajectory()]
         self.step_lookup = []
         if initial_replay_buffer is not None:
             self.trajectories = initial_replay_buffer.trajectories
             self.step_lookup = initial_replay_buffer.step_lookup
+            if self.compress_frames:
+                for trajectory in self.trajectories:
+                    trajectory.compress_states(self.frame_compression_level)
 
     def __len__(self):
         return len(self.step_lookup)
@@ -84,6 +176,12 @@ class ReplayBuffer:
         sample = self.trajectories[trajectory_idx][step_idx]
         return sample, idx
 
+    def _empty_trajectory(self):
+        trajectory = Trajectory()
+        if self.compress_frames:
+            trajectory.compress_states(self.frame_compression_level)
+        return trajectory
+
     def current_trajectory(self):
         return self.trajectories[-1]
 
@@ -91,25 +189,47 @@ class ReplayBuffer:
         return self.current_trajectory().current_state()
 
     def new_trajectory(self):
-        self.trajectories.append(Trajectory())
+        self.trajectories.append(self._empty_trajectory())
+        return len(self.trajectories) - 1
 
-    def append_step(self, action, reward, next_state, done, **kwargs):
-        self.current_trajectory().append_step(action, reward, next_state, done, **kwargs)
-        self.increment_step()
+    def append_step(self, action, reward, next_state, done, trajectory_idx=-1, **kwargs):
+        trajectory_idx = trajectory_idx % len(self.trajectories)
+        self.trajectories[trajectory_idx].append_step(action, reward, next_state, done,
+                                                      **kwargs)
+        self.increment_step(trajectory_idx)
 
-    def increment_step(self):
+    def increment_step(self, trajectory_idx=-1):
+        trajectory_idx = trajectory_idx % len(self.trajectories)
         self.step_lookup.append(
-            (len(self.trajectories) - 1, len(self.current_trajectory().actions) - 1))
+            (trajectory_idx, len(self.trajectories[trajectory_idx].actions) - 1))
+
+    def append_trajectory(self, trajectory):
+        """Adds a trajectory that was collected elsewhere, such as by a worker process"""
+        # views of a TrajectoryStore, such as the expert data, are compressed by the store
+        if self.compress_frames and isinstance(trajectory, Trajectory):
+            trajectory.compress_states(self.frame_compression_level)
+        self.trajectories.append(trajectory)
+        trajectory_idx = len(self.trajectories) - 1
+        self.step_lookup.extend([(trajectory_idx, step_idx)
+                                 for step_idx in range(len(trajectory))])
+        return trajectory_idx
 
     def sample(self, batch_size):
+        """
+        A random batch of the buffer's steps. Compressed frames are decompressed
+        here, synchronously on the calling training thread.
+        """
         replay_batch_size = min(batch_size, len(self.step_lookup))
         sample_indices = random.sample(range(len(self.step_lookup)), replay_batch_size)
-        print(self.step_lookup)
-        print(sample_indices)
         replay_batch = [self[idx] for idx in sample_indices]
         batch = default_collate(replay_batch)
         return batch
 
+    def bytes_per_step(self):
+        """The memory held by the buffer's states, per step."""
+        nbytes = sum(trajectory.states_nbytes() for trajectory in self.trajectories)
+        return nbytes / max(1, len(self.step_lookup))
+
     def recent_frames(self, number_of_steps):
         return TrajectoryViewer.dataset_recent_frames(self, number_of_steps)
 
@@ -131,13 +251,21 @@ class SequenceReplayBuffer(ReplayBuffer):
                                                                 self.sequence_length)
         return sample, idx
 
-    def increment_step(self):
-        super().increment_step()
-        if len(self.current_trajectory()) > self.sequence_length + 1:
-            self.sequence_lookup.append(
-                (len(self.trajectories) - 1, len(self.current_trajectory().actions) - 1))
+    def increment_step(self, trajectory_idx=-1):
+        super().increment_step(trajectory_idx)
+        trajectory_idx = trajectory_idx % len(self.trajectories)
+        trajectory = self.trajectories[trajectory_idx]
+        if len(trajectory) > self.sequence_length + 1:
+            self.sequence_lookup.append((trajectory_idx, len(trajectory.actions) - 1))
+
+    def append_trajectory(self, trajectory):
+        trajectory_idx = super().append_trajectory(trajectory)
+        self.sequence_lookup.extend([(trajectory_idx, step_idx) for step_idx
+                                     in range(self.sequence_length + 1, len(trajectory))])
+        return trajectory_idx
 
     def sample(self, batch_size):
+        """A random batch of sequences, decompressed on the calling thread."""
         replay_batch_size = min(batch_size, len(self.sequence_lookup))
         sample_indices = random.sample(
             range(len(self.sequence_lookup)), replay_batch_size)
@@ -146,10 +274,10 @@ class SequenceReplayBuffer(ReplayBuffer):
         return batch
 
     def update_hidden(self, indices, hidden):
+        hidden = hidden.cpu()
         for sequence_idx, hidden in zip(indices.tolist(), hidden.unbind(dim=0)):
             trajectory_idx, step_idx = self.sequence_lookup[sequence_idx]
             self.trajectories[trajectory_idx].update_hidden(step_idx, hidden)
-            _, _, next_state, _, _ = self.trajectories[trajectory_idx][step_idx]
 
 
 class MixedReplayBuffer(ReplayBuffer):
@@ -166,13 +294,18 @@ class MixedReplayBuffer(ReplayBuffer):
         self.expert_batch_size = math.floor(batch_size * self.expert_sample_fraction)
         self.replay_batch_size = self.batch_size - self.expert_batch_size
         self.expert_dataset = expert_dataset
+        self.num_workers = config.dataloader_workers
         self.expert_dataloader = self._initialize_dataloader()
 
     def _initialize_dataloader(self):
+        sampler = self.expert_dataset.sampler
+        if sampler is None:
+            sampler = self.expert_dataset.stratified_sampler(self.expert_batch_size)
         return iter(DataLoader(self.expert_dataset,
-                               shuffle=True,
+                               shuffle=sampler is None,
+                               sampler=sampler,
                                batch_size=self.expert_batch_size,
-                               num_workers=4,
+                               num_workers=self.num_workers,
                                drop_last=True))
 
     def sample_replay(self):
@@ -0,0 +1,141 @@
+import os
+import random
+
+import torch as th
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def initialize(config):
+    """
+    Joins the gloo process group described by the environment, if there is one.
+
+    Processes started by launch, or by torchrun on one or more nodes, find their
+    rank, the world size and the master address in the environment. Python's random
+    module is seeded the same way on every rank, so that the curriculum filters the
+    expert dataset identically everywhere.
+    """
+    if is_distributed() or int(os.environ.get('WORLD_SIZE', 1)) <= 1:
+        return False
+    dist.init_process_group('gloo')
+    random.seed(config.seed)
+    th.manual_seed(config.seed + get_rank())
+    print(f'Joined process group as rank {get_rank()} of {get_world_size()}')
+    return True
+
+
+def _run_process(process_rank, fn, processes, args):
+    os.environ['RANK'] = str(process_rank)
+    os.environ['LOCAL_RANK'] = str(process_rank)
+    os.environ['WORLD_SIZE'] = str(processes)
+    try:
+        fn(*args)
+    finally:
+        if is_distributed():
+            dist.destroy_process_group()
+
+
+def launch(fn, processes, *args, master_port=29500):
+    """
+    Runs fn(*args) in the given number of local processes, and waits for them.
+
+    Each process joins the process group when fn calls initialize.
+    """
+    os.environ.setdefault('MASTER_ADDR', 'localhost')
+    os.environ.setdefault('MASTER_PORT', str(master_port))
+    th.multiprocessing.start_processes(_run_process, args=(fn, processes, args),
+                                       nprocs=processes, start_method='spawn')
+
+
+def broadcast_parameters(module):
+    """Copies the parameters and buffers of rank 0's module to every rank."""
+    if not is_distributed():
+        return
+    with th.no_grad():
+        for tensor in [*module.parameters(), *module.buffers()]:
+            dist.broadcast(tensor.data, src=0)
+
+
+def all_reduce_gradients(parameters):
+    """
+    Averages the gradients of the parameters over all ranks.
+
+    The gradients are flattened into a single buffer, so each update makes one
+    all reduce call rather than one per parameter.
+    """
+    if not is_distributed():
+        return
+    parameters = [parameter for parameter in parameters if parameter.grad is not None]
+    if len(parameters) == 0:
+        return
+    flat_gradients = th.cat([parameter.grad.reshape(-1) for parameter in parameters])
+    dist.all_reduce(flat_gradients)
+    flat_gradients /= get_world_size()
+    offset = 0
+    for parameter in parameters:
+        numel = parameter.grad.numel()
+        parameter.grad.copy_(
+            flat_gradients[offset:offset + numel].view_as(parameter.grad))
+        offset += numel
+
+
+def any_rank(flag):
+    """Whether the flag is set on any rank, so that all ranks stop together."""
+    if not is_distributed():
+        return flag
+    flag = th.tensor([int(flag)])
+    dist.all_reduce(flag, op=dist.ReduceOp.MAX)
+    return bool(flag.item())
+
+
+def broadcast_object(value):
+    """Rank 0's value of a picklable object, returned on every rank."""
+    if not is_distributed():
+        return value
+    values = [value]
+    dist.broadcast_object_list(values, src=0)
+    return values[0]
+
+
+class DistributedTrajectorySampler(Sampler):
+    """
+    Samples each rank's share of a trajectory dataset, shuffled anew every epoch.
+
+    Like torch's DistributedSampler, but the dataset length is read when each epoch
+    starts, so the active_lookup set by the curriculum is respected as it changes.
+    Every rank draws the same permutation from the shared seed and epoch, and takes
+    an equal, disjoint share of it, dropping the remainder, so that all ranks run
+    the same number of updates.
+    """
+    def __init__(self, dataset, seed=0, rank=None, world_size=None):
+        self.dataset = dataset
+        self.seed = seed
+        self.epoch = 0
+        self.rank = rank if rank is not None else get_rank()
+        self.world_size = world_size if world_size is not None \
+            else get_world_size()
+
+    def __len__(self):
+        return len(self.dataset) // self.world_size
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        generator = th.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        samples = len(self) * self.world_size
+        indices = th.randperm(len(self.dataset), generator=generator)[:samples]
+        return iter(indices[self.rank:samples:self.world_size].tolist())
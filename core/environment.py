@@ -4,6 +4,7 @@ from contexts.minerl.environment import Context, MineRLContext
 from core.state import State
 
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import gym
 from omegaconf import OmegaConf
@@ -15,11 +16,45 @@ def start_env(config: OmegaConf, debug_env: bool = False) -> gym.Env:
     context = config.context.name
     if context == 'MineRL':
         env = minerl_env.start_env(config, debug_env)
+        if config.context.standby_env:
+            env = StandbyEnv(env, minerl_env.start_env(config, debug_env))
     return env
 
 
+def is_debug_env(env: gym.Env) -> bool:
+    """Checks whether the env is a simulated debug env."""
+    return isinstance(env.unwrapped, minerl_env.MineRLDebugEnv)
+
+
 def create_context(config: OmegaConf) -> Context:
     """Looks up the context from config and returns the correct context."""
     if config.context.name == 'MineRL':
         context = MineRLContext(config)
     return context
+
+
+class StandbyEnv(gym.Wrapper):
+    """
+    Hides reset latency by keeping a second environment resetting in the background.
+
+    While the current episode runs, the standby environment resets on a background
+    thread. Calling reset swaps the two, so it only waits for whatever is left of the
+    standby reset, and then starts resetting the environment that was just retired.
+    """
+    def __init__(self, env: gym.Env, standby_env: gym.Env):
+        super().__init__(env)
+        self.standby_env = standby_env
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.standby_reset = self.executor.submit(self.standby_env.reset)
+
+    def reset(self, **kwargs):
+        obs = self.standby_reset.result()
+        self.env, self.standby_env = self.standby_env, self.env
+        self.standby_reset = self.executor.submit(self.standby_env.reset)
+        return obs
+
+    def close(self):
+        self.standby_reset.result()
+        self.executor.shutdown()
+        self.standby_env.close()
+        return self.env.close()
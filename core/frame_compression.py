@@ -0,0 +1,130 @@
+from core.state import State
+
+import zlib
+
+import numpy as np
+import torch as th
+
+
+def compress_frame(frame: th.Tensor, level=1) -> bytes:
+    """Compresses a uint8 spatial tensor, such as a stack of frames, with zlib."""
+    if frame.dtype != th.uint8:
+        raise ValueError(f'Only uint8 frames can be compressed, not {frame.dtype}')
+    return zlib.compress(frame.contiguous().numpy().tobytes(), level)
+
+
+def decompress_frame(data, shape) -> th.Tensor:
+    array = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(shape)
+    # frombuffer arrays are read only, and the frame should own its memory
+    return th.from_numpy(array.copy())
+
+
+def tensor_nbytes(tensor: th.Tensor) -> int:
+    return tensor.numel() * tensor.element_size()
+
+
+def state_nbytes(state: State) -> int:
+    return sum(tensor_nbytes(component) for component in state)
+
+
+class CompressedStates:
+    """
+    The states of a Trajectory, with their frames compressed.
+
+    Used in place of the list of states, it compresses the spatial tensor of each
+    state as it is added, and decompresses it when the state is read, so frames
+    are decompressed by whichever process samples them, such as a dataloader
+    worker. Consecutive states of stacked frames repeat most of their frames, which
+    zlib finds within a single state's stack, so no state depends on another.
+    """
+    def __init__(self, states=(), level=1):
+        self.level = level
+        self.clear()
+        for state in states:
+            self.append(state)
+
+    def _entry_nbytes(self, idx):
+        return len(self.frames[idx]) + tensor_nbytes(self.nonspatial[idx]) \
+            + tensor_nbytes(self.hidden[idx])
+
+    def append(self, state: State):
+        self.frames.append(compress_frame(state.spatial, self.level))
+        self.shapes.append(tuple(state.spatial.size()))
+        self.nonspatial.append(state.nonspatial)
+        self.hidden.append(state.hidden)
+        self.nbytes += self._entry_nbytes(-1)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[state_idx] for state_idx in range(*idx.indices(len(self)))]
+        return State(decompress_frame(self.frames[idx], self.shapes[idx]),
+                     self.nonspatial[idx], self.hidden[idx])
+
+    def __setitem__(self, idx, state: State):
+        self.nbytes -= self._entry_nbytes(idx)
+        self.frames[idx] = compress_frame(state.spatial, self.level)
+        self.shapes[idx] = tuple(state.spatial.size())
+        self.nonspatial[idx] = state.nonspatial
+        self.hidden[idx] = state.hidden
+        self.nbytes += self._entry_nbytes(idx)
+
+    def __iter__(self):
+        return (self[idx] for idx in range(len(self)))
+
+    def set_hidden(self, idx, hidden):
+        """Replaces a state's hidden state, without recompressing its frames."""
+        self.nbytes += tensor_nbytes(hidden) - tensor_nbytes(self.hidden[idx])
+        self.hidden[idx] = hidden
+
+    def clear(self):
+        self.frames = []
+        self.shapes = []
+        self.nonspatial = []
+        self.hidden = []
+        self.nbytes = 0
+
+
+class CompressedFrames:
+    """
+    Compressed frames packed into one flat byte tensor, read like a tensor of frames.
+
+    Frame idx is compressed in data[offsets[idx]:offsets[idx + 1]], and every frame
+    has the given shape. Indexing with an int returns a frame, and with a slice the
+    frames in it stacked.
+    """
+    def __init__(self, data, offsets, shape):
+        self.data = data
+        self.offsets = offsets
+        self.shape = tuple(int(size) for size in shape)
+
+    @classmethod
+    def from_frames(cls, frames, level=1) -> 'CompressedFrames':
+        compressed = [compress_frame(frame, level) for frame in frames]
+        shape = frames[0].size() if len(frames) > 0 else ()
+        return cls.from_compressed(compressed, shape)
+
+    @classmethod
+    def from_compressed(cls, compressed, shape) -> 'CompressedFrames':
+        offsets = np.cumsum([0, *[len(frame) for frame in compressed]])
+        data = np.frombuffer(b''.join(compressed), dtype=np.uint8).copy()
+        return cls(th.from_numpy(data), th.LongTensor(offsets), shape)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            frames = [self[frame_idx] for frame_idx in range(*idx.indices(len(self)))]
+            return th.stack(frames) if len(frames) > 0 \
+                else th.zeros((0, *self.shape), dtype=th.uint8)
+        if idx < 0:
+            idx += len(self)
+        start, end = self.offsets[idx].item(), self.offsets[idx + 1].item()
+        return decompress_frame(self.data[start:end].numpy(), self.shape)
+
+    @property
+    def nbytes(self):
+        return self.data.numel() + self.offsets.numel() * self.offsets.element_size()
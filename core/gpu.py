@@ -1,4 +1,4 @@
-from core.state import State, Transition, sequence_to_transitions
+from core.state import State, Transition, sequence_to_transitions, update_hidden
 from contexts.minerl.environment import MineRLContext
 
 from typing import Iterable, NamedTuple, Tuple
@@ -17,9 +17,17 @@ class GPULoader:
     Batch of states: states_to_device
     Batch of transitions: transitions_to_device
     Batch of sequences: transitions_to_device
+
+    For acting, acting_state_to_device loads a single state into preallocated device
+    buffers and normalizes it in place. start_host_copy and finish_host_copy move a
+    tensor back to the host without blocking in between.
+
+    Loads onto the gpu if there is one, unless another device is given.
     """
-    def __init__(self, config):
-        self.device = th.device("cuda:0" if th.cuda.is_available() else "cpu")
+    def __init__(self, config, device=None):
+        if device is None:
+            device = th.device("cuda:0" if th.cuda.is_available() else "cpu")
+        self.device = device
         if config.context.name == 'MineRL':
             context = MineRLContext(config)
         self.load_sequences = config.model.lstm_layers > 0
@@ -36,6 +44,12 @@ class GPULoader:
                 3, 1, 1).tile((config.model.n_observation_frames, 1, 1)),
             th.FloatTensor([0.229, 0.224, 0.225]).to(self.device).reshape(
                 3, 1, 1).tile((config.model.n_observation_frames, 1, 1)))
+        # both spatial normalizations folded into a single scale and shift
+        spatial_scale = self.mobilenet_normalization[1] / stdevs
+        self.spatial_scale_shift = (
+            spatial_scale, self.mobilenet_normalization[0] - means * spatial_scale)
+        self.staging_buffers = [None] * len(State._fields)
+        self.host_buffer = None
 
     def normalize_state(self, state: State) -> State:
         """Normalizes a state on the gpu according to config"""
@@ -61,6 +75,56 @@ class GPULoader:
         state = self.normalize_state(state)
         return state
 
+    def acting_state_to_device(self, state: State, hidden: th.Tensor = None) -> State:
+        """
+        Loads a single state into the staging buffers on the gpu and normalizes it.
+
+        Returns views of the staging buffers, which are overwritten on the next call, so
+        the returned state has to be consumed right away, as it is when acting. If a
+        hidden state that is already on the gpu is given, it is used in place of the
+        hidden component of the state.
+        """
+        if hidden is not None:
+            state = update_hidden(state, hidden)
+        staged_state = []
+        for component_idx, state_component in enumerate(state):
+            buffer = self.staging_buffers[component_idx]
+            if buffer is None or buffer.numel() != state_component.numel():
+                leading_dims = (1, 1) if self.load_sequences else (1,)
+                buffer = th.empty((*leading_dims, *state_component.size()),
+                                  dtype=th.float, device=self.device)
+                self.staging_buffers[component_idx] = buffer
+            buffer.view(state_component.size()).copy_(state_component, non_blocking=True)
+            staged_state.append(buffer)
+        spatial, nonspatial, _hidden = staged_state
+        if self.normalize_obs:
+            spatial.mul_(self.spatial_scale_shift[0]).add_(self.spatial_scale_shift[1])
+        else:
+            spatial.div_(255.0)
+        nonspatial.div_(self.nonspatial_normalization)
+        return State(*staged_state)
+
+    def start_host_copy(self, tensor: th.Tensor) -> th.Tensor:
+        """
+        Starts copying a tensor from the gpu into a pinned host buffer without waiting.
+
+        The result has to be passed to finish_host_copy before it is read.
+        """
+        if tensor.device.type == 'cpu':
+            return tensor
+        if self.host_buffer is None or self.host_buffer.size() != tensor.size():
+            self.host_buffer = th.empty(tensor.size(), dtype=tensor.dtype,
+                                        pin_memory=True)
+        self.host_buffer.copy_(tensor, non_blocking=True)
+        return self.host_buffer
+
+    def finish_host_copy(self, host_tensor: th.Tensor) -> th.Tensor:
+        """Waits for a copy from start_host_copy and returns a tensor the caller owns."""
+        if host_tensor is not self.host_buffer:
+            return host_tensor
+        th.cuda.current_stream(self.device).synchronize()
+        return host_tensor.clone()
+
     def states_to_device(self, tuple_of_states: Iterable) -> Tuple:
         """Loads a tuple of states or batches of states onto the gpu."""
         states = []
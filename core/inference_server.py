@@ -0,0 +1,154 @@
+from agents.soft_q import SoftQAgent
+from core.gpu import GPULoader
+from core.shared_policy import SharedPolicy
+
+import queue
+import time
+
+import numpy as np
+import torch as th
+import torch.multiprocessing as mp
+
+
+# indices into the shared statistics array
+REQUESTS, BATCHES, QUEUE_LATENCY, INFERENCE_LATENCY = range(4)
+
+
+def run_inference_server(config, shared_policy, request_queue, response_queues,
+                         statistics, stop_event, max_batch_size, max_latency):
+    """
+    Answers action requests from many clients with batched forward passes.
+
+    Waits for a first request, then keeps collecting requests until the batch is
+    full or max_latency seconds have passed since the first one arrived. Each
+    client's hidden state stays on the device between its requests.
+    """
+    agent = SoftQAgent(config)
+    gpu_loader = GPULoader(config)
+    hiddens = {}
+    while not stop_event.is_set():
+        try:
+            requests = [request_queue.get(timeout=0.1)]
+        except queue.Empty:
+            continue
+        deadline = time.time() + max_latency
+        while len(requests) < max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                requests.append(request_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        batch_start = time.time()
+        policy_version = shared_policy.sync(agent)
+        client_ids, spatials, nonspatials, reset_hiddens, sent_times = zip(*requests)
+        for client_id, reset_hidden in zip(client_ids, reset_hiddens):
+            if reset_hidden is not None:
+                hiddens[client_id] = th.from_numpy(reset_hidden).to(gpu_loader.device)
+        spatial = th.from_numpy(np.stack(spatials))
+        nonspatial = th.from_numpy(np.stack(nonspatials))
+        hidden = th.stack([hiddens[client_id] for client_id in client_ids]).float()
+        if gpu_loader.load_sequences:
+            spatial, nonspatial = spatial.unsqueeze(1), nonspatial.unsqueeze(1)
+            hidden = hidden.unsqueeze(1)
+        states, = gpu_loader.states_to_device(((spatial, nonspatial, hidden),))
+        actions, next_hiddens = agent.get_actions(states)
+
+        if not gpu_loader.load_sequences:
+            next_hiddens = hidden.reshape(len(requests), -1)
+        actions = actions.tolist()
+        host_hiddens = next_hiddens.cpu().numpy()
+        for request_idx, client_id in enumerate(client_ids):
+            hiddens[client_id] = next_hiddens[request_idx]
+            response_queues[client_id].put((actions[request_idx],
+                                             host_hiddens[request_idx], policy_version))
+
+        with statistics.get_lock():
+            statistics[REQUESTS] += len(requests)
+            statistics[BATCHES] += 1
+            statistics[QUEUE_LATENCY] += sum([batch_start - sent_time
+                                              for sent_time in sent_times])
+            statistics[INFERENCE_LATENCY] += time.time() - batch_start
+
+
+class InferenceClient:
+    """
+    Acts through an InferenceServer, in place of an agent in a TrajectoryGenerator.
+
+    Takes states as they come from the environment, since they are normalized and
+    batched on the server. The hidden state is kept on the server, and is reset
+    from the hidden component of the next state after reset_hidden is called.
+    """
+    raw_state_input = True
+
+    def __init__(self, client_id, request_queue, response_queue):
+        self.client_id = client_id
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+        self.reset = True
+        self.policy_version = 0
+
+    def reset_hidden(self):
+        self.reset = True
+
+    def get_action(self, state):
+        reset_hidden = state.hidden.numpy() if self.reset else None
+        self.request_queue.put((self.client_id, state.spatial.numpy(),
+                                state.nonspatial.numpy(), reset_hidden, time.time()))
+        self.reset = False
+        action, hidden, self.policy_version = self.response_queue.get()
+        return action, th.from_numpy(hidden)
+
+
+class InferenceServer:
+    """
+    Runs a single copy of the agent in its own process, serving many env processes.
+
+    Clients are created up front with client, and passed to the processes that use
+    them when those processes are started. The learner hot swaps the served weights
+    with publish.
+    """
+    def __init__(self, config, agent, n_clients, context=None):
+        self.context = mp.get_context('spawn') if context is None else context
+        self.max_batch_size = config.inference_max_batch_size
+        self.shared_policy = SharedPolicy(agent, self.context)
+        self.request_queue = self.context.Queue()
+        self.response_queues = [self.context.Queue() for _ in range(n_clients)]
+        self.statistics = self.context.Array('d', 4)
+        self.stop_event = self.context.Event()
+        self.process = self.context.Process(
+            target=run_inference_server,
+            args=(config, self.shared_policy, self.request_queue, self.response_queues,
+                  self.statistics, self.stop_event, self.max_batch_size,
+                  config.inference_max_latency_ms / 1000),
+            daemon=True)
+
+    def client(self, client_id):
+        return InferenceClient(client_id, self.request_queue,
+                               self.response_queues[client_id])
+
+    def start(self):
+        print(f'Starting inference server for {len(self.response_queues)} clients')
+        self.process.start()
+
+    def publish(self, agent):
+        self.shared_policy.publish(agent)
+
+    def metrics(self):
+        with self.statistics.get_lock():
+            requests, batches, queue_latency, inference_latency = self.statistics[:]
+        if batches == 0:
+            return {}
+        return {'Inference/mean_batch_size': requests / batches,
+                'Inference/batch_occupancy': requests / (batches * self.max_batch_size),
+                'Inference/queue_latency_ms': 1000 * queue_latency / requests,
+                'Inference/batch_latency_ms': 1000 * inference_latency / batches}
+
+    def stop(self):
+        self.stop_event.set()
+        self.process.join(timeout=30)
+        if self.process.is_alive():
+            self.process.terminate()
+        print('Inference server stopped')
@@ -0,0 +1,236 @@
+import json
+import numbers
+from pathlib import Path
+import queue
+import threading
+import time
+
+import numpy as np
+import torch as th
+import wandb
+
+
+def scalar(value):
+    """A metric as a float, or None if it is not a single number."""
+    if isinstance(value, th.Tensor):
+        return value.item() if value.numel() == 1 else None
+    if isinstance(value, (numbers.Number, np.number, np.bool_)):
+        return float(value)
+    return None
+
+
+class WindowAggregator:
+    """
+    Reduces the metrics recorded over a window of steps.
+
+    Each scalar metric is reduced to the statistics asked for, the mean under the
+    metric's own name and the others as metric/statistic. Other metrics, such as
+    histograms, keep their last value.
+    """
+    statistic_names = ['mean', 'min', 'max', 'last']
+
+    def __init__(self, statistics=('mean', 'min', 'max', 'last')):
+        for statistic in statistics:
+            if statistic not in self.statistic_names:
+                raise ValueError(f'Unknown metric statistic {statistic},'
+                                 f' choose from {self.statistic_names}')
+        self.statistics = list(statistics)
+        self.clear()
+
+    def clear(self):
+        self.counts = {}
+        self.sums = {}
+        self.mins = {}
+        self.maxs = {}
+        self.lasts = {}
+        self.others = {}
+        self.step = None
+
+    @property
+    def empty(self):
+        return self.step is None
+
+    def add(self, metrics, step):
+        for key, value in metrics.items():
+            number = scalar(value)
+            if number is None:
+                self.others[key] = value
+            elif key in self.counts:
+                self.counts[key] += 1
+                self.sums[key] += number
+                self.mins[key] = min(self.mins[key], number)
+                self.maxs[key] = max(self.maxs[key], number)
+                self.lasts[key] = number
+            else:
+                self.counts[key] = 1
+                self.sums[key] = self.mins[key] = self.maxs[key] = number
+                self.lasts[key] = number
+        self.step = step
+
+    def reduce(self):
+        reduced = dict(self.others)
+        for key, count in self.counts.items():
+            values = {'mean': self.sums[key] / count, 'min': self.mins[key],
+                      'max': self.maxs[key], 'last': self.lasts[key]}
+            for statistic in self.statistics:
+                name = key if statistic == 'mean' else f'{key}/{statistic}'
+                reduced[name] = values[statistic]
+        return reduced
+
+
+class NullSink:
+    """Discards metrics, to measure training without the cost of logging."""
+    def write(self, metrics, step):
+        return
+
+    def flush(self):
+        return
+
+    def close(self):
+        return
+
+
+class WandbSink:
+    def write(self, metrics, step):
+        wandb.log(metrics, step=step)
+
+    def flush(self):
+        return
+
+    def close(self):
+        return
+
+
+class JSONLSink:
+    """
+    Appends metrics to a JSON lines file, a line of scalars per write, so runs can
+    be logged without wandb. Other metrics, such as videos, are left out.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.file = None
+
+    def write(self, metrics, step):
+        if self.file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.file = open(self.path, 'a')
+        record = {'step': step, 'time': time.time()}
+        for key, value in metrics.items():
+            number = scalar(value)
+            if number is not None:
+                record[key] = number
+        self.file.write(json.dumps(record) + '\n')
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class MetricsLogger:
+    """
+    Logs metrics without blocking the training loop.
+
+    record and log only queue the metrics. A background thread converts them to
+    numbers, which for tensors on the gpu waits for the step that computed them,
+    and writes them to the sinks. Recorded metrics are reduced over windows of
+    window steps, each written at its last step. Logged metrics, such as episode
+    rewards and videos, are written unreduced, after the window before them, so
+    the sinks always see steps in order.
+    """
+    def __init__(self, sinks, window=1, statistics=('mean', 'min', 'max', 'last')):
+        self.sinks = sinks
+        self.window = window
+        self.aggregator = WindowAggregator(statistics)
+        self.window_start = None
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name='metrics_logger',
+                                       daemon=True)
+        self.thread.start()
+
+    def record(self, metrics, step):
+        """Queues the metrics of a training step, to be reduced over the window."""
+        self.queue.put(('record', metrics, step))
+
+    def log(self, metrics, step):
+        """Queues metrics to be written as they are."""
+        self.queue.put(('log', metrics, step))
+
+    def flush(self):
+        """Blocks until everything queued is written, including a partial window."""
+        written = threading.Event()
+        self.queue.put(('flush', written, None))
+        written.wait()
+
+    def close(self):
+        if not self.thread.is_alive():
+            return
+        self.flush()
+        self.queue.put(('close', None, None))
+        self.thread.join()
+
+    def _write(self, metrics, step):
+        for sink in self.sinks:
+            sink.write(metrics, step)
+
+    def _write_window(self):
+        if not self.aggregator.empty:
+            self._write(self.aggregator.reduce(), self.aggregator.step)
+            self.aggregator.clear()
+        self.window_start = None
+
+    def _handle(self, kind, payload, step):
+        if kind == 'record':
+            if self.window_start is None:
+                self.window_start = step
+            self.aggregator.add(payload, step)
+            if step - self.window_start + 1 >= self.window:
+                self._write_window()
+        elif kind == 'log':
+            self._write_window()
+            self._write(payload, step)
+        else:
+            self._write_window()
+            for sink in self.sinks:
+                if kind == 'flush':
+                    sink.flush()
+                else:
+                    sink.close()
+
+    def _run(self):
+        while True:
+            kind, payload, step = self.queue.get()
+            try:
+                self._handle(kind, payload, step)
+            except Exception as error:
+                print(f'Failed to log metrics at step {step}: {error!r}')
+            finally:
+                if kind == 'flush':
+                    payload.set()
+            if kind == 'close':
+                return
+
+
+def create_metrics_logger(config, name, rank=0):
+    """
+    A MetricsLogger writing to the sinks named by config.metrics_sinks: wandb, when
+    wandb is on, jsonl, to logs/{name}.jsonl, and null. Only rank 0 logs.
+    """
+    sinks = []
+    for sink_name in config.metrics_sinks if rank == 0 else []:
+        if sink_name == 'wandb':
+            if config.wandb:
+                sinks.append(WandbSink())
+        elif sink_name == 'jsonl':
+            sinks.append(JSONLSink(Path('logs') / f'{name}.jsonl'))
+        elif sink_name == 'null':
+            sinks.append(NullSink())
+        else:
+            raise ValueError(f'Unknown metrics sink {sink_name},'
+                             ' choose from wandb, jsonl and null')
+    return MetricsLogger(sinks or [NullSink()], config.metrics_window,
+                         config.metrics_statistics)
@@ -0,0 +1,47 @@
+import contextlib
+
+import torch as th
+
+
+class MixedPrecision:
+    """
+    Runs training forwards under autocast and scales fp16 gradients.
+
+    config.precision is fp32, bf16 or fp16. bf16 autocasts on cpu and cuda. fp16 is
+    only used on cuda, with a grad scaler, and falls back to bf16 on the cpu. With
+    fp32, autocast and scaling are both disabled, so training is unchanged.
+    """
+    def __init__(self, config, device):
+        precision = config.precision
+        if precision == 'fp16' and device.type != 'cuda':
+            print('fp16 training needs cuda, using bf16')
+            precision = 'bf16'
+        self.precision = precision
+        self.device_type = device.type
+        self.dtype = th.float16 if precision == 'fp16' else th.bfloat16
+        self.scaler = th.cuda.amp.GradScaler(enabled=precision == 'fp16')
+
+    def autocast(self):
+        if self.precision == 'fp32':
+            return contextlib.nullcontext()
+        return th.autocast(self.device_type, dtype=self.dtype)
+
+    def step(self, loss, optimizer, set_to_none=False, after_backward=None):
+        """
+        Backpropagates the loss and steps the optimizer, with gradient scaling.
+
+        after_backward is called between the two, for instance to average the
+        gradients over distributed ranks.
+        """
+        optimizer.zero_grad(set_to_none=set_to_none)
+        self.scaler.scale(loss).backward()
+        if after_backward is not None:
+            after_backward()
+        self.scaler.step(optimizer)
+        self.scaler.update()
+
+    def state_dict(self):
+        return {'scaler': self.scaler.state_dict()}
+
+    def load_state_dict(self, state_dict):
+        self.scaler.load_state_dict(state_dict['scaler'])
@@ -0,0 +1,221 @@
+from core.datasets import ReplayBuffer, SequenceReplayBuffer
+from core.state import State
+from core.trajectories import Trajectory
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import torch as th
+
+
+class MappedStates:
+    """
+    The states of a trajectory, read from a replay snapshot's memory mapped files.
+
+    The files are mapped copy on write, so states can be replaced, as their hidden
+    states are during training, without changing the snapshot. States appended
+    after the snapshot was opened are held in memory.
+    """
+    def __init__(self, arrays, records):
+        self.arrays = arrays
+        self.records = records
+        self.appended = []
+
+    def __len__(self):
+        return len(self.records) + len(self.appended)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[state_idx] for state_idx in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx >= len(self.records):
+            return self.appended[idx - len(self.records)]
+        record = self.records[idx]
+        return State(*[th.from_numpy(self.arrays[name][record])
+                       for name in ReplaySnapshot.state_components])
+
+    def __setitem__(self, idx, state: State):
+        if idx < 0:
+            idx += len(self)
+        if idx >= len(self.records):
+            self.appended[idx - len(self.records)] = state
+            return
+        for name, component in zip(ReplaySnapshot.state_components, state):
+            self.arrays[name][self.records[idx]] = component.numpy()
+
+    def __iter__(self):
+        return (self[idx] for idx in range(len(self)))
+
+    def append(self, state: State):
+        self.appended.append(state)
+
+    def clear(self):
+        self.records = self.records[:0]
+        self.appended = []
+
+
+class ReplaySnapshot:
+    """
+    Snapshots a replay buffer to a directory of flat binary files, and maps it back.
+
+    Each component of the states is appended to its own file, one fixed size record
+    per state, along with the trajectory the state belongs to, and likewise for the
+    actions, rewards and suppressed terminations of the steps. Each write only
+    appends what was added to the buffer since the last one, then replaces
+    metadata.json, which holds the record counts, each trajectory's done flag and
+    the states and steps written from it. Records past the counts, left by a write
+    that was interrupted, are truncated before the next write, so the last complete
+    snapshot always stays readable.
+
+    Opening a snapshot maps the files rather than reading them, so the frames are
+    only paged in as they are sampled.
+    """
+    state_components = ['spatial', 'nonspatial', 'hidden']
+    state_fields = [*state_components, 'state_trajectories']
+    step_fields = ['actions', 'rewards', 'suppressed_terminations', 'step_trajectories']
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.metadata_path = self.path / 'metadata.json'
+        if self.exists():
+            with open(self.metadata_path) as metadata_file:
+                self.metadata = json.load(metadata_file)
+        else:
+            self.metadata = None
+        self.truncated = False
+
+    def exists(self):
+        return self.metadata_path.exists()
+
+    def field_path(self, name):
+        return self.path / f'{name}.bin'
+
+    def _field_specs(self, state):
+        specs = {name: (component.numpy().dtype.str, list(component.size()))
+                 for name, component in zip(self.state_components, state)}
+        specs.update(state_trajectories=('<i8', []), actions=('<i8', []),
+                     rewards=('<f4', []), suppressed_terminations=('|b1', []),
+                     step_trajectories=('<i8', []))
+        return specs
+
+    def _record_count(self, name):
+        return self.metadata['state_count'] if name in self.state_fields \
+            else self.metadata['step_count']
+
+    def _truncate(self):
+        """Drops records past the counts, left by an interrupted write."""
+        for name, (dtype, shape) in self.metadata['fields'].items():
+            record_bytes = np.dtype(dtype).itemsize * int(np.prod(shape))
+            with open(self.field_path(name), 'ab') as field_file:
+                field_file.truncate(self._record_count(name) * record_bytes)
+        self.truncated = True
+
+    def write(self, replay_buffer):
+        """Appends the states and steps added to the replay buffer since last written."""
+        trajectories = replay_buffer.trajectories
+        if self.metadata is None:
+            first_states = [trajectory.states[0] for trajectory in trajectories
+                            if len(trajectory.states) > 0]
+            if len(first_states) == 0:
+                return
+            self.path.mkdir(parents=True, exist_ok=True)
+            self.metadata = dict(fields=self._field_specs(first_states[0]),
+                                 state_count=0, step_count=0, dones=[],
+                                 written_states=[], written_steps=[])
+            for name in self.metadata['fields'].keys():
+                self.field_path(name).write_bytes(b'')
+        elif not self.truncated:
+            self._truncate()
+
+        metadata = self.metadata
+        new_records = {name: [] for name in metadata['fields'].keys()}
+        for trajectory_idx, trajectory in enumerate(trajectories):
+            if trajectory_idx == len(metadata['dones']):
+                metadata['dones'].append(False)
+                metadata['written_states'].append(0)
+                metadata['written_steps'].append(0)
+            states_written = metadata['written_states'][trajectory_idx]
+            steps_written = metadata['written_steps'][trajectory_idx]
+            for state in trajectory.states[states_written:]:
+                for name, component in zip(self.state_components, state):
+                    new_records[name].append(component.numpy())
+                new_records['state_trajectories'].append(trajectory_idx)
+            new_steps = range(steps_written, len(trajectory.actions))
+            new_records['actions'].extend(trajectory.actions[steps_written:])
+            new_records['rewards'].extend(trajectory.rewards[steps_written:])
+            new_records['suppressed_terminations'].extend(
+                [trajectory.additional_step_data[step_idx].get(
+                    'suppressed_termination', False)
+                 if step_idx < len(trajectory.additional_step_data) else False
+                 for step_idx in new_steps])
+            new_records['step_trajectories'].extend([trajectory_idx] * len(new_steps))
+            metadata['written_states'][trajectory_idx] = len(trajectory.states)
+            metadata['written_steps'][trajectory_idx] = len(trajectory.actions)
+            metadata['dones'][trajectory_idx] = bool(trajectory.done)
+
+        for name, (dtype, shape) in metadata['fields'].items():
+            records = new_records[name]
+            if len(records) == 0:
+                continue
+            array = np.array(records, dtype=np.dtype(dtype)).reshape(-1, *shape)
+            with open(self.field_path(name), 'ab') as field_file:
+                field_file.write(array.tobytes())
+        metadata['state_count'] += len(new_records['state_trajectories'])
+        metadata['step_count'] += len(new_records['step_trajectories'])
+
+        temporary_path = self.metadata_path.with_suffix('.json.tmp')
+        with open(temporary_path, 'w') as metadata_file:
+            json.dump(metadata, metadata_file)
+        os.replace(temporary_path, self.metadata_path)
+        print(f'Replay snapshot at {self.path} updated to {metadata["step_count"]} steps')
+
+    def _map(self, name):
+        dtype, shape = self.metadata['fields'][name]
+        shape = (self._record_count(name), *shape)
+        if shape[0] == 0:
+            return np.zeros(shape, dtype=np.dtype(dtype))
+        return np.memmap(self.field_path(name), dtype=np.dtype(dtype), mode='c',
+                         shape=shape)
+
+    def _records_by_trajectory(self, record_trajectories, trajectory_count):
+        """The record indices of each trajectory, in the order they were written."""
+        order = np.argsort(record_trajectories, kind='stable')
+        bounds = np.searchsorted(record_trajectories[order],
+                                 np.arange(trajectory_count + 1))
+        return [order[bounds[idx]:bounds[idx + 1]] for idx in range(trajectory_count)]
+
+    def open(self, config):
+        """
+        Maps the snapshot as a replay buffer of the kind the config calls for, with
+        the trajectories at the same indices as in the buffer that was snapshot,
+        followed by a new empty trajectory.
+        """
+        arrays = {name: self._map(name) for name in self.metadata['fields'].keys()}
+        trajectory_count = len(self.metadata['dones'])
+        state_records = self._records_by_trajectory(arrays['state_trajectories'],
+                                                    trajectory_count)
+        step_records = self._records_by_trajectory(arrays['step_trajectories'],
+                                                   trajectory_count)
+        state_arrays = {name: arrays[name] for name in self.state_components}
+
+        replay_buffer = ReplayBuffer(config) if config.model.lstm_layers == 0 \
+            else SequenceReplayBuffer(config)
+        replay_buffer.trajectories = []
+        for trajectory_idx in range(trajectory_count):
+            trajectory = Trajectory()
+            trajectory.states = MappedStates(state_arrays, state_records[trajectory_idx])
+            steps = step_records[trajectory_idx]
+            trajectory.actions = arrays['actions'][steps].tolist()
+            trajectory.rewards = arrays['rewards'][steps].tolist()
+            trajectory.additional_step_data = [
+                {'suppressed_termination': suppressed} for suppressed
+                in arrays['suppressed_terminations'][steps].tolist()]
+            trajectory.done = self.metadata['dones'][trajectory_idx]
+            replay_buffer.append_trajectory(trajectory)
+        replay_buffer.new_trajectory()
+        print(f'Opened replay snapshot at {self.path}'
+              f' with {len(replay_buffer.step_lookup)} steps')
+        return replay_buffer
@@ -0,0 +1,131 @@
+import numpy as np
+from torch.utils.data import Sampler
+
+
+class SumTree:
+    """
+    Weights over a fixed number of items, with their partial sums in a binary tree.
+
+    Leaves hold the weights and every other node the sum of its two children, so
+    updating k weights and drawing n items take O(k log N) and O(n log N) time, for
+    N items, whatever the weights are. Both are vectorized over the given items.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.leaves = 1 << max(0, (capacity - 1).bit_length())
+        self.tree = np.zeros(2 * self.leaves)
+
+    def total(self):
+        return self.tree[1]
+
+    def weights(self):
+        return self.tree[self.leaves:self.leaves + self.capacity]
+
+    def update(self, indices, weights):
+        nodes = np.asarray(indices, dtype=np.int64) + self.leaves
+        if len(nodes) == 0:
+            return
+        self.tree[nodes] = weights
+        # parent sums are recomputed from their children, so no rounding error builds up
+        nodes = np.unique(nodes // 2)
+        while nodes[-1] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            if nodes[-1] == 1:
+                break
+            nodes = np.unique(nodes // 2)
+
+    def sample(self, n, rng):
+        """Draws n item indices with replacement, in proportion to their weights."""
+        targets = rng.random(n) * self.total()
+        nodes = np.ones(n, dtype=np.int64)
+        while nodes[0] < self.leaves:
+            left_children = 2 * nodes
+            left_sums = self.tree[left_children]
+            go_right = targets >= left_sums
+            targets = np.where(go_right, targets - left_sums, targets)
+            nodes = np.where(go_right, left_children + 1, left_children)
+        indices = nodes - self.leaves
+        # rounding can leave a target just past the last item with weight
+        missed = self.tree[nodes] == 0
+        if np.any(missed):
+            indices[missed] = self.sample(int(missed.sum()), rng)
+        return indices
+
+
+class WeightedSampler(Sampler):
+    """
+    Samples dataset indices with replacement, in proportion to updatable weights.
+
+    The weights are held in a SumTree, so changing some of them costs time in the
+    number changed, and drawing costs the same however the weight is spread. Each
+    pass over the sampler draws as many indices as there are items with weight,
+    divided between world_size ranks that each draw from their own seed.
+    Indices are drawn in chunks, so weight updates made while a dataloader iterates
+    take effect within chunk_size draws, without restarting it.
+    """
+    def __init__(self, weights, chunk_size=1024, seed=None, world_size=1):
+        self.tree = SumTree(len(weights))
+        self.tree.update(np.arange(len(weights)), weights)
+        self.chunk_size = chunk_size
+        self.rng = np.random.default_rng(seed)
+        self.world_size = world_size
+
+    def __len__(self):
+        return int(np.count_nonzero(self.tree.weights())) // self.world_size
+
+    def weights(self):
+        return self.tree.weights()
+
+    def update_weights(self, indices, weights):
+        self.tree.update(indices, weights)
+
+    def set_weights(self, weights):
+        """Sets every weight, only updating the tree where they changed."""
+        changed = np.flatnonzero(self.tree.weights() != weights)
+        self.tree.update(changed, np.asarray(weights)[changed])
+
+    def __iter__(self):
+        remaining = len(self)
+        while remaining > 0:
+            chunk = self.tree.sample(min(self.chunk_size, remaining), self.rng)
+            remaining -= len(chunk)
+            yield from chunk.tolist()
+
+
+class StratifiedSampler(Sampler):
+    """
+    Samples batches of dataset indices with set shares of each class.
+
+    Classes are given by a ClassIndex. Class probabilities are proportional to
+    their size raised to the power 1 - class_balance, so with a class_balance of 0
+    classes are sampled as often as they occur, and with 1 all are sampled equally.
+    Each consecutive batch_size draws are allocated between the classes
+    systematically, so each class gets the floor or ceiling of its expected share
+    of every batch, and items are drawn with replacement within their class. A
+    draw costs time in the number of classes, not the number of items.
+    """
+    def __init__(self, class_index, batch_size, class_balance=1.0, num_samples=None,
+                 seed=None, world_size=1):
+        self.class_index = class_index
+        self.batch_size = batch_size
+        probabilities = class_index.counts.astype(float) ** (1 - class_balance)
+        self.cumulative_probabilities = np.cumsum(probabilities / probabilities.sum())
+        self.num_samples = num_samples if num_samples is not None \
+            else int(class_index.counts.sum())
+        self.rng = np.random.default_rng(seed)
+        self.world_size = world_size
+
+    def __len__(self):
+        return self.num_samples // self.world_size
+
+    def __iter__(self):
+        remaining = len(self)
+        while remaining > 0:
+            size = min(self.batch_size, remaining)
+            remaining -= size
+            slots = (self.rng.random() + np.arange(size)) / size
+            positions = np.searchsorted(self.cumulative_probabilities, slots,
+                                        side='right')
+            positions = np.minimum(positions, len(self.class_index) - 1)
+            indices = self.class_index.sample(positions, self.rng)
+            yield from self.rng.permutation(indices).tolist()
@@ -0,0 +1,33 @@
+class SharedPolicy:
+    """
+    A versioned copy of an agent's weights held in shared memory.
+
+    The learner calls publish to copy its current weights in and bump the version.
+    Actors call sync, which only loads the weights when the version has changed
+    since their last sync, and returns the version they are now acting with.
+    """
+    def __init__(self, agent, context):
+        self.state_dict = {name: tensor.detach().cpu().clone().share_memory_()
+                           for name, tensor in agent.state_dict().items()}
+        self.alpha = context.Value('d', float(agent.alpha))
+        self.version = context.Value('i', 0)
+        self.local_version = -1
+
+    def publish(self, agent):
+        with self.version.get_lock():
+            for name, tensor in agent.state_dict().items():
+                self.state_dict[name].copy_(tensor.detach())
+            self.alpha.value = float(agent.alpha)
+            self.version.value += 1
+
+    def sync(self, agent):
+        if self.version.value == self.local_version:
+            return self.local_version
+        with self.version.get_lock():
+            agent.load_state_dict(self.state_dict, strict=False)
+            agent.alpha = self.alpha.value
+            self.local_version = self.version.value
+        return self.local_version
+
+    def current_version(self):
+        return self.version.value
@@ -1,6 +1,7 @@
 from collections import namedtuple
-from typing import Iterable, Tuple
+from typing import Iterable, List, Tuple
 
+import numpy as np
 import torch as th
 
 State = namedtuple('State', 'spatial nonspatial hidden')
@@ -32,6 +33,25 @@ def cat_transitions(tuple_of_transitions: Iterable) -> Transition:
     return Transition(states, actions, rewards, next_states, dones)
 
 
+def split_transitions(transitions: Transition,
+                      split_size_or_sections) -> List[Transition]:
+    """
+    Splits a batch of transitions along the batch dimension, like th.split.
+
+    Takes either the size of each part, or a list with the size of every part.
+    """
+    states, actions, rewards, next_states, dones = transitions
+    return [Transition(State(*states), actions, rewards, State(*next_states), dones)
+            for states, actions, rewards, next_states, dones in zip(
+                zip(*[th.split(component, split_size_or_sections)
+                      for component in states]),
+                th.split(actions, split_size_or_sections),
+                th.split(rewards, split_size_or_sections),
+                zip(*[th.split(component, split_size_or_sections)
+                      for component in next_states]),
+                th.split(dones, split_size_or_sections))]
+
+
 def sequence_to_transitions(sequence: Sequence) -> Transition:
     """
     Converts a sequence to a batch of transitions.
@@ -51,8 +71,23 @@ def sequence_to_transitions(sequence: Sequence) -> Transition:
                       sequence.dones)
 
 
-def update_hidden(state: State, hidden: th.Tensor):
-    """Updates the hidden element of a given state with the given hidden value"""
+def update_hidden(state: State, hidden: th.Tensor) -> State:
+    """Returns the given state with its hidden element replaced by the given value"""
     state = list(state)
     state[2] = hidden
-    state = State(*state)
+    return State(*state)
+
+
+def state_to_numpy(state: State) -> Tuple[np.ndarray]:
+    """
+    Converts the components of a state to numpy arrays.
+
+    Used to send states between processes by value, rather than through shared memory
+    tensors, which each hold a file descriptor open.
+    """
+    return tuple(state_component.numpy() for state_component in state)
+
+
+def state_from_numpy(state: Iterable) -> State:
+    """Converts a tuple of numpy arrays back into a state."""
+    return State(*[th.from_numpy(state_component) for state_component in state])
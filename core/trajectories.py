@@ -1,3 +1,4 @@
+from core.frame_compression import CompressedStates, state_nbytes
 from core.state import State, Transition, Sequence
 from core.trajectory_viewer import TrajectoryViewer
 
@@ -31,12 +32,29 @@ class Trajectory:
     def current_state(self) -> State:
         return self.states[-1]
 
+    def compress_states(self, level=1):
+        """
+        Holds the frames of the trajectory's states compressed from now on. States
+        that are not held in a list, such as those mapped from a file, are left as is.
+        """
+        if isinstance(self.states, list):
+            self.states = CompressedStates(self.states, level)
+
+    def states_nbytes(self) -> int:
+        """The memory held by the trajectory's states."""
+        if isinstance(self.states, CompressedStates):
+            return self.states.nbytes
+        return sum(state_nbytes(state) for state in self.states)
+
     def update_hidden(self, idx: int, new_hidden: th.Tensor):
         """Updates the hidden state of the state at the given index"""
         is_last_step = idx + 1 == len(self)
         done = is_last_step and self.done
         if not done:
             idx += 1
+        if isinstance(self.states, CompressedStates):
+            self.states.set_hidden(idx, new_hidden)
+            return
         next_state = self.states[idx]
         *state_components, _hidden = next_state
         self.states[idx] = State(*state_components, new_hidden)
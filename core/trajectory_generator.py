@@ -1,9 +1,36 @@
 from contexts.minerl.environment import MineRLContext
+from core.datasets import ReplayBuffer
+from core.environment import is_debug_env, start_env
 from core.gpu import GPULoader
-from core.state import update_hidden
+from core.state import state_from_numpy, state_to_numpy, update_hidden
 from core.trajectories import Trajectory
 
+import hashlib
+import json
+from pathlib import Path
+
 import numpy as np
+from omegaconf import OmegaConf
+import torch as th
+import torch.multiprocessing as mp
+
+
+def random_trajectories_worker(worker_idx, config, steps, debug_env=False):
+    """
+    Collects random trajectories in its own env, for parallel warmup collection.
+
+    States are returned as numpy arrays so they are sent back by value.
+    """
+    np.random.seed(config.seed + worker_idx)
+    env = start_env(config, debug_env=debug_env)
+    replay_buffer = TrajectoryGenerator(env, None, config, ReplayBuffer(config),
+                                        training=True).random_trajectories(steps)
+    env.close()
+    trajectories = [trajectory for trajectory in replay_buffer.trajectories
+                    if len(trajectory) > 0]
+    for trajectory in trajectories:
+        trajectory.states = [state_to_numpy(state) for state in trajectory.states]
+    return trajectories
 
 
 class TrajectoryGenerator:
@@ -12,11 +39,16 @@ class TrajectoryGenerator:
         self.agent = agent
         self.config = config
         self.replay_buffer = replay_buffer
-        self.gpu_loader = GPULoader(config)
+        self.gpu_loader = GPULoader(config, device=getattr(agent, 'device', None))
         if config.context.name == 'MineRL':
             self.context = MineRLContext(config)
             self.termination_helper = self.context.termination_helper
         self.training = training
+        # the agent's hidden state, kept on the device between steps
+        self.hidden = None
+        # agents that normalize and track hidden states themselves, like an
+        # InferenceClient, are given states as they come from the environment
+        self.raw_state_input = getattr(agent, 'raw_state_input', False)
 
     def new_trajectory(env, replay_buffer, reset_env=True):
         if len(replay_buffer.current_trajectory()) > 0:
@@ -29,10 +61,17 @@ class TrajectoryGenerator:
         return replay_buffer.current_state()
 
     def start_new_trajectory(self, **kwargs):
+        self.reset_hidden()
         current_state = TrajectoryGenerator.new_trajectory(
             self.env, self.replay_buffer, **kwargs)
         return current_state
 
+    def reset_hidden(self):
+        """Acts from the hidden state stored in the next state, rather than the device."""
+        self.hidden = None
+        if self.raw_state_input:
+            self.agent.reset_hidden()
+
     def random_action(self):
         action = np.random.choice(self.context.actions)
         return action
@@ -43,10 +82,15 @@ class TrajectoryGenerator:
             if trajectory is None else trajectory.current_state()
         if random_action:
             action = self.random_action()
-            hidden = self.context.initial_hidden
+            self.reset_hidden()
+            host_hidden = self.context.initial_hidden
+        elif self.raw_state_input:
+            action, host_hidden = self.agent.get_action(current_state)
         else:
-            action, hidden = self.agent.get_action(
-                self.gpu_loader.state_to_device(current_state))
+            action, self.hidden = self.agent.get_action(
+                self.gpu_loader.acting_state_to_device(current_state, self.hidden))
+            # overlap the host copy of the hidden state with the env step
+            host_hidden = self.gpu_loader.start_host_copy(self.hidden)
 
         suppressed_termination = self.termination_helper.suppressed_termination(
             step, current_state, action) \
@@ -58,7 +102,8 @@ class TrajectoryGenerator:
         else:
             next_state, reward, done, _ = self.env.step(action)
 
-        update_hidden(next_state, hidden)
+        next_state = update_hidden(next_state,
+                                   self.gpu_loader.finish_host_copy(host_hidden))
         metrics['Rewards/ground_truth_reward'] = reward
 
         if trajectory is None:
@@ -73,6 +118,7 @@ class TrajectoryGenerator:
         trajectory = Trajectory()
         state = self.env.reset()
         trajectory.states.append(state)
+        self.reset_hidden()
 
         step = 0
         while not trajectory.done and len(trajectory) < max_episode_length:
@@ -97,3 +143,71 @@ class TrajectoryGenerator:
         trajectory_count = len(self.replay_buffer.trajectories)
         print(f'Finished generating {trajectory_count} random trajectories')
         return self.replay_buffer
+
+    def parallel_random_trajectories(self, steps, workers):
+        """Splits random trajectory collection across worker processes with own envs."""
+        print(f'Generating random trajectories for {steps} steps with {workers} workers')
+        worker_steps = [steps // workers + (1 if worker_idx < steps % workers else 0)
+                        for worker_idx in range(workers)]
+        debug_env = is_debug_env(self.env)
+        with mp.get_context('spawn').Pool(workers) as pool:
+            worker_trajectories = pool.starmap(
+                random_trajectories_worker,
+                [(worker_idx, self.config, step_count, debug_env)
+                 for worker_idx, step_count in enumerate(worker_steps)])
+        for trajectories in worker_trajectories:
+            for trajectory in trajectories:
+                trajectory.states = [state_from_numpy(state)
+                                     for state in trajectory.states]
+                self.replay_buffer.append_trajectory(trajectory)
+        trajectory_count = sum([len(trajectories)
+                                for trajectories in worker_trajectories])
+        print(f'Finished generating {trajectory_count} random trajectories')
+        return self.replay_buffer
+
+    def warmup_cache_path(self, steps):
+        """
+        Where warmup trajectories are cached, keyed by a hash of everything that shapes
+        them: the env and context config, the observation frames, the hidden state
+        size and the frame compression.
+        """
+        config = self.config
+        observation_config = {
+            'env': OmegaConf.to_container(config.env, resolve=True),
+            'context': OmegaConf.to_container(config.context, resolve=True),
+            'n_observation_frames': config.model.n_observation_frames,
+            'lstm_layers': config.model.lstm_layers,
+            'lstm_hidden_size': config.model.lstm_hidden_size,
+            'compress_frames': config.compress_frames,
+            'frame_compression_level': config.frame_compression_level}
+        config_hash = hashlib.sha1(
+            json.dumps(observation_config, sort_keys=True).encode()).hexdigest()
+        return Path('train') / 'warmup' / (
+            f'{config.env.name}_{config_hash[:12]}_{steps}steps.pt')
+
+    def warmup(self, steps):
+        """
+        Fills the replay buffer with random trajectories before training.
+
+        Collection is spread across worker processes if config.warmup_workers > 0.
+        With config.warmup_cache, the trajectories are saved to disk and reused by
+        later runs with the same env and observation config.
+        """
+        cache_path = self.warmup_cache_path(steps)
+        if self.config.warmup_cache and cache_path.exists():
+            print(f'Loading warmup trajectories from {cache_path}')
+            for trajectory in th.load(cache_path):
+                self.replay_buffer.append_trajectory(trajectory)
+            return self.replay_buffer
+
+        if self.config.warmup_workers > 0:
+            self.parallel_random_trajectories(steps, self.config.warmup_workers)
+        else:
+            self.random_trajectories(steps)
+
+        if self.config.warmup_cache:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            th.save([trajectory for trajectory in self.replay_buffer.trajectories
+                     if len(trajectory) > 0], cache_path)
+            print(f'Saved warmup trajectories to {cache_path}')
+        return self.replay_buffer
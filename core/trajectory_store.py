@@ -0,0 +1,209 @@
+from core.frame_compression import CompressedFrames, compress_frame, tensor_nbytes
+from core.state import State, Transition, Sequence
+
+import numpy as np
+import torch as th
+
+
+class StatesView:
+    """The states of a trajectory in a TrajectoryStore, indexed like a list."""
+    def __init__(self, store, trajectory_idx):
+        self.store = store
+        self.start = int(store.state_offsets[trajectory_idx])
+        self.length = int(store.state_offsets[trajectory_idx + 1]) - self.start
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[state_idx] for state_idx in range(*idx.indices(self.length))]
+        if idx < 0:
+            idx += self.length
+        if not 0 <= idx < self.length:
+            raise IndexError
+        return self.store.state(self.start + idx)
+
+
+class TrajectoryView:
+    """
+    A trajectory stored in a TrajectoryStore, read like a Trajectory.
+
+    Steps are returned as transitions and sequences of views into the store's
+    tensors, without copying the frames.
+    """
+    def __init__(self, store, trajectory_idx):
+        self.store = store
+        self.trajectory_idx = trajectory_idx
+        self.states = StatesView(store, trajectory_idx)
+        self.step_start = int(store.step_offsets[trajectory_idx])
+        self.length = int(store.step_offsets[trajectory_idx + 1]) - self.step_start
+        self.actions = store.actions[self.step_start:self.step_start + self.length]
+        self.rewards = store.rewards[self.step_start:self.step_start + self.length]
+        self.done = bool(store.dones[trajectory_idx])
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, idx: int) -> Transition:
+        is_last_step = idx + 1 == len(self)
+        done = is_last_step and self.done
+        return Transition(self.states[idx], self.actions[idx], self.rewards[idx],
+                          self.states[idx + 1], done)
+
+    def update_hidden(self, idx: int, new_hidden: th.Tensor):
+        """Updates the hidden state of the state at the given index"""
+        is_last_step = idx + 1 == len(self)
+        done = is_last_step and self.done
+        if not done:
+            idx += 1
+        self.store.update_hidden(self.states.start + idx, new_hidden)
+
+    def get_sequence(self, last_step_idx: int, sequence_length: int) -> Sequence:
+        """Returns a sequence of the specified lenth ending at the given index"""
+        if last_step_idx >= len(self) or sequence_length > len(self) \
+                or sequence_length > last_step_idx + 1:
+            raise IndexError
+        first_step_idx = last_step_idx + 1 - sequence_length
+        states = self.store.states(self.states.start + first_step_idx,
+                                   self.states.start + last_step_idx + 2)
+        actions = self.actions[first_step_idx:last_step_idx + 1]
+        rewards = self.rewards[first_step_idx:last_step_idx + 1]
+        is_last_step = last_step_idx + 1 == len(self)
+        dones = th.zeros(sequence_length)
+        dones[-1] = 1 if is_last_step and self.done else 0
+        return Sequence(states, actions, rewards, dones)
+
+
+class TrajectoryStore:
+    """
+    The trajectories of a dataset, packed into flat tensors.
+
+    The states of all trajectories are concatenated into one spatial and one
+    nonspatial tensor, and the actions and rewards of their steps into one tensor
+    each. A trajectory's states start at state_offsets[idx] and its steps at
+    step_offsets[idx]. The trajectories attribute holds a TrajectoryView for each,
+    which can be used in place of a Trajectory.
+
+    With compressed frames, the spatial tensor is replaced by CompressedFrames, held
+    as frame_data, frame_offsets and frame_shape tensors, and frames are
+    decompressed as they are read.
+
+    Every state starts with the same initial hidden state. Hidden states updated
+    during training are kept in a separate tensor belonging to the process, which
+    is only allocated on the first update, so a store mapped from a dataset server's
+    shared memory is never written to.
+    """
+    tensor_names = ['spatial', 'nonspatial', 'actions', 'rewards', 'dones',
+                    'state_offsets', 'step_offsets']
+    compressed_tensor_names = ['frame_data', 'frame_offsets', 'frame_shape',
+                               *tensor_names[1:]]
+
+    def __init__(self, tensors, initial_hidden, stats, shared_memory=()):
+        self.compressed = 'frame_data' in tensors
+        if self.compressed:
+            self.tensor_names = self.compressed_tensor_names
+        for name in self.tensor_names:
+            setattr(self, name, tensors[name])
+        if self.compressed:
+            self.spatial = CompressedFrames(self.frame_data, self.frame_offsets,
+                                            self.frame_shape.tolist())
+        self.initial_hidden = initial_hidden
+        self.hidden = None
+        self.stats = stats
+        # keeps the shared memory mapped for as long as the store is used
+        self.shared_memory = list(shared_memory)
+        self.trajectories = [TrajectoryView(self, trajectory_idx)
+                             for trajectory_idx in range(len(self.dones))]
+
+    @classmethod
+    def from_trajectories(cls, trajectories, stats, release=False, compress_frames=False,
+                          compression_level=1) -> 'TrajectoryStore':
+        """
+        Packs a list of Trajectory objects, skipping empty trajectories.
+
+        With release, each trajectory's states are cleared once they are copied, so
+        that at most one trajectory's frames are held in both forms while packing.
+        With compress_frames, the frames are compressed with zlib at the given level.
+        """
+        trajectories = [trajectory for trajectory in trajectories
+                        if len(trajectory) > 0]
+        state_lengths = [len(trajectory) + 1 for trajectory in trajectories]
+        step_lengths = [len(trajectory) for trajectory in trajectories]
+        state_offsets = np.cumsum([0, *state_lengths])
+        state_count = int(state_offsets[-1])
+        if len(trajectories) > 0:
+            first_state = trajectories[0].states[0]
+        else:
+            first_state = State(th.zeros(0, 0, 0), th.zeros(0), th.zeros(0))
+        spatial = None if compress_frames \
+            else th.empty((state_count, *first_state.spatial.size()),
+                          dtype=first_state.spatial.dtype)
+        compressed_frames = []
+        nonspatial = th.empty((state_count, *first_state.nonspatial.size()),
+                              dtype=first_state.nonspatial.dtype)
+        for trajectory, start in zip(trajectories, state_offsets):
+            states = trajectory.states[:len(trajectory) + 1]
+            if compress_frames:
+                compressed_frames.extend([compress_frame(state.spatial, compression_level)
+                                          for state in states])
+            else:
+                th.stack([state.spatial for state in states],
+                         out=spatial[start:start + len(states)])
+            th.stack([state.nonspatial for state in states],
+                     out=nonspatial[start:start + len(states)])
+            if release:
+                trajectory.states.clear()
+        if compress_frames:
+            frames = CompressedFrames.from_compressed(compressed_frames,
+                                                      first_state.spatial.size())
+            frame_tensors = dict(frame_data=frames.data, frame_offsets=frames.offsets,
+                                 frame_shape=th.LongTensor(frames.shape))
+        else:
+            frame_tensors = dict(spatial=spatial)
+        tensors = dict(
+            **frame_tensors,
+            nonspatial=nonspatial,
+            actions=th.as_tensor(np.array([action for trajectory in trajectories
+                                           for action in trajectory.actions]),
+                                 dtype=th.long),
+            rewards=th.as_tensor(np.array([reward for trajectory in trajectories
+                                           for reward in trajectory.rewards]),
+                                 dtype=th.float),
+            dones=th.BoolTensor([trajectory.done for trajectory in trajectories]),
+            state_offsets=th.LongTensor(state_offsets),
+            step_offsets=th.LongTensor(np.cumsum([0, *step_lengths])))
+        return cls(tensors, first_state.hidden.clone(), stats)
+
+    def frame_shape(self):
+        """The shape of the stacked frames of each state."""
+        return self.spatial.shape if self.compressed else tuple(self.spatial.size()[1:])
+
+    def step_lookup(self) -> np.ndarray:
+        """The trajectory and step index of every step, as an array of pairs."""
+        step_lengths = np.diff(self.step_offsets.numpy())
+        trajectory_indices = np.repeat(np.arange(len(step_lengths)), step_lengths)
+        step_indices = np.arange(len(trajectory_indices)) \
+            - np.repeat(self.step_offsets.numpy()[:-1], step_lengths)
+        return np.stack((trajectory_indices, step_indices), axis=1)
+
+    def bytes_per_step(self) -> float:
+        """The memory held by the states, per step."""
+        frame_bytes = self.spatial.nbytes if self.compressed \
+            else tensor_nbytes(self.spatial)
+        return (frame_bytes + tensor_nbytes(self.nonspatial)) / max(1, len(self.actions))
+
+    def state(self, state_idx) -> State:
+        hidden = self.initial_hidden if self.hidden is None else self.hidden[state_idx]
+        return State(self.spatial[state_idx], self.nonspatial[state_idx], hidden)
+
+    def states(self, start, end) -> State:
+        """The states in a range of indices, batched along the first dimension."""
+        hidden = self.initial_hidden.expand(end - start, -1) if self.hidden is None \
+            else self.hidden[start:end]
+        return State(self.spatial[start:end], self.nonspatial[start:end], hidden)
+
+    def update_hidden(self, state_idx, new_hidden):
+        if self.hidden is None:
+            self.hidden = self.initial_hidden.expand(len(self.spatial), -1).clone()
+        self.hidden[state_idx] = new_hidden
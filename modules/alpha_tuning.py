@@ -51,6 +51,21 @@ class AlphaTuner:
         metrics = {'alpha': self.current_alpha(), 'alpha_loss': loss.detach()}
         return metrics
 
+    def state_dict(self):
+        """The tuned alpha and its optimizer, the only state that training changes."""
+        if not self.entropy_tuning or self.decay_alpha:
+            return {}
+        return {'log_alpha': self.log_alpha.detach(),
+                'optimizer': self.optimizer.state_dict()}
+
+    def load_state_dict(self, state_dict):
+        if 'log_alpha' not in state_dict:
+            return
+        with th.no_grad():
+            self.log_alpha.copy_(state_dict['log_alpha'])
+        self.optimizer.load_state_dict(state_dict['optimizer'])
+        self.update_model_alpha()
+
     def target_entropy(context, target_entropy_ratio):
         target_entropy = (-np.log(1.0 / len(context.actions)) * target_entropy_ratio)
         return target_entropy
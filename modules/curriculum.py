@@ -1,5 +1,7 @@
 import random
 
+import numpy as np
+
 
 class CurriculumScheduler:
     def __init__(self, config):
@@ -39,42 +41,56 @@ class CurriculumScheduler:
         return min(algorithm.max_training_episode_length,
                    max(episode_length, algorithm.min_training_episode_length))
 
-    def update_expert_dataset(self, dataset, curriculum_fraction):
-        random_seed = random.randint(0, self.extracurricular_sparsity - 1)
-        filtered_lookup, master_indices = \
-            zip(*[[(t_idx, sequence_idx), master_idx]
-                  for master_idx, (t_idx, sequence_idx)
-                  in enumerate(dataset.master_lookup)
-                  if (sequence_idx <= (len(dataset.trajectories[t_idx])
-                                       * curriculum_fraction)
-                      or sequence_idx < self.initial_curriculum_size
-                      or (sequence_idx+random_seed) % self.extracurricular_sparsity == 0)
-                  ])
-        filtered_lookup = list(filtered_lookup)
-        master_indices = list(master_indices)
-        self.current_curriculum_length = len(filtered_lookup)
+    def curriculum_masks(self, dataset, curriculum_fraction):
+        """
+        Which of the dataset's master steps are in the curriculum, and which of them
+        to emphasize, or None when no steps are emphasized.
 
-        # emphasize recently added samples
+        Steps are included up to the curriculum fraction of the way through their
+        trajectory, along with the first initial_curriculum_size steps of each and
+        every extracurricular_sparsity-th step. With emphasize_new_samples, the
+        most recently included steps are emphasized.
+        """
+        random_seed = random.randint(0, self.extracurricular_sparsity - 1)
+        step_indices = dataset.master_lookup[:, 1]
+        fractions = dataset.master_fractions
+        included = (fractions <= curriculum_fraction) \
+            | (step_indices < self.initial_curriculum_size) \
+            | ((step_indices + random_seed) % self.extracurricular_sparsity == 0)
+        emphasized = None
         if self.emphasize_new_samples and curriculum_fraction > self.emphasized_fraction \
                 and curriculum_fraction < self.final_curriculum_fraction:
-            for i in range(self.emphasis_relative_sample_frequency - 1):
-                emphasis_lookup, emphasis_master_indices = \
-                    zip(*[[(t_idx, sequence_idx), master_idx]
-                          for master_idx, (t_idx, sequence_idx)
-                          in enumerate(dataset.master_lookup)
-                          if (sequence_idx <=
-                              (len(dataset.trajectories[t_idx])
-                               * curriculum_fraction)
-                              and sequence_idx > (len(dataset.trajectories[t_idx])
-                                                  * (curriculum_fraction
-                                                     - self.emphasized_fraction)))])
-                filtered_lookup.extend(emphasis_lookup)
-                master_indices.extend(emphasis_master_indices)
-                print(f'{len(emphasis_lookup)} samples emphasized')
+            emphasized = (fractions <= curriculum_fraction) \
+                & (fractions > curriculum_fraction - self.emphasized_fraction)
+            print(f'{np.count_nonzero(emphasized)} samples emphasized')
+        return included, emphasized
+
+    def update_expert_dataset(self, dataset, curriculum_fraction):
+        """
+        Restricts sampling of the expert dataset to the steps in the curriculum.
+
+        If the dataset has a sampler, the curriculum is applied as its weights:
+        steps outside it get no weight, and emphasized steps are sampled
+        emphasis_relative_sample_frequency times as often as the others. Otherwise
+        the steps are selected as the dataset's active lookup, with emphasized steps
+        repeated.
+        """
+        included, emphasized = self.curriculum_masks(dataset, curriculum_fraction)
+        self.current_curriculum_length = int(np.count_nonzero(included))
 
-        dataset.active_lookup = filtered_lookup
-        dataset.cross_lookup = {filtered_idx: master_idx
-                                for filtered_idx, master_idx in enumerate(master_indices)}
+        if dataset.sampler is not None:
+            weights = included.astype(float)
+            if emphasized is not None:
+                weights[emphasized] = self.emphasis_relative_sample_frequency
+            dataset.sampler.set_weights(weights)
+        else:
+            master_indices = np.flatnonzero(included)
+            if emphasized is not None:
+                repeats = np.tile(np.flatnonzero(emphasized),
+                                  self.emphasis_relative_sample_frequency - 1)
+                master_indices = np.concatenate((master_indices, repeats))
+            dataset.active_lookup = dataset.master_lookup[master_indices]
+            dataset.cross_lookup = master_indices
         print(f'Expert curriculum updated, including {self.current_curriculum_length}'
               f' / {len(dataset.master_lookup)} sequences')
 
@@ -86,7 +102,9 @@ class CurriculumScheduler:
         if self.current_curriculum_length == 0 \
                 or (step % self.curriculum_refresh_steps == 0 and not self.complete):
             self.update_expert_dataset(expert_dataset, curriculum_fraction)
-            replay_buffer.expert_dataloader = replay_buffer._initialize_dataloader()
+            # a weighted sampler picks up the new weights without a new dataloader
+            if expert_dataset.sampler is None:
+                replay_buffer.expert_dataloader = replay_buffer._initialize_dataloader()
             if curriculum_fraction >= self.final_curriculum_fraction:
                 self.complete = True
         curriculum_inclusion = self.current_curriculum_length \
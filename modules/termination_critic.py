@@ -1,6 +1,7 @@
 from networks.base_network import Network
-from algorithms.offline import SupervisedLearning
+from core.action_index import ClassIndex
 from core.gpu import GPULoader
+from core.samplers import StratifiedSampler
 
 import os
 import time
@@ -14,28 +15,54 @@ from torch.utils.data import Dataset, DataLoader
 
 
 class TerminateEpisodeDataset(Dataset):
-    def __init__(self, dataset):
+    """
+    Expert steps for training the termination critic: every sample_interval-th step
+    of each trajectory up to its last sample_interval steps, and every step where
+    the expert threw a snowball, which are found with the dataset's action index.
+    Each sample is a transition and whether the expert threw a snowball in it.
+
+    Like the expert datasets, it is sampled by its stratified sampler, here by
+    whether a snowball was thrown, and has no weighted sampler.
+    """
+    def __init__(self, dataset, context, class_balance=1.0):
         self.dataset = dataset
         self.sample_interval = 100
+        self.sampler = None
+        self.stratify_by = 'threw_snowball'
+        self.class_balance = class_balance
+        self.threw_snowball = self._threw_snowball(context)
         self.included_steps = self._get_included_steps()
 
+    def _threw_snowball(self, context):
+        action_index = self.dataset.action_index
+        if not context.items_available or 'snowball' not in context.items:
+            return np.zeros(len(action_index.actions), dtype=bool)
+        snowball = context.items.index('snowball') + 1
+        return (action_index.actions == context.use_action) \
+            & (action_index.equipped_items == snowball)
+
     def _get_included_steps(self):
-        included_steps = []
-        for trajectory_idx, trajectory in enumerate(self.dataset.trajectories):
-            trajectory_length = len(trajectory)
-            for step_idx, (state, action, _, _, _) in enumerate(trajectory):
-                if (step_idx % self.sample_interval == 0
-                    and (step_idx < trajectory_length - self.sample_interval)
-                        or ActionSpace.threw_snowball(state, action)):
-                    included_steps.append((trajectory_idx, step_idx))
-        return included_steps
+        trajectory_indices, step_indices = self.dataset.master_lookup.T
+        trajectory_lengths = np.array([len(trajectory) for trajectory
+                                       in self.dataset.trajectories])[trajectory_indices]
+        sampled = (step_indices % self.sample_interval == 0) \
+            & (step_indices < trajectory_lengths - self.sample_interval)
+        return np.flatnonzero(sampled | self.threw_snowball)
+
+    def stratified_sampler(self, batch_size):
+        """Samples batches balanced between throwing a snowball and other steps."""
+        return StratifiedSampler(ClassIndex(self.threw_snowball[self.included_steps]),
+                                 batch_size, class_balance=self.class_balance,
+                                 seed=self.dataset.seed)
 
     def __len__(self):
         return len(self.included_steps)
 
     def __getitem__(self, idx):
-        trajectory_idx, step_idx = self.included_steps[idx]
-        return self.dataset.trajectories[trajectory_idx][step_idx]
+        master_idx = self.included_steps[idx]
+        trajectory_idx, step_idx = self.dataset.master_lookup[master_idx]
+        return self.dataset.trajectories[trajectory_idx][step_idx], \
+            float(self.threw_snowball[master_idx])
 
 
 class TerminationCritic(Network):
@@ -65,16 +92,33 @@ class TerminationCritic(Network):
         return evaluation.item()
 
     def train(self, dataset):
-        termination_dataset = TerminateEpisodeDataset(dataset)
-        training_algorithm = SupervisedLearning(
-            self.config, epochs=self.config.env.termination_critic_training_epochs)
-        training_algorithm(self, termination_dataset)
-        self.steps_trained = training_algorithm.iter_count
-
-    def loss(self, states, actions):
-        threw_snowball = ActionSpace.threw_snowball_tensor(states, actions, self.device)
+        """
+        Trains the critic to predict the expert throwing a snowball, which ends the
+        episode, on batches balanced between those steps and the rest.
+        """
+        termination_dataset = TerminateEpisodeDataset(dataset, self.context)
+        batch_size = self.config.method.batch_size
+        sampler = termination_dataset.stratified_sampler(batch_size)
+        dataloader = DataLoader(termination_dataset, batch_size=batch_size,
+                                sampler=sampler)
+        gpu_loader = GPULoader(self.config)
+        # the termination dataset holds transitions, not sequences
+        gpu_loader.load_sequences = False
+        optimizer = th.optim.AdamW(self.parameters(), lr=self.config.method.learning_rate)
+        self.steps_trained = 0
+        for _epoch in range(self.config.env.termination_critic_training_epochs):
+            for transitions, threw_snowball in dataloader:
+                states = gpu_loader.transitions_to_device(transitions).state
+                loss = self.loss(states, threw_snowball.to(self.device))
+                optimizer.zero_grad(set_to_none=True)
+                loss.backward()
+                optimizer.step()
+                self.steps_trained += 1
+
+    def loss(self, states, threw_snowball):
         predict_terminate = self.forward(states)
-        loss = F.binary_cross_entropy(predict_terminate, threw_snowball.float())
+        loss = F.binary_cross_entropy(predict_terminate.squeeze(-1),
+                                      threw_snowball.float())
         return loss
 
     def save(self, path=None):
@@ -1,11 +1,32 @@
 from core.environment import create_context
 
+from contextlib import contextmanager
+import math
+
 import numpy as np
 import torch as th
 from torch import nn
+from torch.utils.checkpoint import checkpoint
 from torchvision.models.mobilenetv3 import mobilenet_v3_large
 
 
+@contextmanager
+def frozen_batch_norm_statistics(module):
+    """Runs the module's batch norm layers without updating their running statistics."""
+    batch_norms = [layer for layer in module.modules()
+                   if isinstance(layer, nn.modules.batchnorm._BatchNorm)]
+    saved = [(layer.momentum, layer.num_batches_tracked.clone())
+             for layer in batch_norms]
+    for layer in batch_norms:
+        layer.momentum = 0.0
+    try:
+        yield
+    finally:
+        for layer, (momentum, num_batches_tracked) in zip(batch_norms, saved):
+            layer.momentum = momentum
+            layer.num_batches_tracked.copy_(num_batches_tracked)
+
+
 class VisualFeatureExtractor(nn.Module):
     """
     Converts an image tensor into an abstract feature space.
@@ -20,6 +41,14 @@ class VisualFeatureExtractor(nn.Module):
     cnn_layers, not always in intuitive ways. The _visual_features_dim function returns
     the size of the feature space. The returned tensor has dimensions
     (sample, (optional sequence dim), features).
+
+    With config.channels_last, the cnn weights and inputs use the channels last
+    memory format, which is faster for convolutions under reduced precision.
+
+    With model.checkpoint_cnn_segments, the cnn blocks are split into that many
+    segments during training, and only the segment boundaries' activations are kept
+    for the backward pass, the rest are recomputed. Batch norm running statistics
+    are frozen while a segment is recomputed, so each batch updates them once.
     """
     def __init__(self, config):
         super().__init__()
@@ -40,12 +69,50 @@ class VisualFeatureExtractor(nn.Module):
                     nn.Hardswish()),
                 *mobilenet_features[1:self.cnn_layers]
             )
+        self.channels_last = config.channels_last
+        if self.channels_last:
+            self.cnn = self.cnn.to(memory_format=th.channels_last)
+        self.checkpoint_segments = config.model.checkpoint_cnn_segments
         self.feature_dim = self._visual_features_dim()
 
     def forward(self, spatial):
         *n, c, h, w = spatial.size()
         spatial = spatial.reshape(-1, c, h, w)
-        return self.cnn(spatial).reshape(*n, -1)
+        if self.channels_last:
+            spatial = spatial.contiguous(memory_format=th.channels_last)
+        if self.checkpoint_segments > 0 and self.training and th.is_grad_enabled():
+            features = self._checkpointed_cnn(spatial)
+        else:
+            features = self.cnn(spatial)
+        return features.reshape(*n, -1)
+
+    def _checkpointed_cnn(self, spatial):
+        """Runs the cnn in segments, checkpointing all but the last one."""
+        segment_size = math.ceil(len(self.cnn) / self.checkpoint_segments)
+        features = spatial
+        for start in range(0, len(self.cnn), segment_size):
+            segment = self.cnn[start:start + segment_size]
+            if start + segment_size >= len(self.cnn):
+                return segment(features)
+            features = checkpoint(self._recomputable(segment), features,
+                                  use_reentrant=False)
+        return features
+
+    @staticmethod
+    def _recomputable(segment):
+        """
+        The segment's forward, which runs with frozen batch norm statistics when it
+        is called again to recompute the activations for the backward pass.
+        """
+        calls = []
+
+        def forward(features):
+            if len(calls) == 0:
+                calls.append(True)
+                return segment(features)
+            with frozen_batch_norm_statistics(segment):
+                return segment(features)
+        return forward
 
     def _visual_features_dim(self):
         with th.no_grad():
@@ -63,7 +130,12 @@ class LSTMLayer(nn.Module):
     nonspacial component of a state. In the feature space, batch precedes the sequence
     dimension.
 
-    Output features have dimension equal to the LSTM hidden size.
+    Output features have dimension equal to the LSTM hidden size. The next hidden
+    state is returned on the device, callers that store it copy it to the host.
+
+    With model.checkpoint_lstm_steps, long sequences are unrolled in chunks of that
+    many steps during training, keeping only the hidden state between chunks for
+    the backward pass and recomputing the rest.
     """
     def __init__(self, input_dim, config):
         super().__init__()
@@ -72,12 +144,22 @@ class LSTMLayer(nn.Module):
         self.lstm = nn.LSTM(input_size=input_dim,
                             hidden_size=self.hidden_size,
                             num_layers=config.model.lstm_layers, batch_first=True)
+        self.checkpoint_steps = config.model.checkpoint_lstm_steps
 
     def forward(self, features, hidden):
         hidden, cell = th.chunk(hidden, 2, dim=-1)
-        new_features, new_hidden = self.lstm(features,
-                                             (hidden.contiguous(), cell.contiguous()))
-        new_hidden = th.cat(new_hidden, dim=-1).squeeze(0).detach().cpu()
+        hidden = (hidden.contiguous(), cell.contiguous())
+        if self.checkpoint_steps > 0 and self.training and th.is_grad_enabled() \
+                and features.size()[1] > self.checkpoint_steps:
+            new_features = []
+            for chunk in features.split(self.checkpoint_steps, dim=1):
+                chunk_features, hidden = checkpoint(self.lstm, chunk, hidden,
+                                                    use_reentrant=False)
+                new_features.append(chunk_features)
+            new_features, new_hidden = th.cat(new_features, dim=1), hidden
+        else:
+            new_features, new_hidden = self.lstm(features, hidden)
+        new_hidden = th.cat(new_hidden, dim=-1).squeeze(0).detach()
         return new_features, new_hidden
 
 
@@ -0,0 +1,52 @@
+from agents.soft_q import SoftQAgent
+from contexts.minerl.environment import MineRLDebugEnv, ObservationWrapper
+from core.gpu import GPULoader
+from utility.config import debug_config
+
+import argparse
+import time
+
+import torch as th
+
+
+def time_per_step(function, steps):
+    function()
+    if th.cuda.is_available():
+        th.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(steps):
+        function()
+    if th.cuda.is_available():
+        th.cuda.synchronize()
+    return (time.perf_counter() - start) / steps * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Measures per step acting overhead, excluding the simulator')
+    parser.add_argument('--steps', type=int, default=500)
+    parser.add_argument("overrides", nargs="*", default=[])
+    args = parser.parse_args()
+
+    config = debug_config(args.overrides)
+    debug_env = MineRLDebugEnv(config)
+    obs_wrapper = ObservationWrapper(debug_env, config)
+    gpu_loader = GPULoader(config)
+    agent = SoftQAgent(config)
+    obs = debug_env.reset()
+    state = obs_wrapper.observation(obs)
+    device_state = gpu_loader.state_to_device(state)
+
+    def forward():
+        with th.no_grad():
+            agent.get_Q(device_state)
+
+    def acting_step():
+        state = obs_wrapper.observation(obs)
+        agent.get_action(gpu_loader.acting_state_to_device(state))
+
+    forward_ms = time_per_step(forward, args.steps)
+    acting_ms = time_per_step(acting_step, args.steps)
+    print(f'Network forward: {forward_ms:.3f} ms/step')
+    print(f'Acting step: {acting_ms:.3f} ms/step'
+          f' ({acting_ms - forward_ms:.3f} ms overhead)')
@@ -0,0 +1,45 @@
+from core.environment import start_env
+from core.trajectory_generator import TrajectoryGenerator
+from core.datasets import ReplayBuffer
+from utility.config import debug_config
+
+import argparse
+import time
+
+
+def time_random_rollout(config, steps, episode_length):
+    env = start_env(config, debug_env=True)
+    generator = TrajectoryGenerator(env, None, config, ReplayBuffer(config),
+                                    training=False)
+    reset_time = 0
+    start = time.time()
+    for step in range(steps):
+        if step % episode_length == 0:
+            reset_start = time.time()
+            generator.start_new_trajectory()
+            reset_time += time.time() - reset_start
+        generator.env_interaction_step(step % episode_length, random_action=True)
+    total_time = time.time() - start
+    env.close()
+    return total_time, reset_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Compares rollout time with and without a standby env')
+    parser.add_argument('--steps', type=int, default=500)
+    parser.add_argument('--episode-length', type=int, default=100)
+    parser.add_argument('--reset-latency', type=float, default=2.0)
+    parser.add_argument('--step-latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    for standby_env in [False, True]:
+        config = debug_config()
+        config.context.standby_env = standby_env
+        config.context.debug_reset_latency = args.reset_latency
+        config.context.debug_step_latency = args.step_latency
+        total_time, reset_time = time_random_rollout(config, args.steps,
+                                                     args.episode_length)
+        print(f'standby_env={standby_env}: {total_time:.2f}s total,'
+              f' {reset_time:.2f}s waiting on resets,'
+              f' {args.steps / total_time:.1f} steps/s')
@@ -0,0 +1,84 @@
+from contexts.minerl.dataset import MineRLDatasetBuilder
+from contexts.minerl.environment import MineRLDebugEnv, ObservationWrapper
+from core.datasets import ReplayBuffer
+from core.trajectories import Trajectory
+from utility.config import debug_config
+
+import argparse
+import copy
+import random
+import time
+
+
+def debug_trajectories(config, steps, episode_length=500):
+    """Trajectories of random debug env frames, the worst case for compression."""
+    debug_env = MineRLDebugEnv(config)
+    obs_wrapper = ObservationWrapper(debug_env, config)
+    trajectories = []
+    for step in range(steps):
+        if step % episode_length == 0:
+            trajectory = Trajectory()
+            trajectory.states.append(obs_wrapper.observation(debug_env.reset()))
+            trajectories.append(trajectory)
+        next_state = obs_wrapper.observation(debug_env.step(None)[0])
+        trajectory.append_step(random.randrange(len(obs_wrapper.context.actions)),
+                               0, next_state, False)
+    return trajectories
+
+
+def fill_replay_buffer(config, trajectories, compress_frames, level):
+    config = copy.deepcopy(config)
+    config.compress_frames = compress_frames
+    config.frame_compression_level = level
+    replay_buffer = ReplayBuffer(config)
+    start = time.perf_counter()
+    for trajectory in trajectories:
+        copied = Trajectory()
+        copied.states = list(trajectory.states)
+        copied.actions = trajectory.actions
+        copied.rewards = trajectory.rewards
+        replay_buffer.append_trajectory(copied)
+    return replay_buffer, time.perf_counter() - start
+
+
+def samples_per_second(replay_buffer, batch_size, batches):
+    start = time.perf_counter()
+    for _ in range(batches):
+        replay_buffer.sample(batch_size)
+    return batches * batch_size / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=('Compares replay buffer bytes per step, compression time and'
+                     ' sample throughput with uncompressed and zlib compressed frames,'
+                     ' on random debug env frames unless --expert is given'))
+    parser.add_argument('--steps', type=int, default=5000)
+    parser.add_argument('--batches', type=int, default=50)
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 6])
+    parser.add_argument('--expert', action='store_true', default=False,
+                        help='use the debug expert dataset, which has realistic frames')
+    parser.add_argument("overrides", nargs="*", default=[])
+    args = parser.parse_args()
+
+    config = debug_config(args.overrides)
+    if args.expert:
+        trajectories, _step_lookup, _stats = MineRLDatasetBuilder(
+            config, debug_dataset=True).load_data()
+    else:
+        trajectories = debug_trajectories(config, args.steps)
+    batch_size = config.method.batch_size
+
+    baseline_bytes, baseline_rate = None, None
+    for compress_frames, level in [(False, 0), *[(True, level) for level in args.levels]]:
+        replay_buffer, fill_time = fill_replay_buffer(config, trajectories,
+                                                      compress_frames, level)
+        bytes_per_step = replay_buffer.bytes_per_step()
+        rate = samples_per_second(replay_buffer, batch_size, args.batches)
+        baseline_bytes = baseline_bytes or bytes_per_step
+        baseline_rate = baseline_rate or rate
+        name = f'zlib level {level}' if compress_frames else 'Uncompressed'
+        print(f'{name}: {bytes_per_step:.0f} bytes per step'
+              f' ({baseline_bytes / bytes_per_step:.2f}x compression),'
+              f' filled in {fill_time:.2f} s,'
+              f' {rate:.0f} samples/s ({rate / baseline_rate:.2f}x)')
@@ -0,0 +1,33 @@
+from core.metrics import MetricsLogger, NullSink
+
+import argparse
+import time
+
+import torch as th
+
+
+def record_time(logger, steps, metric_count):
+    """The time the training loop spends per step handing its metrics to the logger."""
+    metrics = {f'metric_{idx}': th.tensor(float(idx)) for idx in range(metric_count)}
+    start = time.perf_counter()
+    for step in range(steps):
+        logger.record(dict(metrics), step)
+    elapsed = time.perf_counter() - start
+    logger.close()
+    return elapsed / steps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=('Measures the training loop overhead of recording metrics,'
+                     ' written to a null sink so only the logger itself is timed'))
+    parser.add_argument('--steps', type=int, default=100000)
+    parser.add_argument('--metrics', type=int, default=20)
+    parser.add_argument('--windows', type=int, nargs='+', default=[1, 100])
+    args = parser.parse_args()
+
+    for window in args.windows:
+        logger = MetricsLogger([NullSink()], window=window)
+        step_time = record_time(logger, args.steps, args.metrics)
+        print(f'Window of {window} steps: {step_time * 1e6:.2f} us per step recorded,'
+              f' {1 / step_time:.0f} steps/s')
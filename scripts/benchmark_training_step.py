@@ -0,0 +1,131 @@
+import os
+import sys
+# benchmarks the training step on the cpu, unless --cuda is given
+if '--cuda' not in sys.argv:
+    os.environ.setdefault('CUDA_VISIBLE_DEVICES', '')
+
+from agents.soft_q import SoftQAgent
+from algorithms.loss_functions.iqlearn import IQLearnLoss
+from contexts.minerl.environment import MineRLDebugEnv, ObservationWrapper
+from core.data_augmentation import DataAugmentation
+from core.datasets import ReplayBuffer, SequenceReplayBuffer
+from core.gpu import GPULoader
+from core.mixed_precision import MixedPrecision
+from utility.config import debug_config
+
+import argparse
+import random
+import time
+
+from omegaconf import OmegaConf
+import torch as th
+from torch.utils.data.dataloader import default_collate
+
+
+def debug_replay_buffer(config, steps):
+    replay_buffer = ReplayBuffer(config) if config.model.lstm_layers == 0 \
+        else SequenceReplayBuffer(config)
+    debug_env = MineRLDebugEnv(config)
+    obs_wrapper = ObservationWrapper(debug_env, config)
+    replay_buffer.current_trajectory().states.append(
+        obs_wrapper.observation(debug_env.reset()))
+    for _ in range(steps):
+        next_state = obs_wrapper.observation(debug_env.step(None)[0])
+        replay_buffer.append_step(random.randrange(len(obs_wrapper.context.actions)),
+                                  0, next_state, False)
+    return replay_buffer
+
+
+def updates_per_second(config, batches, compiled, warmup_updates):
+    """
+    Returns the updates per second, the activations saved for backward in MB, and the
+    peak cuda memory in MB if on cuda.
+    """
+    th.manual_seed(0)
+    agent = SoftQAgent(config)
+    loss_function = IQLearnLoss(agent, config)
+    if compiled:
+        loss_function.loss = th.compile(loss_function.loss, dynamic=False)
+    optimizer = th.optim.AdamW(agent.parameters(), lr=config.method.learning_rate)
+    gpu_loader = GPULoader(config)
+    augmentation = DataAugmentation(config)
+    mixed_precision = MixedPrecision(config, gpu_loader.device)
+
+    saved_bytes = []
+
+    def count_saved(tensor):
+        saved_bytes.append(tensor.numel() * tensor.element_size())
+        return tensor
+
+    def update(batch):
+        batch = gpu_loader.transitions_to_device(batch)
+        aug_batch = augmentation(batch)
+        with mixed_precision.autocast():
+            loss, _metrics, _final_hidden = loss_function(expert=aug_batch,
+                                                          expert_aug=batch)
+        mixed_precision.step(loss, optimizer)
+
+    for batch in batches[:warmup_updates]:
+        update(batch)
+    with th.autograd.graph.saved_tensors_hooks(count_saved, lambda tensor: tensor):
+        update(batches[0])
+    activation_memory = sum(saved_bytes) / 2**20
+    if th.cuda.is_available():
+        th.cuda.synchronize()
+        th.cuda.reset_peak_memory_stats()
+    start = time.perf_counter()
+    for batch in batches[warmup_updates:]:
+        update(batch)
+    if th.cuda.is_available():
+        th.cuda.synchronize()
+    rate = (len(batches) - warmup_updates) / (time.perf_counter() - start)
+    peak_memory = th.cuda.max_memory_allocated() / 2**20 \
+        if th.cuda.is_available() else None
+    return rate, activation_memory, peak_memory
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=('Compares training step throughput and memory eager, compiled, in'
+                     ' reduced precision with channels last, and with activation'
+                     ' checkpointing, on the cpu unless --cuda is given'))
+    parser.add_argument('--updates', type=int, default=50)
+    parser.add_argument('--warmup-updates', dest='warmup_updates', type=int, default=3)
+    parser.add_argument('--precision', default='bf16', choices=['bf16', 'fp16'])
+    parser.add_argument('--cuda', action='store_true', default=False)
+    parser.add_argument('--checkpoint-cnn-segments', dest='checkpoint_cnn_segments',
+                        type=int, default=4)
+    parser.add_argument('--checkpoint-lstm-steps', dest='checkpoint_lstm_steps',
+                        type=int, default=5)
+    parser.add_argument("overrides", nargs="*", default=['method=iqlearn_offline'])
+    args = parser.parse_args()
+
+    config = debug_config(args.overrides)
+    replay_buffer = debug_replay_buffer(config, steps=1000)
+    batch_size = config.method.batch_size
+    batches = [default_collate([replay_buffer[idx] for idx in
+                                random.sample(range(len(replay_buffer)), batch_size)])
+               for _ in range(args.updates + args.warmup_updates)]
+    batches = [sample for sample, _idx in batches]
+
+    reduced_precision_config = OmegaConf.merge(
+        config, {'precision': args.precision, 'channels_last': True})
+    checkpointing_config = OmegaConf.merge(
+        config, {'model': {'checkpoint_cnn_segments': args.checkpoint_cnn_segments,
+                           'checkpoint_lstm_steps': args.checkpoint_lstm_steps}})
+    modes = [('Eager', config, False),
+             (f'Eager {args.precision} channels last', reduced_precision_config, False),
+             ('Eager activation checkpointing', checkpointing_config, False)]
+    if hasattr(th, 'compile'):
+        modes.append(('Compiled', config, True))
+    else:
+        print('torch.compile is not available')
+
+    baseline = None
+    for name, mode_config, compiled in modes:
+        rate, activation_memory, peak_memory = updates_per_second(
+            mode_config, batches, compiled, args.warmup_updates)
+        baseline = rate if baseline is None else baseline
+        memory = f', peak memory {peak_memory:.0f} MB' if peak_memory is not None else ''
+        print(f'{name}: {rate:.2f} updates/s ({rate / baseline:.2f}x),'
+              f' saved activations {activation_memory:.0f} MB{memory}')
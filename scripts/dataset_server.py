@@ -0,0 +1,25 @@
+from core.dataset_server import DatasetServer
+from utility.config import debug_config
+
+import argparse
+import signal
+
+
+def interrupt(_signum, _frame):
+    raise KeyboardInterrupt
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=('Loads the expert dataset once and shares it through shared'
+                     ' memory with runs started with dataset_server=true, such as'
+                     ' several sweep agents on one host'))
+    parser.add_argument('--debug-dataset', dest='debug_dataset', action='store_true',
+                        default=False)
+    parser.add_argument("overrides", nargs="*", default=[])
+    args = parser.parse_args()
+
+    # stopped by a sweep's kill as well as by ctrl-c, freeing the shared memory
+    signal.signal(signal.SIGTERM, interrupt)
+    config = debug_config(args.overrides)
+    DatasetServer(config, debug_dataset=args.debug_dataset).serve()
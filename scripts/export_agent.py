@@ -0,0 +1,72 @@
+from agents.exported import ExportedAgent, export_agent
+from agents.soft_q import SoftQAgent
+from contexts.minerl.environment import MineRLDebugEnv, ObservationWrapper
+from core.gpu import GPULoader
+from utility.config import debug_config
+
+import argparse
+from pathlib import Path
+import time
+
+import torch as th
+
+
+def time_per_step(function, steps):
+    function()
+    if th.cuda.is_available():
+        th.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(steps):
+        function()
+    if th.cuda.is_available():
+        th.cuda.synchronize()
+    return (time.perf_counter() - start) / steps * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Exports a trained agent for inference and checks it against eager')
+    parser.add_argument('model_path', type=Path)
+    parser.add_argument('--eval-mode', dest='eval_mode', action='store_true',
+                        default=False)
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument("overrides", nargs="*", default=[])
+    args = parser.parse_args()
+
+    config = debug_config(args.overrides)
+    start = time.perf_counter()
+    agent = SoftQAgent(config)
+    agent.load_parameters(args.model_path)
+    print(f'Eager agent loaded in {time.perf_counter() - start:.2f} s')
+    if args.eval_mode:
+        agent.eval()
+    export_path = export_agent(agent, args.model_path.with_suffix('.pt'),
+                               eval_mode=args.eval_mode)
+    start = time.perf_counter()
+    exported_agent = ExportedAgent(export_path)
+    print(f'Exported agent loaded in {time.perf_counter() - start:.2f} s')
+
+    debug_env = MineRLDebugEnv(config)
+    obs_wrapper = ObservationWrapper(debug_env, config)
+    gpu_loader = GPULoader(config)
+    state = obs_wrapper.observation(debug_env.reset())
+
+    max_difference = 0
+    for step in range(args.steps):
+        th.manual_seed(step)
+        with th.no_grad():
+            Q, _hidden = agent.get_Q(gpu_loader.acting_state_to_device(state))
+            eager_probabilities = agent.action_probabilities(Q).reshape(-1)
+        th.manual_seed(step)
+        exported_probabilities, _hidden = exported_agent.get_probabilities(state)
+        exported_agent.reset_hidden()
+        max_difference = max(max_difference, th.max(
+            th.abs(eager_probabilities - exported_probabilities)).item())
+        state = obs_wrapper.observation(debug_env.step(0)[0])
+    print(f'Max action probability difference: {max_difference:.2e}')
+
+    eager_ms = time_per_step(
+        lambda: agent.get_action(gpu_loader.acting_state_to_device(state)), args.steps)
+    exported_ms = time_per_step(lambda: exported_agent.get_action(state), args.steps)
+    print(f'Eager acting: {eager_ms:.3f} ms/step')
+    print(f'Exported acting: {exported_ms:.3f} ms/step')
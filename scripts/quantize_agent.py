@@ -0,0 +1,42 @@
+from agents.quantized import calibration_states, quantization_report, quantize_agent
+from agents.soft_q import SoftQAgent
+from core.datasets import TrajectoryStepDataset
+from utility.config import debug_config
+
+import argparse
+from pathlib import Path
+
+import torch as th
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=('Quantizes a trained agent to int8 for cpu inference, calibrating'
+                     ' on expert frames, and compares it to the fp32 agent'))
+    parser.add_argument('model_path', type=Path)
+    parser.add_argument('--calibration-samples', dest='calibration_samples', type=int,
+                        default=512)
+    parser.add_argument('--report-samples', dest='report_samples', type=int,
+                        default=200)
+    parser.add_argument('--debug-dataset', dest='debug_dataset', action='store_true',
+                        default=False)
+    parser.add_argument("overrides", nargs="*", default=[])
+    args = parser.parse_args()
+
+    config = debug_config(args.overrides)
+    agent = SoftQAgent(config)
+    agent.load_parameters(args.model_path)
+    expert_dataset = TrajectoryStepDataset(config, debug_dataset=args.debug_dataset)
+
+    quantized_agent = quantize_agent(
+        agent, calibration_states(expert_dataset, args.calibration_samples))
+    report = quantization_report(
+        agent, quantized_agent,
+        calibration_states(expert_dataset, args.report_samples, seed=1))
+    for name, value in report.items():
+        print(f'{name}: {value:.4f}')
+
+    # the whole module is saved, load with th.load to act with it
+    save_path = args.model_path.with_suffix('.int8.pth')
+    th.save(quantized_agent, save_path)
+    print(f'Saved quantized agent to {save_path}')
@@ -1,5 +1,7 @@
+from agents.exported import ExportedAgent
 from agents.soft_q import SoftQAgent
 from contexts.minerl.environment import ObservationWrapper, ActionShaping
+from core.checkpoint import latest_agent_path
 from core.trajectory_generator import TrajectoryGenerator
 
 import os
@@ -7,7 +9,6 @@ import time
 import gym
 from hydra import compose, initialize
 from omegaconf import DictConfig, OmegaConf
-from pathlib import Path
 
 import torch as th
 
@@ -69,12 +70,17 @@ class MineRLAgent():
         environment = cfg.env.name
         os.environ['MINERL_ENVIRONMENT'] = environment
 
+        # the latest run's exported agent loads without building the eager network
+        saved_agent_path = latest_agent_path(environment)
+        if saved_agent_path is not None and saved_agent_path.suffix == '.pt':
+            print(f'Loading {saved_agent_path.name} as exported agent')
+            self.model = ExportedAgent(saved_agent_path)
+            return
+
         self.model = SoftQAgent(cfg)
-        for saved_agent_path in reversed(sorted(Path('train/').iterdir())):
-            if saved_agent_path.suffix == '.pth' and environment in saved_agent_path.name:
-                print(f'Loading {saved_agent_path.name} as agent')
-                self.model.load_parameters(saved_agent_path)
-                break
+        if saved_agent_path is not None:
+            print(f'Loading {saved_agent_path.name} as agent')
+            self.model.load_parameters(saved_agent_path)
 
     def run_agent_on_episode(self, single_episode_env: Episode):
         """This method runs your agent on a SINGLE episode.
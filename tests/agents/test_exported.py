@@ -0,0 +1,31 @@
+from agents.exported import ExportedAgent, export_agent
+from agents.soft_q import SoftQAgent
+from core.datasets import TrajectoryStepDataset
+from core.gpu import GPULoader
+from utility.config import debug_config
+
+import pytest
+import torch as th
+
+
+class TestExportedAgent:
+    @pytest.mark.parametrize('model', ['base', 'lstm'])
+    def test_matches_eager_agent(self, model, tmp_path):
+        config = debug_config([f'model={model}'])
+        agent = SoftQAgent(config)
+        agent.eval()
+        exported = ExportedAgent(export_agent(agent, tmp_path / 'agent.pt',
+                                              eval_mode=True))
+        gpu_loader = GPULoader(config)
+        states = TrajectoryStepDataset(config, debug_dataset=True).trajectories[0].states
+        for state_idx in range(min(5, len(states))):
+            state = states[state_idx]
+            with th.no_grad():
+                Q, hidden = agent.get_Q(gpu_loader.state_to_device(state))
+                probabilities = agent.action_probabilities(Q).reshape(-1)
+            exported.reset_hidden()
+            exported_probabilities, exported_hidden = exported.get_probabilities(state)
+            assert th.allclose(exported_probabilities.cpu(), probabilities.cpu(),
+                               atol=1e-5)
+            assert th.allclose(exported_hidden.cpu(), hidden.reshape(-1).cpu(),
+                               atol=1e-5)
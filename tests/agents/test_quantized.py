@@ -0,0 +1,36 @@
+from agents.quantized import calibration_states, quantization_report, quantize_agent
+from agents.soft_q import SoftQAgent
+from core.datasets import ReplayBuffer, TrajectoryStepDataset
+from core.environment import start_env
+from core.trajectory_generator import TrajectoryGenerator
+from utility.config import debug_config
+
+import pytest
+
+
+class TestQuantizeAgent:
+    @pytest.mark.parametrize('model', ['base', 'lstm'])
+    def test_acts_and_matches_agent(self, model):
+        config = debug_config([f'model={model}'])
+        agent = SoftQAgent(config)
+        expert_dataset = TrajectoryStepDataset(config, debug_dataset=True)
+        quantized_agent = quantize_agent(agent,
+                                         calibration_states(expert_dataset, samples=16))
+
+        env = start_env(config, debug_env=True)
+        trajectory = TrajectoryGenerator(env, quantized_agent, config,
+                                         ReplayBuffer(config)).generate(
+                                             max_episode_length=5)
+        env.close()
+        assert len(trajectory) > 0
+        assert all(0 <= action < len(agent.actions) for action in trajectory.actions)
+
+        report = quantization_report(
+            agent, quantized_agent, calibration_states(expert_dataset, 8, seed=1))
+        assert 0 <= report['Quantization/mean_total_variation'] \
+            <= report['Quantization/max_total_variation'] <= 1
+        assert report['Quantization/mean_kl_divergence'] >= -1e-6
+        assert 0 <= report['Quantization/greedy_action_agreement'] <= 1
+        assert report['Quantization/fp32_ms_per_step'] > 0
+        assert report['Quantization/int8_ms_per_step'] > 0
+        assert 0 < report['Quantization/int8_mb'] < report['Quantization/fp32_mb']
@@ -0,0 +1,33 @@
+from algorithms.online import OnlineTraining
+from core.state import Transition
+
+import torch as th
+
+
+class TestDeviceMinibatches:
+    def test_splits_each_part_per_update(self, transition_batch):
+        algorithm = OnlineTraining.__new__(OnlineTraining)
+        algorithm.updates_per_step = 4
+        algorithm.batch_to_device = lambda batch: batch
+        batch_size = transition_batch.action.size()[0]
+        expert = transition_batch._replace(
+            action=th.arange(batch_size).unsqueeze(1))
+        replay = transition_batch._replace(
+            action=th.arange(batch_size).unsqueeze(1) + 100)
+        batch = ((expert, th.arange(batch_size)),
+                 (replay, th.arange(batch_size) + 100))
+
+        minibatches = algorithm.device_minibatches(batch)
+
+        assert len(minibatches) == 4
+        for part_idx in range(2):
+            sizes = [minibatch[part_idx][1].size()[0] for minibatch in minibatches]
+            assert sizes == [3, 2, 2, 2]
+            indices = th.cat([minibatch[part_idx][1] for minibatch in minibatches])
+            assert th.equal(indices, batch[part_idx][1])
+        for minibatch in minibatches:
+            for transitions, indices in minibatch:
+                assert type(transitions) == Transition
+                assert transitions.state.spatial.size()[0] == indices.size()[0]
+                assert transitions.next_state.hidden.size()[0] == indices.size()[0]
+                assert th.equal(transitions.action.squeeze(1), indices)
@@ -13,7 +13,7 @@ import torch as th
 @pytest.fixture
 def default_args():
     args = Namespace(virtual_display=False, wandb=False, profile=False,
-                     debug_env=True, overrides=[])
+                     debug_env=True, resume=None, overrides=[])
     return args
 
 
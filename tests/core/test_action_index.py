@@ -0,0 +1,43 @@
+from core.action_index import *
+from core.state import State
+from core.trajectories import Trajectory
+from core.trajectory_store import TrajectoryStore
+
+import numpy as np
+import torch as th
+
+
+def equipping_trajectory(state, actions):
+    """A trajectory equipping the first item after its first step."""
+    trajectory = Trajectory()
+    trajectory.states.append(state)
+    item_count = len(state.nonspatial) // 2
+    for step, action in enumerate(actions):
+        nonspatial = th.zeros_like(state.nonspatial)
+        nonspatial[item_count] = 1
+        trajectory.append_step(action, 0., State(state.spatial, nonspatial, state.hidden),
+                               step == len(actions) - 1)
+    return trajectory
+
+
+class TestClassIndex:
+    def test_groups_members(self):
+        class_index = ClassIndex([2, 0, 2, 1, 2])
+        assert list(class_index.labels) == [0, 1, 2]
+        assert list(class_index.members_of(2)) == [0, 2, 4]
+        assert len(class_index.members_of(3)) == 0
+        samples = class_index.sample(np.full(20, 2), np.random.default_rng(0))
+        assert set(samples.tolist()) <= {0, 2, 4}
+
+
+class TestActionIndex:
+    def test_indexes_store_steps(self, state):
+        trajectories = [equipping_trajectory(state, [3, 11, 11]),
+                        equipping_trajectory(state, [11, 4])]
+        store = TrajectoryStore.from_trajectories(trajectories, {})
+        action_index = ActionIndex.from_store(store, store.step_lookup())
+        assert list(action_index.actions) == [3, 11, 11, 11, 4]
+        assert list(action_index.equipped_items) == [0, 1, 1, 0, 1]
+        class_index = action_index.class_index('action_and_item')
+        assert len(class_index) == 4
+        assert len(class_index.members_of(11 * 2 + 1)) == 2
@@ -0,0 +1,36 @@
+from core.actors import *
+
+import torch as th
+from torch import nn
+import torch.multiprocessing as mp
+
+
+class TestSharedPolicy:
+    def test_sync_after_publish(self):
+        learner = nn.Linear(4, 2)
+        learner.alpha = 0.1
+        actor = nn.Linear(4, 2)
+        actor.alpha = 1
+        shared_policy = SharedPolicy(learner, mp.get_context('spawn'))
+        assert shared_policy.sync(actor) == 0
+        assert th.equal(actor.weight, learner.weight)
+
+        with th.no_grad():
+            learner.weight.add_(1)
+        learner.alpha = 0.2
+        shared_policy.publish(learner)
+        assert shared_policy.current_version() == 1
+        assert shared_policy.sync(actor) == 1
+        assert th.equal(actor.weight, learner.weight)
+        assert actor.alpha == 0.2
+
+    def test_no_reload_without_publish(self):
+        learner = nn.Linear(4, 2)
+        learner.alpha = 0.1
+        actor = nn.Linear(4, 2)
+        shared_policy = SharedPolicy(learner, mp.get_context('spawn'))
+        shared_policy.sync(actor)
+        with th.no_grad():
+            actor.weight.zero_()
+        assert shared_policy.sync(actor) == 0
+        assert th.all(actor.weight == 0)
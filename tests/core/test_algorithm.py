@@ -0,0 +1,51 @@
+from agents.soft_q import SoftQAgent
+from algorithms.loss_functions.iqlearn import IQLearnLoss
+from core.algorithm import Algorithm
+from core.datasets import TrajectoryStepDataset
+from core.gpu import GPULoader
+from utility.config import debug_config
+
+from types import SimpleNamespace
+
+import pytest
+import torch as th
+from torch.utils.data import DataLoader
+
+
+def expert_batch(config, batch_size=4):
+    dataset = TrajectoryStepDataset(config, debug_dataset=True)
+    batch, _idx = next(iter(DataLoader(dataset, batch_size=batch_size)))
+    return GPULoader(config).transitions_to_device(batch)
+
+
+@pytest.mark.skipif(not hasattr(th, 'compile'), reason='needs torch.compile')
+class TestCompileLossFunction:
+    def test_matches_eager_loss(self):
+        config = debug_config(['method=iqlearn_offline', 'model=base'])
+        config.compile_training = True
+        agent = SoftQAgent(config)
+        # without dropout, so both passes compute the same function
+        agent.eval()
+        batch = expert_batch(config)
+        eager = IQLearnLoss(agent, config)
+        compiled = Algorithm.compile_loss_function(SimpleNamespace(config=config),
+                                                   IQLearnLoss(agent, config))
+
+        eager_loss, eager_metrics, _ = eager(expert=batch, expert_aug=batch)
+        eager_loss.backward()
+        eager_gradients = [parameter.grad.clone() for parameter in agent.parameters()
+                           if parameter.grad is not None]
+        agent.zero_grad(set_to_none=True)
+        compiled_loss, compiled_metrics, _ = compiled(expert=batch, expert_aug=batch)
+        compiled_loss.backward()
+        compiled_gradients = [parameter.grad for parameter in agent.parameters()
+                              if parameter.grad is not None]
+
+        assert th.allclose(compiled_loss, eager_loss, atol=1e-5)
+        assert compiled_metrics.keys() == eager_metrics.keys()
+        for key, value in eager_metrics.items():
+            assert compiled_metrics[key] == pytest.approx(value, abs=1e-5)
+        assert len(compiled_gradients) == len(eager_gradients)
+        for compiled_gradient, eager_gradient in zip(compiled_gradients,
+                                                     eager_gradients):
+            assert th.allclose(compiled_gradient, eager_gradient, atol=1e-5)
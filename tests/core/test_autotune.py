@@ -0,0 +1,59 @@
+from core.autotune import *
+from utility.config import debug_config
+
+import pytest
+import torch as th
+
+
+@pytest.fixture
+def autotuner():
+    config = debug_config()
+    config.autotune_batch_sizes = [16, 32, 64, 128, 256]
+    config.autotune_workers = [0, 2]
+    config.autotune_updates = 2
+    config.autotune_memory_budget = 0.3
+    return Autotuner(config, expert_dataset=list(range(10000)))
+
+
+class TestMemoryUsed:
+    def test_not_measured_on_cpu(self):
+        assert memory_used(th.device('cpu')) is None
+
+
+class TestAutotuner:
+    def test_keeps_fastest_batch_size(self, autotuner, monkeypatch):
+        rates = {16: 100, 32: 300, 64: 200, 128: 150, 256: 120}
+        monkeypatch.setattr(autotuner, 'samples_per_second',
+                            lambda batch_size, num_workers: (rates[batch_size], None))
+        assert autotuner.tune_batch_size() == 32
+
+    def test_stops_over_memory_budget(self, autotuner, monkeypatch):
+        tried = []
+
+        def samples_per_second(batch_size, num_workers):
+            tried.append(batch_size)
+            return batch_size, batch_size / 256
+
+        monkeypatch.setattr(autotuner, 'samples_per_second', samples_per_second)
+        assert autotuner.tune_batch_size() == 64
+        assert tried == [16, 32, 64, 128]
+
+    def test_stops_without_enough_data(self, autotuner, monkeypatch):
+        autotuner.expert_dataset = list(range(200))
+        monkeypatch.setattr(autotuner, 'samples_per_second',
+                            lambda batch_size, num_workers: (batch_size, None))
+        assert autotuner.tune_batch_size() == 64
+
+    def test_writes_settings_into_config(self, autotuner, monkeypatch):
+        monkeypatch.setattr(autotuner, 'samples_per_second',
+                            lambda batch_size, num_workers:
+                            (batch_size * (num_workers + 1), None))
+        config = autotuner()
+        assert config.method.batch_size == 256
+        assert config.dataloader_workers == 2
+
+    def test_keeps_config_when_nothing_fits(self, autotuner, monkeypatch):
+        batch_size = autotuner.config.method.batch_size
+        autotuner.expert_dataset = list(range(10))
+        config = autotuner()
+        assert config.method.batch_size == batch_size
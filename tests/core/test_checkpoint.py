@@ -0,0 +1,59 @@
+from core.checkpoint import *
+
+import os
+import time
+
+import torch as th
+
+
+class TestSnapshotState:
+    def test_copies_nested_tensors(self):
+        tensor = th.zeros(3)
+        state = {'model': {'weight': tensor}, 'groups': [{'lr': 0.1}], 'step': 4}
+        snapshot = snapshot_state(state)
+        tensor += 1
+        assert th.equal(snapshot['model']['weight'], th.zeros(3))
+        assert snapshot['groups'] == [{'lr': 0.1}]
+        assert snapshot['step'] == 4
+
+
+class TestCheckpointWriter:
+    def test_writes_snapshot_in_background(self, tmp_path):
+        writer = CheckpointWriter()
+        tensor = th.zeros(3)
+        path = tmp_path / 'train' / 'state' / 'run.state'
+        writer.write({'tensor': tensor, 'step': 1}, path)
+        tensor += 1
+        writer.write({'tensor': tensor, 'step': 2}, path)
+        writer.close()
+        state = th.load(path)
+        assert state['step'] == 2
+        assert th.equal(state['tensor'], th.ones(3))
+        assert list(path.parent.iterdir()) == [path]
+
+
+class TestLatestTrainingState:
+    def test_finds_most_recent_of_env_and_algorithm(self, tmp_path):
+        paths = [tmp_path / f'env_method_{idx}.state' for idx in range(2)]
+        for idx, path in enumerate(paths):
+            th.save({}, path)
+            os.utime(path, (time.time() + idx, time.time() + idx))
+        th.save({}, tmp_path / 'env_other_2.state')
+        assert latest_training_state('env', 'method', tmp_path) == paths[1]
+
+
+class TestLatestAgentPath:
+    def test_prefers_newest_run_over_older_export(self, tmp_path):
+        for name in ['env_method_100.pt', 'env_method_100.pth', 'env_bc_200.pth',
+                     'env_bc_200_training_state.pt', 'other_bc_300.pth']:
+            (tmp_path / name).write_bytes(b'')
+        assert latest_agent_path('env', tmp_path) == tmp_path / 'env_bc_200.pth'
+
+    def test_prefers_export_of_the_run(self, tmp_path):
+        for name in ['env_iqlearn_offline_200.pt', 'env_iqlearn_offline_200.pth']:
+            (tmp_path / name).write_bytes(b'')
+        assert latest_agent_path('env', tmp_path) \
+            == tmp_path / 'env_iqlearn_offline_200.pt'
+
+    def test_none_without_agents(self, tmp_path):
+        assert latest_agent_path('env', tmp_path) is None
@@ -1,7 +1,44 @@
 from core.datasets import *
-from core.state import Transition, Sequence
+from core.state import State, Transition, Sequence
+from core.trajectory_store import TrajectoryStore
 from utility.config import debug_config
 
+from pathlib import Path
+
+import pytest
+from torch.utils.data import Dataset, DataLoader
+
+
+def private_memory():
+    """The bytes of memory this process has written to and does not share."""
+    with open('/proc/self/smaps_rollup') as smaps:
+        return sum(int(line.split()[1]) * 1024 for line in smaps
+                   if line.startswith('Private_Dirty'))
+
+
+class PrivateMemoryDataset(Dataset):
+    """Reads every frame of a sample, and returns the private memory of the worker."""
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        sample, _master_idx = self.dataset[idx]
+        return sample.state.spatial.sum() + sample.next_state.spatial.sum(), \
+            private_memory()
+
+
+class TestDatasetServerMetadata:
+    @pytest.mark.parametrize('model', ['base', 'lstm'])
+    def test_matches_loaded_store(self, model):
+        config = debug_config([f'model={model}'])
+        store = load_trajectory_store(config, debug_dataset=True)
+        metadata = dataset_server_metadata(config)
+        assert metadata['frame_shape'] == store.frame_shape()
+        assert metadata['hidden_size'] == store.initial_hidden.numel()
+
 
 class TestTrajectoryStepDataset:
     def test_dataset_with_no_lstm(self):
@@ -34,3 +71,64 @@ class TestTrajectorySequenceDataset:
             assert sample.states.spatial.size()[0] == lstm_sequence_length + 1
             assert sample.rewards.size()[0] == lstm_sequence_length
             assert sample.actions.size()[0] == lstm_sequence_length
+
+
+class TestReplayBuffer:
+    def test_append_trajectory(self, default_config, state, transition):
+        trajectory = Trajectory()
+        trajectory.states.append(state)
+        for _ in range(6):
+            trajectory.append_step(transition.action.item(), transition.reward.item(),
+                                   transition.next_state, False)
+        replay_buffer = ReplayBuffer(default_config)
+        trajectory_idx = replay_buffer.append_trajectory(trajectory)
+        assert trajectory_idx == 1
+        assert len(replay_buffer) == len(trajectory)
+        assert replay_buffer.step_lookup[-1] == (trajectory_idx, len(trajectory) - 1)
+
+    def test_sequence_lookup_matches_stepping(self, default_config, state, transition):
+        sequence_length = default_config.model.lstm_sequence_length
+        stepped_buffer = SequenceReplayBuffer(default_config)
+        stepped_buffer.current_trajectory().states.append(state)
+        trajectory = Trajectory()
+        trajectory.states.append(state)
+        for _ in range(sequence_length + 4):
+            step = (transition.action.item(), transition.reward.item(),
+                    transition.next_state, False)
+            stepped_buffer.append_step(*step)
+            trajectory.append_step(*step)
+        appended_buffer = SequenceReplayBuffer(default_config)
+        appended_buffer.trajectories = []
+        appended_buffer.append_trajectory(trajectory)
+        assert appended_buffer.sequence_lookup == stepped_buffer.sequence_lookup
+        assert appended_buffer.step_lookup == stepped_buffer.step_lookup
+
+
+@pytest.mark.skipif(not Path('/proc/self/smaps_rollup').exists(),
+                    reason='needs /proc/self/smaps_rollup')
+class TestWorkerMemory:
+    def test_workers_share_dataset(self, default_config):
+        trajectories = []
+        for _ in range(4):
+            trajectory = Trajectory()
+            for step in range(1000):
+                state = State(th.randint(0, 255, (9, 64, 64), dtype=th.uint8),
+                              th.zeros(2), th.zeros(0))
+                if step == 0:
+                    trajectory.states.append(state)
+                else:
+                    trajectory.append_step(step % 3, 0., state, False)
+            trajectories.append(trajectory)
+        store = TrajectoryStore.from_trajectories(trajectories, {}, release=True)
+        dataset_bytes = store.spatial.numel() * store.spatial.element_size()
+        dataset = TrajectoryStepDataset(default_config, store=store)
+
+        dataloader = DataLoader(PrivateMemoryDataset(dataset), batch_size=50,
+                                shuffle=True, num_workers=2, persistent_workers=True)
+        epoch_memory = []
+        for _ in range(3):
+            epoch_memory.append(max(memory.max().item()
+                                    for _frame_sums, memory in dataloader))
+        # the workers neither copy the frames nor grow from epoch to epoch
+        assert max(epoch_memory) < dataset_bytes / 2
+        assert epoch_memory[-1] - epoch_memory[0] < dataset_bytes / 10
@@ -0,0 +1,74 @@
+from core.distributed import *
+
+import torch as th
+from torch import nn
+
+
+class Lookup:
+    def __init__(self, length):
+        self.active_lookup = list(range(length))
+
+    def __len__(self):
+        return len(self.active_lookup)
+
+
+def average_gradients(result_path):
+    dist.init_process_group('gloo')
+    layer = nn.Linear(2, 1)
+    broadcast_parameters(layer)
+    layer.weight.grad = th.full_like(layer.weight, float(get_rank()))
+    layer.bias.grad = th.full_like(layer.bias, float(get_rank()))
+    all_reduce_gradients(layer.parameters())
+    stop = any_rank(get_rank() == 1)
+    if get_rank() == 0:
+        th.save({'weight': layer.weight.grad, 'bias': layer.bias.grad, 'stop': stop},
+                result_path)
+
+
+
+def broadcast_settings(result_path):
+    dist.init_process_group('gloo')
+    settings = broadcast_object((64, 4) if get_rank() == 0 else None)
+    if get_rank() == 1:
+        th.save(settings, result_path)
+
+class TestDistributedTrajectorySampler:
+    def test_ranks_take_equal_disjoint_shares(self):
+        dataset = Lookup(11)
+        shares = [list(DistributedTrajectorySampler(dataset, rank=rank, world_size=3))
+                  for rank in range(3)]
+        assert all(len(share) == 3 for share in shares)
+        indices = [idx for share in shares for idx in share]
+        assert len(set(indices)) == len(indices)
+        assert all(0 <= idx < 11 for idx in indices)
+
+    def test_reshuffles_each_epoch(self):
+        sampler = DistributedTrajectorySampler(Lookup(100), rank=0, world_size=2)
+        first_epoch = list(sampler)
+        assert list(sampler) == first_epoch
+        sampler.set_epoch(1)
+        assert list(sampler) != first_epoch
+
+    def test_follows_active_lookup(self):
+        dataset = Lookup(100)
+        sampler = DistributedTrajectorySampler(dataset, rank=1, world_size=2)
+        assert len(list(sampler)) == 50
+        dataset.active_lookup = dataset.active_lookup[:10]
+        indices = list(sampler)
+        assert len(indices) == 5
+        assert all(idx < 10 for idx in indices)
+
+
+class TestLaunch:
+    def test_gradients_averaged_over_processes(self, tmp_path):
+        result_path = tmp_path / 'result.pth'
+        launch(average_gradients, 2, result_path, master_port=29517)
+        result = th.load(result_path)
+        assert th.allclose(result['weight'], th.full((1, 2), 0.5))
+        assert th.allclose(result['bias'], th.full((1,), 0.5))
+        assert result['stop']
+
+    def test_objects_broadcast_from_rank_0(self, tmp_path):
+        result_path = tmp_path / 'result.pth'
+        launch(broadcast_settings, 2, result_path, master_port=29518)
+        assert th.load(result_path) == (64, 4)
@@ -0,0 +1,30 @@
+from core.environment import *
+
+import time
+
+
+class TestStandbyEnv:
+    def test_reset_swaps_envs(self, default_config):
+        config = default_config
+        config.context.standby_env = True
+        env = start_env(config, debug_env=True)
+        assert isinstance(env, StandbyEnv)
+        first_env = env.env
+        obs = env.reset()
+        assert obs.spatial.size()[0] == 3 * config.model.n_observation_frames
+        assert env.env is not first_env
+        assert env.standby_env is first_env
+        env.close()
+
+    def test_reset_latency_hidden(self, default_config):
+        config = default_config
+        config.context.standby_env = True
+        config.context.debug_reset_latency = 0.5
+        env = start_env(config, debug_env=True)
+        env.reset()
+        # let the retired env finish resetting in the background
+        time.sleep(0.6)
+        start = time.time()
+        env.reset()
+        assert time.time() - start < 0.25
+        env.close()
@@ -0,0 +1,78 @@
+from core.datasets import ReplayBuffer
+from core.frame_compression import *
+from core.trajectories import Trajectory
+from core.trajectory_store import TrajectoryStore
+
+import pytest
+
+
+def uint8_state(state, value):
+    return State(th.full(state.spatial.size(), value, dtype=th.uint8),
+                 state.nonspatial + value, state.hidden)
+
+
+class TestCompressedStates:
+    def test_round_trip(self, state):
+        states = CompressedStates([uint8_state(state, value) for value in range(3)])
+        assert len(states) == 3
+        assert th.equal(states[1].spatial, uint8_state(state, 1).spatial)
+        assert th.equal(states[-1].nonspatial, uint8_state(state, 2).nonspatial)
+        assert [restored.spatial[0, 0, 0].item() for restored in states[1:]] == [1, 2]
+        assert states.nbytes < sum(state_nbytes(uint8_state(state, value))
+                                   for value in range(3))
+
+    def test_setitem_updates_nbytes(self, state):
+        states = CompressedStates([uint8_state(state, 0)])
+        states[0] = State(th.randint(0, 255, state.spatial.size(), dtype=th.uint8),
+                          state.nonspatial, state.hidden)
+        assert states.nbytes == len(states.frames[0]) \
+            + tensor_nbytes(state.nonspatial) + tensor_nbytes(state.hidden)
+
+    def test_set_hidden_keeps_compressed_frames(self, state):
+        states = CompressedStates([uint8_state(state, 0)])
+        frames = states.frames[0]
+        hidden = th.ones(state.hidden.numel() + 2)
+        states.set_hidden(0, hidden)
+        assert states.frames[0] is frames
+        assert th.equal(states[0].hidden, hidden)
+        assert states.nbytes == len(frames) + tensor_nbytes(state.nonspatial) \
+            + tensor_nbytes(hidden)
+
+    def test_rejects_float_frames(self, state):
+        with pytest.raises(ValueError):
+            CompressedStates([State(state.spatial.float(), *state[1:])])
+
+
+class TestCompressedTrajectories:
+    def test_trajectory_reads_compressed_states(self, state):
+        trajectory = Trajectory()
+        trajectory.compress_states()
+        trajectory.states.append(uint8_state(state, 0))
+        trajectory.append_step(1, 0., uint8_state(state, 1), True)
+        assert th.equal(trajectory[0].next_state.spatial, uint8_state(state, 1).spatial)
+        assert trajectory.states_nbytes() == trajectory.states.nbytes
+
+    def test_replay_buffer_keeps_store_views(self, default_config, state):
+        trajectory = Trajectory()
+        trajectory.states.append(uint8_state(state, 0))
+        trajectory.append_step(1, 0., uint8_state(state, 1), True)
+        store = TrajectoryStore.from_trajectories([trajectory], {}, compress_frames=True)
+        config = default_config
+        config.compress_frames = True
+        replay_buffer = ReplayBuffer(config)
+        replay_buffer.append_trajectory(store.trajectories[0])
+        assert replay_buffer.trajectories[-1] is store.trajectories[0]
+
+    def test_store_matches_uncompressed(self, state):
+        trajectory = Trajectory()
+        trajectory.states.append(uint8_state(state, 0))
+        for value in range(1, 5):
+            trajectory.append_step(value, 0., uint8_state(state, value), value == 4)
+        store = TrajectoryStore.from_trajectories([trajectory], {})
+        compressed = TrajectoryStore.from_trajectories([trajectory], {},
+                                                       compress_frames=True)
+        assert compressed.tensor_names == TrajectoryStore.compressed_tensor_names
+        assert compressed.bytes_per_step() < store.bytes_per_step()
+        assert th.equal(compressed.trajectories[0][2].state.spatial,
+                        store.trajectories[0][2].state.spatial)
+        assert th.equal(compressed.states(1, 4).spatial, store.states(1, 4).spatial)
@@ -33,3 +33,20 @@ class TestTransitionsToDevice:
         gpu_loader = GPULoader(default_config)
         output_transitions = gpu_loader.transitions_to_device(sequence)
         assert type(output_transitions) == type(transition)
+
+
+class TestActingStateToDevice:
+    def test_matches_state_to_device(self, default_config, state):
+        gpu_loader = GPULoader(default_config)
+        expected_state = gpu_loader.state_to_device(state)
+        staged_state = gpu_loader.acting_state_to_device(state)
+        assert type(staged_state) == type(state)
+        for expected, staged in zip(expected_state, staged_state):
+            assert expected.size() == staged.size()
+            assert th.allclose(expected, staged, atol=1e-5)
+
+    def test_reuses_buffers(self, default_config, state):
+        gpu_loader = GPULoader(default_config)
+        first_state = gpu_loader.acting_state_to_device(state)
+        second_state = gpu_loader.acting_state_to_device(state)
+        assert first_state.spatial.data_ptr() == second_state.spatial.data_ptr()
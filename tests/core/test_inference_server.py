@@ -0,0 +1,29 @@
+from core.inference_server import *
+from core.state import State
+
+import queue
+
+import numpy as np
+import torch as th
+
+
+class TestInferenceClient:
+    def test_hidden_only_sent_after_reset(self):
+        request_queue, response_queue = queue.Queue(), queue.Queue()
+        client = InferenceClient(3, request_queue, response_queue)
+        state = State(th.zeros(6, 64, 64), th.zeros(4), th.ones(8))
+        for step in range(2):
+            response_queue.put((step, np.full(8, step, dtype=np.float32), 5))
+            action, hidden = client.get_action(state)
+            assert action == step
+            assert th.all(hidden == step)
+        first_request = request_queue.get()
+        assert first_request[0] == 3
+        assert np.all(first_request[3] == 1)
+        assert request_queue.get()[3] is None
+        assert client.policy_version == 5
+
+        client.reset_hidden()
+        response_queue.put((0, np.zeros(8, dtype=np.float32), 5))
+        client.get_action(state)
+        assert request_queue.get()[3] is not None
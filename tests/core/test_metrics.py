@@ -0,0 +1,76 @@
+from core.metrics import *
+
+import json
+
+import pytest
+import torch as th
+
+
+class ListSink(NullSink):
+    def __init__(self):
+        self.writes = []
+
+    def write(self, metrics, step):
+        self.writes.append((step, metrics))
+
+
+class TestWindowAggregator:
+    def test_reduces_scalars(self):
+        aggregator = WindowAggregator()
+        for step, loss in enumerate([2.0, th.tensor(0.5), 3.5]):
+            aggregator.add({'loss': loss, 'histogram': step}, step)
+        reduced = aggregator.reduce()
+        assert reduced['loss'] == pytest.approx(2.0)
+        assert reduced['loss/min'] == 0.5
+        assert reduced['loss/max'] == 3.5
+        assert reduced['loss/last'] == 3.5
+        assert aggregator.step == 2
+
+    def test_rejects_unknown_statistic(self):
+        with pytest.raises(ValueError):
+            WindowAggregator(['median'])
+
+
+class TestMetricsLogger:
+    def test_writes_a_reduction_per_window(self):
+        sink = ListSink()
+        logger = MetricsLogger([sink], window=3, statistics=['mean', 'max'])
+        for step in range(1, 8):
+            logger.record({'loss': float(step)}, step)
+        logger.close()
+        assert sink.writes == [(3, {'loss': 2.0, 'loss/max': 3.0}),
+                               (6, {'loss': 5.0, 'loss/max': 6.0}),
+                               (7, {'loss': 7.0, 'loss/max': 7.0})]
+
+    def test_logged_metrics_follow_the_window_before_them(self):
+        sink = ListSink()
+        logger = MetricsLogger([sink], window=10, statistics=['mean'])
+        logger.record({'loss': 1.0}, 1)
+        logger.record({'loss': 3.0}, 2)
+        logger.log({'Rewards/eval': 5}, 2)
+        logger.flush()
+        assert sink.writes == [(2, {'loss': 2.0}), (2, {'Rewards/eval': 5})]
+        logger.close()
+
+
+class TestJSONLSink:
+    def test_appends_scalars(self, tmp_path):
+        path = tmp_path / 'logs' / 'run.jsonl'
+        logger = MetricsLogger([JSONLSink(path)], window=2, statistics=['mean'])
+        for step in range(4):
+            logger.record({'loss': th.tensor(float(step)), 'video': object()}, step)
+        logger.close()
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [record['step'] for record in records] == [1, 3]
+        assert [record['loss'] for record in records] == [0.5, 2.5]
+        assert all('video' not in record for record in records)
+
+
+class TestCreateMetricsLogger:
+    def test_only_rank_zero_logs(self, default_config):
+        config = default_config
+        config.metrics_sinks = ['jsonl']
+        assert isinstance(create_metrics_logger(config, 'run', rank=0).sinks[0],
+                          JSONLSink)
+        assert isinstance(create_metrics_logger(config, 'run', rank=1).sinks[0],
+                          NullSink)
@@ -0,0 +1,51 @@
+from agents.soft_q import SoftQAgent
+from algorithms.loss_functions.iqlearn import IQLearnLoss
+from core.datasets import TrajectoryStepDataset
+from core.gpu import GPULoader
+from core.mixed_precision import *
+from utility.config import debug_config
+
+import pytest
+import torch as th
+from torch.utils.data import DataLoader
+
+
+class TestMixedPrecision:
+    def test_bf16_training_step(self):
+        config = debug_config(['method=iqlearn_offline', 'model=base'])
+        config.precision = 'bf16'
+        agent = SoftQAgent(config)
+        dataset = TrajectoryStepDataset(config, debug_dataset=True)
+        batch, _idx = next(iter(DataLoader(dataset, batch_size=4)))
+        batch = GPULoader(config).transitions_to_device(batch)
+        loss_function = IQLearnLoss(agent, config)
+        optimizer = th.optim.AdamW(agent.parameters(), lr=3e-4)
+        mixed_precision = MixedPrecision(config, agent.device)
+        parameters = [parameter.detach().clone() for parameter in agent.parameters()]
+
+        with mixed_precision.autocast():
+            loss, _metrics, _final_hidden = loss_function(expert=batch,
+                                                          expert_aug=batch)
+        mixed_precision.step(loss, optimizer)
+
+        assert th.isfinite(loss)
+        assert any(not th.equal(before, after.detach())
+                   for before, after in zip(parameters, agent.parameters()))
+
+    @pytest.mark.parametrize('precision', [
+        'bf16',
+        pytest.param('fp16', marks=pytest.mark.skipif(
+            not th.cuda.is_available(), reason='fp16 scaling needs cuda'))])
+    def test_state_dict_round_trip(self, default_config, precision):
+        config = default_config
+        config.precision = precision
+        device = th.device('cuda:0' if th.cuda.is_available() else 'cpu')
+        mixed_precision = MixedPrecision(config, device)
+        if mixed_precision.scaler.is_enabled():
+            # the scale is created by the first scaled loss
+            mixed_precision.scaler.scale(th.ones(1, device=device))
+            mixed_precision.scaler.update(new_scale=1024.0)
+        restored = MixedPrecision(config, device)
+        restored.load_state_dict(mixed_precision.state_dict())
+        assert restored.precision == mixed_precision.precision
+        assert restored.scaler.state_dict() == mixed_precision.scaler.state_dict()
@@ -0,0 +1,71 @@
+from core.datasets import ReplayBuffer
+from core.replay_snapshot import *
+
+import torch as th
+
+
+def add_steps(replay_buffer, state, steps, done=False):
+    for step in range(steps):
+        next_state = State(state.spatial + len(replay_buffer) + 1, state.nonspatial,
+                           state.hidden)
+        replay_buffer.append_step(step % 3, float(step), next_state,
+                                  done and step == steps - 1,
+                                  suppressed_termination=False)
+
+
+def assert_same_trajectories(replay_buffer, reopened):
+    assert reopened.step_lookup == replay_buffer.step_lookup
+    for trajectory, mapped in zip(replay_buffer.trajectories, reopened.trajectories):
+        assert len(mapped) == len(trajectory)
+        assert mapped.done == trajectory.done
+        assert mapped.actions == trajectory.actions
+        for state, mapped_state in zip(trajectory.states, mapped.states):
+            assert th.equal(state.spatial, mapped_state.spatial)
+            assert th.equal(state.hidden, mapped_state.hidden)
+
+
+class TestReplaySnapshot:
+    def test_appends_new_steps_and_reopens(self, default_config, state, tmp_path):
+        replay_buffer = ReplayBuffer(default_config)
+        replay_buffer.current_trajectory().states.append(state)
+        add_steps(replay_buffer, state, 3, done=True)
+        snapshot = ReplaySnapshot(tmp_path)
+        snapshot.write(replay_buffer)
+        spatial_bytes = snapshot.field_path('spatial').stat().st_size
+        replay_buffer.new_trajectory()
+        replay_buffer.current_trajectory().states.append(state)
+        add_steps(replay_buffer, state, 2)
+        snapshot.write(replay_buffer)
+        # only the 3 states added since the first write are appended
+        assert snapshot.field_path('spatial').stat().st_size == spatial_bytes * 7 // 4
+
+        reopened = ReplaySnapshot(tmp_path).open(default_config)
+        assert len(reopened.trajectories) == 3
+        assert len(reopened.current_trajectory()) == 0
+        assert_same_trajectories(replay_buffer, reopened)
+
+    def test_ignores_interrupted_writes(self, default_config, state, tmp_path):
+        replay_buffer = ReplayBuffer(default_config)
+        replay_buffer.current_trajectory().states.append(state)
+        add_steps(replay_buffer, state, 3)
+        ReplaySnapshot(tmp_path).write(replay_buffer)
+        with open(tmp_path / 'actions.bin', 'ab') as actions_file:
+            actions_file.write(b'partial')
+
+        snapshot = ReplaySnapshot(tmp_path)
+        add_steps(replay_buffer, state, 2)
+        snapshot.write(replay_buffer)
+        reopened = ReplaySnapshot(tmp_path).open(default_config)
+        assert_same_trajectories(replay_buffer, reopened)
+
+    def test_mapped_states_are_copy_on_write(self, default_config, state, tmp_path):
+        replay_buffer = ReplayBuffer(default_config)
+        replay_buffer.current_trajectory().states.append(state)
+        add_steps(replay_buffer, state, 2)
+        ReplaySnapshot(tmp_path).write(replay_buffer)
+        reopened = ReplaySnapshot(tmp_path).open(default_config)
+        new_hidden = th.ones_like(state.hidden)
+        reopened.trajectories[0].update_hidden(0, new_hidden)
+        assert th.equal(reopened.trajectories[0].states[1].hidden, new_hidden)
+        reopened_again = ReplaySnapshot(tmp_path).open(default_config)
+        assert th.equal(reopened_again.trajectories[0].states[1].hidden, state.hidden)
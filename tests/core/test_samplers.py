@@ -0,0 +1,57 @@
+from core.action_index import ClassIndex
+from core.samplers import *
+
+import numpy as np
+
+
+class TestSumTree:
+    def test_sums_weights(self):
+        tree = SumTree(5)
+        tree.update(np.arange(5), [1, 2, 3, 4, 5])
+        assert tree.total() == 15
+        tree.update([1, 4], [0, 1])
+        assert tree.total() == 9
+        assert np.array_equal(tree.weights(), [1, 0, 3, 4, 1])
+
+    def test_samples_in_proportion_to_weights(self):
+        tree = SumTree(6)
+        tree.update(np.arange(6), [1, 0, 2, 0, 0, 1])
+        counts = np.bincount(tree.sample(40000, np.random.default_rng(0)),
+                             minlength=6)
+        assert np.all(counts[[1, 3, 4]] == 0)
+        assert np.allclose(counts[[0, 2, 5]] / 40000, [0.25, 0.5, 0.25], atol=0.02)
+
+
+class TestWeightedSampler:
+    def test_draws_one_pass_over_weighted_items(self):
+        sampler = WeightedSampler(np.ones(10), chunk_size=3, seed=0)
+        sampler.set_weights(np.array([0, 0, 1, 1, 1, 0, 0, 0, 0, 5]))
+        indices = list(sampler)
+        assert len(sampler) == 4
+        assert len(indices) == 4
+        assert set(indices) <= {2, 3, 4, 9}
+
+    def test_updates_apply_mid_iteration(self):
+        sampler = WeightedSampler(np.ones(4), chunk_size=2, seed=0)
+        iterator = iter(sampler)
+        next(iterator), next(iterator)
+        sampler.update_weights([0, 1, 2], [0, 0, 0])
+        assert list(iterator) == [3, 3]
+
+
+class TestStratifiedSampler:
+    def test_balances_classes_in_every_batch(self):
+        classes = np.array([0] * 90 + [1] * 8 + [2] * 2)
+        sampler = StratifiedSampler(ClassIndex(classes), batch_size=6,
+                                    class_balance=1.0, seed=0)
+        indices = np.array(list(sampler))
+        assert len(indices) == 100
+        for batch in indices[:96].reshape(-1, 6):
+            assert np.array_equal(np.bincount(classes[batch], minlength=3), [2, 2, 2])
+
+    def test_samples_classes_as_they_occur_without_balance(self):
+        class_index = ClassIndex(np.array([0] * 75 + [1] * 25))
+        sampler = StratifiedSampler(class_index, batch_size=4, class_balance=0.0,
+                                    seed=0)
+        for batch in np.array(list(sampler)).reshape(-1, 4):
+            assert np.count_nonzero(batch >= 75) == 1
@@ -36,3 +36,27 @@ class TestSequenceToTransitions:
         assert transitions.done.size()[0] == sequence.dones.size()[0]
         for component1, component2 in zip(transition, transitions):
             assert type(component1) == type(component2)
+
+
+class TestUpdateHidden:
+    def test_returns_updated_state(self, state):
+        new_hidden = th.ones(state.hidden.size())
+        updated_state = update_hidden(state, new_hidden)
+        assert type(updated_state) == State
+        assert th.equal(updated_state.hidden, new_hidden)
+        assert th.equal(updated_state.spatial, state.spatial)
+
+
+class TestSplitTransitions:
+    def test_splits_into_sections(self, transition_batch):
+        batch_size = transition_batch.action.size()[0]
+        sections = [batch_size // 2, batch_size - batch_size // 2]
+        parts = split_transitions(transition_batch, sections)
+        assert len(parts) == 2
+        for part, section in zip(parts, sections):
+            assert type(part) == Transition
+            assert type(part.state) == State
+            assert part.action.size()[0] == section
+            assert part.next_state.spatial.size()[0] == section
+        assert th.equal(cat_transitions(parts).state.spatial,
+                        transition_batch.state.spatial)
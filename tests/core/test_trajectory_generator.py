@@ -0,0 +1,19 @@
+from core.trajectory_generator import *
+from utility.config import debug_config
+
+
+class TestWarmupCachePath:
+    def test_keyed_by_observation_and_context_config(self):
+        config = debug_config()
+        path = TrajectoryGenerator(None, None, config).warmup_cache_path(100)
+        assert TrajectoryGenerator(None, None, debug_config()).warmup_cache_path(100) \
+            == path
+        assert TrajectoryGenerator(None, None, config).warmup_cache_path(200) != path
+
+        config.context.standby_env = not config.context.standby_env
+        assert TrajectoryGenerator(None, None, config).warmup_cache_path(100) != path
+
+        other_frames = debug_config()
+        other_frames.model.n_observation_frames += 1
+        assert TrajectoryGenerator(None, None, other_frames).warmup_cache_path(100) \
+            != path
@@ -0,0 +1,67 @@
+from core.trajectories import Trajectory
+from core.trajectory_store import *
+
+import pytest
+
+
+def make_trajectory(state, steps, done):
+    trajectory = Trajectory()
+    trajectory.states.append(state)
+    for step in range(steps):
+        next_state = State(state.spatial + step + 1, state.nonspatial + step + 1,
+                           state.hidden)
+        trajectory.append_step(step % 3, float(step), next_state,
+                               done and step == steps - 1)
+    return trajectory
+
+
+@pytest.fixture
+def trajectories(state):
+    return [make_trajectory(state, 4, done=False), make_trajectory(state, 0, False),
+            make_trajectory(state, 5, done=True)]
+
+
+class TestFromTrajectories:
+    def test_views_match_trajectories(self, trajectories):
+        store = TrajectoryStore.from_trajectories(trajectories, {})
+        originals = [trajectories[0], trajectories[2]]
+        assert len(store.trajectories) == 2
+        assert store.step_lookup().tolist() == [[trajectory_idx, step_idx]
+                                                for trajectory_idx, trajectory
+                                                in enumerate(originals)
+                                                for step_idx in range(len(trajectory))]
+        for view, trajectory in zip(store.trajectories, originals):
+            assert len(view) == len(trajectory)
+            assert view.done == trajectory.done
+            assert len(view.states) == len(trajectory.states)
+            for step_idx in range(len(trajectory)):
+                stored, original = view[step_idx], trajectory[step_idx]
+                assert th.equal(stored.state.spatial, original.state.spatial)
+                assert th.equal(stored.next_state.nonspatial,
+                                original.next_state.nonspatial)
+                assert stored.action.item() == original.action
+                assert stored.reward.item() == original.reward
+                assert stored.done == original.done
+
+    def test_sequences_match_trajectories(self, trajectories):
+        store = TrajectoryStore.from_trajectories(trajectories, {})
+        stored = store.trajectories[1].get_sequence(4, 3)
+        original = trajectories[2].get_sequence(4, 3)
+        for stored_component, original_component in zip(stored.states,
+                                                        original.states):
+            assert th.equal(stored_component, original_component)
+        assert th.equal(stored.actions, original.actions)
+        assert th.equal(stored.dones, original.dones)
+        with pytest.raises(IndexError):
+            store.trajectories[1].get_sequence(5, 3)
+
+
+class TestUpdateHidden:
+    def test_updates_only_given_state(self, trajectories):
+        store = TrajectoryStore.from_trajectories(trajectories, {})
+        assert store.hidden is None
+        new_hidden = th.ones_like(store.initial_hidden)
+        store.trajectories[0].update_hidden(1, new_hidden)
+        assert th.equal(store.trajectories[0].states[2].hidden, new_hidden)
+        assert th.equal(store.trajectories[0].states[1].hidden, store.initial_hidden)
+        assert th.equal(store.trajectories[1].states[2].hidden, store.initial_hidden)
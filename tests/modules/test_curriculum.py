@@ -0,0 +1,74 @@
+from core.samplers import WeightedSampler
+from modules.curriculum import *
+
+from types import SimpleNamespace
+
+import numpy as np
+
+
+def lookup_dataset(trajectory_lengths):
+    master_lookup = np.array([(trajectory_idx, step_idx)
+                              for trajectory_idx, length in enumerate(trajectory_lengths)
+                              for step_idx in range(length)])
+    lengths = np.array(trajectory_lengths)
+    return SimpleNamespace(master_lookup=master_lookup,
+                           master_fractions=master_lookup[:, 1]
+                           / lengths[master_lookup[:, 0]],
+                           active_lookup=master_lookup, cross_lookup=None,
+                           sampler=None)
+
+
+class TestUpdateExpertDataset:
+    def test_selects_curriculum_steps(self, default_config):
+        config = default_config
+        config.dataset.initial_curriculum_size = 2
+        config.dataset.extracurricular_sparsity = 1000
+        config.dataset.emphasize_new_samples = False
+        dataset = lookup_dataset([10, 20])
+        scheduler = CurriculumScheduler(config)
+        scheduler.update_expert_dataset(dataset, 0.5)
+        expected = [(trajectory_idx, step_idx)
+                    for trajectory_idx, step_idx in dataset.master_lookup
+                    if step_idx <= 0.5 * [10, 20][trajectory_idx] or step_idx < 2]
+        # at most one extracurricular step per trajectory with this sparsity
+        assert len(dataset.active_lookup) - len(expected) <= 2
+        assert set(expected) <= set(map(tuple, dataset.active_lookup.tolist()))
+        assert scheduler.current_curriculum_length == len(dataset.active_lookup)
+        assert np.array_equal(dataset.master_lookup[dataset.cross_lookup],
+                              dataset.active_lookup)
+
+    def test_repeats_emphasized_steps(self, default_config):
+        config = default_config
+        config.dataset.initial_curriculum_size = 0
+        config.dataset.extracurricular_sparsity = 1000
+        config.dataset.emphasize_new_samples = True
+        config.dataset.emphasized_fraction = 0.2
+        config.dataset.emphasis_relative_sample_frequency = 3
+        dataset = lookup_dataset([100])
+        scheduler = CurriculumScheduler(config)
+        scheduler.update_expert_dataset(dataset, 0.5)
+        counts = np.bincount(dataset.cross_lookup, minlength=100)
+        assert np.all(counts[32:51] == 3)
+        assert np.all(counts[1:30] == 1)
+        assert np.all(counts[51:99] <= 1)
+
+
+class TestUpdateSamplerWeights:
+    def test_weights_curriculum_steps(self, default_config):
+        config = default_config
+        config.dataset.initial_curriculum_size = 0
+        config.dataset.extracurricular_sparsity = 1000
+        config.dataset.emphasize_new_samples = True
+        config.dataset.emphasized_fraction = 0.2
+        config.dataset.emphasis_relative_sample_frequency = 3
+        dataset = lookup_dataset([100])
+        dataset.sampler = WeightedSampler(np.ones(100))
+        scheduler = CurriculumScheduler(config)
+        scheduler.update_expert_dataset(dataset, 0.5)
+        weights = dataset.sampler.weights()
+        assert dataset.cross_lookup is None
+        assert np.all(weights[32:51] == 3)
+        assert np.all(weights[1:30] == 1)
+        assert np.all(weights[51:99] <= 1)
+        assert scheduler.current_curriculum_length == np.count_nonzero(weights)
+        assert len(dataset.sampler) == scheduler.current_curriculum_length
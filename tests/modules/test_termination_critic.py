@@ -0,0 +1,20 @@
+from core.datasets import TrajectoryStepDataset
+from core.environment import create_context
+from core.state import Transition
+from modules.termination_critic import TerminateEpisodeDataset
+from utility.config import debug_config
+
+
+class TestTerminateEpisodeDataset:
+    def test_samples_labelled_transitions(self):
+        config = debug_config(['model=base'])
+        expert_dataset = TrajectoryStepDataset(config, debug_dataset=True)
+        dataset = TerminateEpisodeDataset(expert_dataset, create_context(config))
+        assert dataset.sampler is None
+        assert len(dataset) > 0
+        sampler = dataset.stratified_sampler(batch_size=4)
+        for idx in list(sampler)[:8]:
+            transition, threw_snowball = dataset[idx]
+            assert type(transition) == Transition
+            master_idx = dataset.included_steps[idx]
+            assert threw_snowball == float(dataset.threw_snowball[master_idx])
@@ -0,0 +1,62 @@
+from networks.base_network import *
+from utility.config import debug_config
+
+import copy
+
+import pytest
+import torch as th
+
+
+def assert_same_gradients(module, other):
+    for (name, parameter), other_parameter in zip(module.named_parameters(),
+                                                  other.parameters()):
+        if parameter.grad is None:
+            assert other_parameter.grad is None, name
+        else:
+            assert th.allclose(parameter.grad, other_parameter.grad, atol=1e-6), name
+
+
+@pytest.fixture
+def config():
+    return debug_config()
+
+
+class TestVisualFeatureExtractor:
+    def test_checkpointing_matches_plain_training(self, config):
+        plain = VisualFeatureExtractor(config)
+        checkpointed = copy.deepcopy(plain)
+        checkpointed.checkpoint_segments = 3
+        spatial = th.rand(4, 3 * config.model.n_observation_frames, 64, 64)
+
+        plain_features = plain(spatial)
+        plain_features.sum().backward()
+        checkpointed_features = checkpointed(spatial)
+        checkpointed_features.sum().backward()
+
+        assert th.allclose(plain_features, checkpointed_features, atol=1e-6)
+        assert_same_gradients(plain, checkpointed)
+        # recomputed segments leave the batch norm statistics as the forward set them
+        for name, buffer in plain.named_buffers():
+            assert th.allclose(buffer, dict(checkpointed.named_buffers())[name]), name
+
+
+class TestLSTMLayer:
+    def test_checkpointing_matches_plain_unroll(self, config):
+        plain = LSTMLayer(8, config)
+        checkpointed = copy.deepcopy(plain)
+        checkpointed.checkpoint_steps = 2
+        features = th.rand(3, 5, 8)
+        hidden = th.rand(1, 3, 2 * plain.hidden_size)
+
+        plain_inputs = features.clone().requires_grad_()
+        plain_features, plain_hidden = plain(plain_inputs, hidden)
+        plain_features.sum().backward()
+        checkpointed_inputs = features.clone().requires_grad_()
+        checkpointed_features, checkpointed_hidden = checkpointed(checkpointed_inputs,
+                                                                  hidden)
+        checkpointed_features.sum().backward()
+
+        assert th.allclose(plain_features, checkpointed_features, atol=1e-6)
+        assert th.allclose(plain_hidden, checkpointed_hidden, atol=1e-6)
+        assert th.allclose(plain_inputs.grad, checkpointed_inputs.grad, atol=1e-6)
+        assert_same_gradients(plain, checkpointed)
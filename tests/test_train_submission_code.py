@@ -1,13 +1,73 @@
+from agents.soft_q import SoftQAgent
+from core.algorithm import Algorithm
+from core.checkpoint import latest_agent_path, latest_training_state
 from train_submission_code import *
 from utility.config import debug_config
 
 import copy
+import importlib.util
+import os
+from pathlib import Path
+
+import pytest
+import torch as th
+
+
+def assert_same_state(restored, saved):
+    if isinstance(saved, th.Tensor):
+        assert th.equal(restored.cpu(), saved.cpu())
+    elif isinstance(saved, dict):
+        assert restored.keys() == saved.keys()
+        for key in saved.keys():
+            assert_same_state(restored[key], saved[key])
+    elif isinstance(saved, (list, tuple)):
+        assert len(restored) == len(saved)
+        for restored_value, saved_value in zip(restored, saved):
+            assert_same_state(restored_value, saved_value)
+    else:
+        assert restored == saved
 
 
 class TestIntegration:
     def test_default_config(self, default_args, default_config):
         main(default_args, default_config)
 
+    def test_resume(self, default_args, default_config, tmp_path, monkeypatch):
+        # training states and agents are written to a train/ of the test's own
+        monkeypatch.setenv('MINERL_DATA_ROOT',
+                           str(Path(os.environ['MINERL_DATA_ROOT']).resolve()))
+        monkeypatch.chdir(tmp_path)
+        Path('train').mkdir()
+        config = copy.deepcopy(default_config)
+        config.checkpoint_frequency = 2
+        config.save_training_state = True
+        main(default_args, config)
+        saved = th.load(latest_training_state(config.env.name, config.method.name))
+        assert saved['step'] == config.method.training_steps
+        assert all(name in saved for name in ['agent', 'optimizer', 'scheduler',
+                                              'alpha_tuner', 'mixed_precision'])
+        assert len(saved['alpha_tuner']) > 0
+        # the state is kept where the submission does not take it for an agent
+        agent_path = Path('train') / f'{saved["name"]}.pth'
+        assert latest_agent_path(config.env.name) == agent_path
+
+        resumed = []
+        load_training_state = Algorithm.load_training_state
+
+        def record_resumed(algorithm, path):
+            load_training_state(algorithm, path)
+            resumed.append(dict(algorithm.training_state(algorithm.start_step),
+                                start_step=algorithm.start_step))
+
+        monkeypatch.setattr(Algorithm, 'load_training_state', record_resumed)
+        args = copy.deepcopy(default_args)
+        args.resume = 'latest'
+        main(args, copy.deepcopy(default_config))
+        restored, = resumed
+        assert restored.pop('start_step') == saved['step']
+        assert restored['iter_count'] == saved['iter_count']
+        assert_same_state(restored, saved)
+
     class TestMethods:
         def test_sac(self, default_args):
             args = default_args
@@ -34,6 +94,37 @@ class TestIntegration:
             config.model.lstm_sequence_length = 3
             main(args, config)
 
+        @pytest.mark.skipif(importlib.util.find_spec('torch.func') is None,
+                            reason='ensembles need torch.func')
+        def test_iqlearn_offline_ensemble(self, default_args):
+            args = default_args
+            config = debug_config(['method=iqlearn_offline', 'model=base'])
+            config.method.max_training_steps = 3
+            config.method.batch_size = 4
+            config.ensemble_size = 2
+            config.ensemble_alphas = [1e-1, 1e-2]
+            config.ensemble_learning_rates = [3e-4, 1e-4]
+            main(args, config)
+
+        def test_distillation(self, default_args, tmp_path, monkeypatch):
+            monkeypatch.setenv('MINERL_DATA_ROOT',
+                               str(Path(os.environ['MINERL_DATA_ROOT']).resolve()))
+            monkeypatch.chdir(tmp_path)
+            config = debug_config(['method=distillation'])
+            teacher_path = tmp_path / 'teacher.pth'
+            SoftQAgent(config).save(teacher_path)
+            config.method.teacher_path = str(teacher_path)
+            config.method.epochs = 1
+            config.method.max_training_steps = 3
+            config.method.batch_size = 4
+            config.method.teacher_batch_size = 16
+            config.model.lstm_sequence_length = 3
+            config.checkpoint_frequency = 2
+            main(default_args, config)
+            # the student is saved apart, never loaded as an agent of the config
+            assert len(list(Path('train/student').glob('*.pth'))) == 1
+            assert latest_agent_path(config.env.name) is None
+
     class TestModels:
         def test_no_lstm(self, default_args):
             args = default_args
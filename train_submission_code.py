@@ -1,14 +1,20 @@
 from agents.bc import BCAgent
+from agents.exported import export_agent
 from agents.soft_q import SoftQAgent
 import aicrowd_helper
+from algorithms.distillation import Distillation
 from algorithms.offline import SupervisedLearning
 from algorithms.online_imitation import OnlineImitation
 from algorithms.sac_iqlearn import IQLearnSAC
 from algorithms.sac_curiosity import CuriositySAC
 from algorithms.curious_iq import CuriousIQ
+from core import distributed
+from core.autotune import Autotuner
+from core.checkpoint import latest_training_state
 from core.datasets import ReplayBuffer, SequenceReplayBuffer
 from core.datasets import TrajectoryStepDataset, TrajectorySequenceDataset
 from core.environment import start_env
+from core.replay_snapshot import ReplaySnapshot
 from core.trajectory_generator import TrajectoryGenerator
 from modules.termination_critic import TerminationCritic
 from utility.config import get_config, parse_args
@@ -71,6 +77,21 @@ def main(args=None, config=None):
     if not config:
         config = get_config(args)
 
+    if config.distributed_processes > 1 and not distributed.is_distributed() \
+            and 'WORLD_SIZE' not in os.environ:
+        if config.method.algorithm != 'supervised_learning':
+            raise ValueError('Distributed training is only supported'
+                             ' for supervised learning')
+        print(f'Launching {config.distributed_processes} training processes')
+        distributed.launch(main, config.distributed_processes, args, config,
+                           master_port=config.distributed_master_port)
+        return
+    distributed.initialize(config)
+    # with distributed training, only rank 0 logs to wandb and saves the agent
+    rank = distributed.get_rank()
+    config.wandb = config.wandb and rank == 0
+    args.wandb = args.wandb and rank == 0
+
     environment = config.env.name
 
     if config.wandb:
@@ -88,7 +109,7 @@ def main(args=None, config=None):
         display.start()
 
     # Start env
-    if config.method.algorithm != 'supervised_learning':
+    if config.method.algorithm not in ['supervised_learning', 'distillation']:
         if args.debug_env:
             print('Starting Debug Env')
         else:
@@ -100,10 +121,15 @@ def main(args=None, config=None):
     replay_buffer = ReplayBuffer(config) if config.model.lstm_layers == 0 \
         else SequenceReplayBuffer(config)
     iter_count = 0
-    if config.method.online and config.method.starting_steps > 0:
+    if config.method.online and config.replay_snapshot_path \
+            and ReplaySnapshot(config.replay_snapshot_path).exists():
+        # the snapshot already holds the warmup, so it is mapped rather than repeated
+        replay_buffer = config.replay_snapshot_path
+        iter_count += config.method.starting_steps
+    elif config.method.online and config.method.starting_steps > 0:
         replay_buffer = TrajectoryGenerator(
             env, None, config, replay_buffer, training=True
-        ).random_trajectories(config.method.starting_steps)
+        ).warmup(config.method.starting_steps)
         iter_count += config.method.starting_steps
 
     # initialize dataset, agent, algorithm
@@ -114,8 +140,10 @@ def main(args=None, config=None):
         else:
             expert_dataset = TrajectorySequenceDataset(config,
                                                        debug_dataset=args.debug_env)
+        if config.autotune:
+            config = Autotuner(config, expert_dataset)()
 
-    if config.method.loss_function == 'iqlearn':
+    if config.method.loss_function in ['iqlearn', 'distillation']:
         agent = SoftQAgent(config)
     elif config.method.loss_function == 'bc':
         agent = BCAgent(config)
@@ -134,6 +162,16 @@ def main(args=None, config=None):
                                              initial_iter_count=iter_count)
     elif config.method.algorithm == 'supervised_learning':
         training_algorithm = SupervisedLearning(expert_dataset, agent, config)
+    elif config.method.algorithm == 'distillation':
+        # the agent is the teacher, the student is returned by training
+        agent.load_parameters(config.method.teacher_path)
+        training_algorithm = Distillation(expert_dataset, agent, config,
+                                          replay_buffers=[replay_buffer])
+
+    if args.resume:
+        training_state_path = latest_training_state(environment, config.method.name) \
+            if args.resume == 'latest' else args.resume
+        training_algorithm.load_training_state(training_state_path)
 
     # run algorithm
     if not args.profile:
@@ -153,10 +191,25 @@ def main(args=None, config=None):
                     profile_art.add_file(profile_file_path)
                 profile_art.save()
 
+    # let the last training state and metrics finish writing
+    training_algorithm.checkpoint_writer.close()
+    training_algorithm.metrics.close()
+
     # save model
-    if not args.debug_env:
-        agent_save_path = os.path.join('train', f'{training_algorithm.name}.pth')
+    if not args.debug_env and rank == 0:
+        agent_save_path = training_algorithm.model_save_path(agent)
+        agent_save_path.parent.mkdir(parents=True, exist_ok=True)
         agent.save(agent_save_path)
+        # a student is only loadable by the submission as an export, which keeps
+        # its own layer sizes
+        student = getattr(training_algorithm, 'student', None)
+        if isinstance(agent, SoftQAgent) and (config.export_agent or agent is student):
+            export_agent(agent, Path('train') / f'{training_algorithm.name}.pt')
+        ensemble = getattr(training_algorithm, 'ensemble', None)
+        if ensemble is not None:
+            ensemble_save_path = training_algorithm.model_save_path(ensemble)
+            ensemble_save_path.parent.mkdir(parents=True, exist_ok=True)
+            ensemble.save(ensemble_save_path)
         if args.wandb:
             model_art = wandb.Artifact("agent", type="model")
             model_art.add_file(agent_save_path)
@@ -18,6 +18,9 @@ def parse_args():
                         action='store_false', default=True)
     parser.add_argument('--virtual-display-false', dest='virtual_display',
                         action='store_false', default=True)
+    parser.add_argument('--resume', nargs='?', const='latest', default=None,
+                        help=('resume from a training state file, or without a path from'
+                              ' the latest one of the env and method in train/state/'))
     parser.add_argument("overrides", nargs="*", default=[])
     args = parser.parse_args()
     return args